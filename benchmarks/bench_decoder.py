@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Measure NDJSON decoding throughput in lines/second.
+
+Replays the recorded CLI sessions in benchmarks/sessions through the
+StreamDecoder and through the per-line json.loads loop the runner used
+before it, and prints lines/second for each.
+
+    python3 benchmarks/bench_decoder.py [--repeat N] [SESSION.ndjson ...]
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from speedtest_gui.decoder import JSON_BACKEND, StreamDecoder
+
+SESSIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
+
+
+def legacy_decode(data):
+    """The original text-mode loop from SpeedtestRunner._run_test"""
+    server_name = "Unknown"
+    server_location = "Unknown"
+    events = 0
+    for line in io.StringIO(data.decode()):
+        line = line.strip()
+        try:
+            data = json.loads(line)
+            if "type" in data:
+                if data["type"] == "testStart" and "server" in data:
+                    server_name = data["server"].get("name", "Unknown")
+                    server_location = data["server"].get("location", "Unknown")
+                    status_message = f"Testing with {server_name} ({server_location})"
+                    events += 1
+                if data["type"] == "download":
+                    bandwidth_mbps = data["download"]["bandwidth"] * 8 / 1_000_000
+                    progress = data["download"].get("progress", 0)
+                    status_message = f"Running download test"
+                    if server_name != "Unknown" and server_location != "Unknown":
+                        status_message += f" - {server_name} ({server_location})"
+                    events += 1
+                elif data["type"] == "upload":
+                    bandwidth_mbps = data["upload"]["bandwidth"] * 8 / 1_000_000
+                    progress = data["upload"].get("progress", 0)
+                    status_message = f"Running upload test"
+                    if server_name != "Unknown" and server_location != "Unknown":
+                        status_message += f" - {server_name} ({server_location})"
+                    events += 1
+                elif data["type"] == "ping":
+                    progress = data["ping"].get("progress", 0)
+                    latency = data["ping"].get("latency", 0)
+                    status_message = f"Testing ping: {latency:.2f} ms"
+                    if server_name != "Unknown" and server_location != "Unknown":
+                        status_message += f" - {server_name} ({server_location})"
+                    events += 1
+                elif data["type"] == "result":
+                    events += 1
+        except json.JSONDecodeError:
+            pass
+    return events
+
+
+def stream_decode(data):
+    events = 0
+    for event in StreamDecoder(io.BytesIO(data)):
+        if event.type in ("download", "upload"):
+            event.mbps
+        events += 1
+    return events
+
+
+def measure(decode, data, lines, rounds):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        decode(data)
+        best = min(best, time.perf_counter() - start)
+    return lines / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sessions", nargs="*",
+                        help="Recorded NDJSON sessions (default: benchmarks/sessions/*.ndjson)")
+    parser.add_argument("--repeat", type=int, default=200,
+                        help="How many times each session is concatenated")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="Timed rounds per decoder; the best one is reported")
+    args = parser.parse_args()
+
+    paths = args.sessions or sorted(glob.glob(os.path.join(SESSIONS_DIR, "*.ndjson")))
+    print(f"JSON backend: {JSON_BACKEND}")
+    print(f"{'session':<16}{'lines':>10}{'legacy lines/s':>18}{'stream lines/s':>18}{'speedup':>10}")
+
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read() * args.repeat
+        lines = data.count(b"\n")
+
+        legacy = measure(legacy_decode, data, lines, args.rounds)
+        stream = measure(stream_decode, data, lines, args.rounds)
+        name = os.path.splitext(os.path.basename(path))[0]
+        print(f"{name:<16}{lines:>10}{legacy:>18,.0f}{stream:>18,.0f}{stream / legacy:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Measure the time from starting a test to the first download sample.
+
+Runs real tests with the Speedtest CLI, alternating between letting the CLI
+find a server itself and starting with the best server from the ranked,
+cached server list. Needs the CLI and a network connection.
+
+    python3 benchmarks/bench_first_sample.py [--runs N]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from speedtest_gui.servers import ServerCache
+from speedtest_gui.session import SpeedtestError, run_speedtest
+
+
+def time_to_first_sample(server_id):
+    """Start a test and stop it at the first download sample"""
+    first_sample = threading.Event()
+    process = []
+
+    def progress(phase, value, status):
+        if phase == "download_raw":
+            first_sample.set()
+            if process:
+                process[0].terminate()
+
+    start = time.perf_counter()
+    try:
+        run_speedtest(progress, server_id=server_id, started=process.append,
+                      cancelled=first_sample.is_set)
+    except SpeedtestError as e:
+        print(f"  test failed: {e}", file=sys.stderr)
+        return None
+    if not first_sample.is_set():
+        return None
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="Tests per mode (default: 3)")
+    args = parser.parse_args()
+
+    cache = ServerCache()
+    cache.load()
+    cache.check_network()
+    if not cache.is_fresh():
+        print("Fetching and ranking server list...")
+        start = time.perf_counter()
+        if not cache.refresh():
+            sys.exit("Could not fetch the server list")
+        print(f"  took {time.perf_counter() - start:.2f} s (done in the background by the app)")
+
+    best = cache.best_server_id()
+    timings = {"without cache": [], "with cache": []}
+    for run in range(args.runs):
+        for mode, server_id in (("without cache", None), ("with cache", best)):
+            elapsed = time_to_first_sample(server_id)
+            if elapsed is not None:
+                timings[mode].append(elapsed)
+                print(f"run {run + 1} {mode:<14} {elapsed:6.2f} s")
+
+    print()
+    for mode, values in timings.items():
+        if values:
+            print(f"{mode:<14} median {statistics.median(values):6.2f} s  "
+                  f"min {min(values):6.2f} s  ({len(values)} runs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Compare the CPU time a test costs with the window visible and hidden.
+
+Starts the application against tools/fake_speedtest.py, which replays a
+recorded session, and runs the same tests with the main window shown,
+minimized and hidden. For each mode it reports, per test, the CPU time of
+the main thread (where all drawing happens) and of the whole process, the
+progress updates delivered to the window and the frames it painted.
+Whether minimizing suspends drawing depends on the compositor telling the
+window; the mode is reported as "not minimized" if it didn't.
+
+Needs PyGObject, GTK 4, libadwaita and a display.
+
+    python3 benchmarks/bench_hidden.py [--tests N] [--session NAME] [--speed FACTOR]
+"""
+
+import argparse
+import os
+import resource
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+
+MODES = ("visible", "minimized", "hidden")
+
+# Time for the compositor to act on a mode change before the next test
+SETTLE_MS = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tests", type=int, default=3, help="Tests per mode")
+    parser.add_argument("--session", default="gigabit", help="Recorded session to replay")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay speed; 1 paces the session like the recording")
+    args = parser.parse_args()
+
+    # The stand-in reads its options from the environment it inherits
+    os.environ["SPEEDTEST_BINARY"] = os.path.join(ROOT, "tools", "fake_speedtest.py")
+    os.environ["FAKE_SPEEDTEST_SESSION"] = args.session
+    os.environ["FAKE_SPEEDTEST_SPEED"] = str(args.speed)
+
+    import gi
+    gi.require_version("Gtk", "4.0")
+    gi.require_version("Gdk", "4.0")
+    gi.require_version("Adw", "1")
+    from gi.repository import Gdk, Gio, GLib
+
+    gresource = Gio.Resource.load(os.path.join(ROOT, "speedtest_gui", "resources.gresource"))
+    Gio.resources_register(gresource)
+
+    from speedtest_gui.application import SpeedtestApplication
+
+    app = SpeedtestApplication()
+    app.set_flags(app.get_flags() | Gio.ApplicationFlags.NON_UNIQUE)
+
+    results = {mode: [] for mode in MODES}
+    minimized = []
+    state = {"mode": 0, "test": 0, "window": None, "frames": 0, "started": None}
+
+    def on_after_paint(clock):
+        state["frames"] += 1
+
+    def set_mode():
+        window = state["window"]
+        mode = MODES[state["mode"]]
+        if mode == "visible":
+            window.present()
+        elif mode == "minimized":
+            window.minimize()
+        else:
+            window.set_visible(False)
+        GLib.timeout_add(SETTLE_MS, start_test)
+
+    def start_test():
+        window = state["window"]
+        if MODES[state["mode"]] == "minimized" and not state["test"]:
+            surface_state = window.get_surface().get_state()
+            minimized.append(bool(surface_state & Gdk.ToplevelState.MINIMIZED))
+        state["frames"] = 0
+        state["started"] = (time.thread_time(), cpu_time())
+        app.runner.start_test()
+        return False
+
+    def on_finished(runner, payload=None):
+        thread_cpu, process_cpu = state["started"]
+        stats = runner.coalescer.stats()
+        results[MODES[state["mode"]]].append({
+            "thread_cpu": time.thread_time() - thread_cpu,
+            "process_cpu": cpu_time() - process_cpu,
+            "delivered": stats["delivered"],
+            "frames": state["frames"],
+        })
+
+        state["test"] += 1
+        if state["test"] < args.tests:
+            GLib.idle_add(start_test)
+            return
+        state["test"] = 0
+        state["mode"] += 1
+        if state["mode"] < len(MODES):
+            set_mode()
+        else:
+            app.quit()
+
+    def on_activate(app):
+        window = state["window"] = app.get_active_window()
+        # Presenting the window has realized it already
+        window.get_frame_clock().connect("after-paint", on_after_paint)
+        app.runner.connect("completed", on_finished)
+        app.runner.connect("error", on_finished)
+        # Hidden windows don't count towards keeping the application running
+        app.hold()
+        set_mode()
+
+    app.connect("activate", on_activate)
+    app.run([sys.argv[0]])
+
+    print(f"{args.tests} tests per mode, session {args.session} at {args.speed:g}x")
+    print(f"{'mode':<16}{'main cpu ms':>12}{'process cpu ms':>16}{'updates':>9}{'frames':>8}")
+    for mode in MODES:
+        runs = results[mode]
+        if not runs:
+            continue
+        label = mode if mode != "minimized" or all(minimized) else "not minimized"
+        print(f"{label:<16}"
+              f"{statistics.median(run['thread_cpu'] for run in runs) * 1000:>12.0f}"
+              f"{statistics.median(run['process_cpu'] for run in runs) * 1000:>16.0f}"
+              f"{statistics.median(run['delivered'] for run in runs):>9.0f}"
+              f"{statistics.median(run['frames'] for run in runs):>8.0f}")
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Compare the threaded SpeedtestRunner with the thread-free AsyncSpeedtestRunner.
+
+Both runners are pointed at a stand-in CLI that writes download events at a
+fixed rate. For each runner the script reports the peak number of threads,
+context switches (a proxy for wakeups) and the latency from the stand-in
+writing an event to the runner emitting "progress" for it.
+
+Needs PyGObject; no network or real Speedtest CLI is used.
+
+    python3 benchmarks/bench_runners.py [--events N] [--rate EVENTS_PER_SECOND]
+"""
+
+import argparse
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+# The stand-in encodes the wall clock time it wrote each event (in ms,
+# modulo 1e6) as the bandwidth, so the Mbps value in the progress signal
+# is that time again.
+FAKE_CLI = r'''#!/usr/bin/env python3
+import sys, time
+if "--version" in sys.argv:
+    print("Speedtest by Ookla 1.2.0.84 (benchmark stand-in)")
+    sys.exit(0)
+if "--help" in sys.argv:
+    print("--progress --server-id --servers")
+    sys.exit(0)
+import os
+events, rate = int(os.environ["BENCH_EVENTS"]), float(os.environ["BENCH_RATE"])
+print('{"type":"testStart","isp":"Bench","server":{"id":1,"name":"Bench","location":"Local","country":"Nowhere"}}', flush=True)
+for i in range(events):
+    sent_ms = (time.time() * 1000) % 1e6
+    bandwidth = sent_ms * 1e6 / 8
+    print('{"type":"download","download":{"bandwidth":%r,"bytes":0,"elapsed":0,"progress":%r}}'
+          % (bandwidth, (i + 1) / events), flush=True)
+    time.sleep(1 / rate)
+print('{"type":"result","download":{"bandwidth":1},"upload":{"bandwidth":1},"ping":{"latency":1,"jitter":0},'
+      '"server":{"id":1,"name":"Bench"},"result":{"url":null}}', flush=True)
+'''
+
+
+def thread_count():
+    try:
+        return len(os.listdir("/proc/self/task"))
+    except OSError:
+        import threading
+        return threading.active_count()
+
+
+def run(runner_class, events, rate):
+    from gi.repository import GLib
+
+    # The stand-in inherits our environment
+    os.environ["BENCH_EVENTS"] = str(events)
+    os.environ["BENCH_RATE"] = str(rate)
+
+    runner = runner_class()
+    loop = GLib.MainLoop()
+    latencies = []
+    peak_threads = [thread_count()]
+
+    def on_progress(runner, phase, value, status):
+        if phase == "download_raw":
+            now_ms = (time.time() * 1000) % 1e6
+            latencies.append((now_ms - value) % 1e6)
+        peak_threads[0] = max(peak_threads[0], thread_count())
+
+    def on_done(runner, payload):
+        loop.quit()
+
+    runner.connect("progress", on_progress)
+    runner.connect("completed", on_done)
+    runner.connect("error", on_done)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    GLib.idle_add(lambda: runner.start_test() and False)
+    loop.run()
+    elapsed = time.perf_counter() - start
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    switches = ((usage_after.ru_nvcsw - usage_before.ru_nvcsw)
+                + (usage_after.ru_nivcsw - usage_before.ru_nivcsw))
+    return {
+        "elapsed": elapsed,
+        "threads": peak_threads[0],
+        "switches": switches,
+        "latencies": sorted(latencies),
+        "cpu": (usage_after.ru_utime + usage_after.ru_stime)
+               - (usage_before.ru_utime + usage_before.ru_stime),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=500, help="Events per second")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="speedtest-bench-")
+    cli_path = os.path.join(workdir, "speedtest")
+    with open(cli_path, "w") as f:
+        f.write(FAKE_CLI)
+    os.chmod(cli_path, 0o755)
+
+    # Find only the stand-in and keep its probe cache out of the real one
+    os.environ["PATH"] = workdir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["XDG_CACHE_HOME"] = workdir
+    os.chdir(workdir)
+
+    import gi
+    gi.require_version('GLib', '2.0')
+    from speedtest_gui.async_runner import AsyncSpeedtestRunner
+    from speedtest_gui.speedtest_runner import SpeedtestRunner
+
+    print(f"{args.events} events at {args.rate:.0f}/s")
+    print(f"{'runner':<24}{'threads':>8}{'ctx switches':>14}{'cpu s':>8}"
+          f"{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'delivered':>11}")
+    for runner_class in (SpeedtestRunner, AsyncSpeedtestRunner):
+        stats = run(runner_class, args.events, args.rate)
+        latencies = stats["latencies"] or [float("nan")]
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+        p99 = latencies[int(len(latencies) * 0.99) - 1] if len(latencies) > 1 else latencies[0]
+        print(f"{runner_class.__name__:<24}{stats['threads']:>8}{stats['switches']:>14}"
+              f"{stats['cpu']:>8.2f}{statistics.median(latencies):>8.1f}{p95:>8.1f}{p99:>8.1f}"
+              f"{len(stats['latencies']):>11}")
+
+
+if __name__ == "__main__":
+    main()
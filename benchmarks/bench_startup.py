@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Measure how long the application takes to draw its first frame.
+
+Each run starts a fresh Python process that launches the application and
+reports the time from starting the process to the first painted frame of
+the main window, then quits. The first run is cold: the package's
+bytecode cache is removed first and, with --drop-caches (root only), the
+kernel page cache is dropped too. The remaining runs are warm. Finally the
+import time of each module is measured with python -X importtime.
+
+Needs PyGObject, GTK 4, libadwaita and a display.
+
+    python3 benchmarks/bench_startup.py [--runs N] [--drop-caches] [--top N]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+PACKAGE = os.path.join(ROOT, "speedtest_gui")
+
+# Run in the child process. Prints a line once the main window has
+# painted its first frame, then quits.
+CHILD = r'''
+import os, sys
+sys.path.insert(0, sys.argv[1])
+
+import gi
+gi.require_version("Gtk", "4.0")
+gi.require_version("Adw", "1")
+from gi.repository import Gio
+
+resource = Gio.Resource.load(os.path.join(sys.argv[1], "speedtest_gui", "resources.gresource"))
+Gio.resources_register(resource)
+
+from speedtest_gui.application import SpeedtestApplication
+
+app = SpeedtestApplication()
+app.set_flags(app.get_flags() | Gio.ApplicationFlags.NON_UNIQUE)
+
+def on_after_paint(clock, window):
+    print("painted", flush=True)
+    clock.disconnect_by_func(on_after_paint)
+    app.quit()
+
+def on_realize(window):
+    window.get_frame_clock().connect("after-paint", on_after_paint, window)
+
+def on_window_added(app, window):
+    window.connect("realize", on_realize)
+
+app.connect("window-added", on_window_added)
+app.run([sys.argv[0]])
+'''
+
+
+def clear_bytecode():
+    for directory, subdirectories, files in os.walk(PACKAGE):
+        if os.path.basename(directory) == "__pycache__":
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def drop_page_cache():
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError as e:
+        print(f"Could not drop the page cache: {e}")
+        return False
+
+
+def first_frame():
+    """Seconds from starting the process to its first painted frame"""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", CHILD, ROOT],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    elapsed = time.perf_counter() - start
+    stderr = process.communicate(timeout=60)[1]
+    if line.strip() != "painted":
+        raise SystemExit(f"The application failed to start:\n{stderr}")
+    return elapsed
+
+
+def import_times(top):
+    """Cumulative import time in ms of each speedtest_gui module and its largest dependencies"""
+    code = ("import os, sys; sys.path.insert(0, sys.argv[1]);"
+            "import gi; gi.require_version('Gtk', '4.0'); gi.require_version('Adw', '1');"
+            "from gi.repository import Gio;"
+            "Gio.resources_register(Gio.Resource.load("
+            "os.path.join(sys.argv[1], 'speedtest_gui', 'resources.gresource')));"
+            "import speedtest_gui.application")
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", code, ROOT],
+                            capture_output=True, text=True, timeout=60)
+
+    times = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue
+        times.append((fields[2].strip(), self_us / 1000, cumulative_us / 1000))
+
+    ours = [entry for entry in times if entry[0].startswith("speedtest_gui")]
+    others = sorted((entry for entry in times if not entry[0].startswith("speedtest_gui")),
+                    key=lambda entry: entry[2], reverse=True)[:top]
+    return ours, others
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="Warm runs (default: 10)")
+    parser.add_argument("--drop-caches", action="store_true",
+                        help="Drop the kernel page cache before the cold run (needs root)")
+    parser.add_argument("--top", type=int, default=10,
+                        help="How many other modules to list by import time (default: 10)")
+    args = parser.parse_args()
+
+    clear_bytecode()
+    if args.drop_caches:
+        drop_page_cache()
+    cold = first_frame()
+    print(f"Cold start: first frame after {cold * 1000:.0f} ms")
+
+    frames = sorted(first_frame() * 1000 for _ in range(args.runs))
+    print(f"Warm start ({args.runs} runs): first frame median {statistics.median(frames):.0f} ms, "
+          f"min {frames[0]:.0f} ms, max {frames[-1]:.0f} ms")
+
+    ours, others = import_times(args.top)
+    print("\nImport time (ms)        self  cumulative")
+    for name, self_ms, cumulative_ms in ours:
+        print(f"  {name:<24}{self_ms:>6.1f}{cumulative_ms:>12.1f}")
+    print("\nLargest other imports")
+    for name, self_ms, cumulative_ms in others:
+        print(f"  {name:<24}{self_ms:>6.1f}{cumulative_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+import sys
+
+
+def run_gui(argv):
+    import gi
+    gi.require_version('Gtk', '4.0')
+    gi.require_version('Adw', '1')
+    from gi.repository import Gio
+
+    # Load resources
+    resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources.gresource")
+    resource = Gio.Resource.load(resource_path)
+    Gio.resources_register(resource)
+
+    from .application import SpeedtestApplication
+
+    app = SpeedtestApplication()
+    return app.run(argv)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    # SPEEDTEST_GUI_LOG sets the level; --log-level overrides it later
+    from . import log
+    log.setup()
+
+    # Headless mode runs without importing GTK at all
+    if "--headless" in argv[1:]:
+        from .headless import main as headless_main
+        return headless_main([arg for arg in argv[1:] if arg != "--headless"])
+
+    return run_gui(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
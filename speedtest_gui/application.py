@@ -1,17 +1,207 @@
 import gi
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
-from gi.repository import Gtk, Adw, Gio, GLib
+from gi.repository import Gtk, Adw, Gio, GLib, GObject
 
+import logging
+import threading
+import time
+
+from . import log as logsetup
+from .scheduler import TestScheduler
+from .speedtest_runner import SpeedtestRunner
 from .window import SpeedtestWindow
 
+# Everything that isn't needed to show the window is imported when first
+# used: the history, the server list and the extra windows
+
+log = logging.getLogger(__name__)
+
 class SpeedtestApplication(Adw.Application):
+    __gsignals__ = {
+        'history-changed': (GObject.SignalFlags.RUN_FIRST, None, ()),
+        'stats-changed': (GObject.SignalFlags.RUN_FIRST, None, ()),
+        'busy-changed': (GObject.SignalFlags.RUN_FIRST, None, ())
+    }
+    
+    # Completed results are written to the history in batches this often
+    HISTORY_FLUSH_SECONDS = 2
+    
     def __init__(self):
         super().__init__(application_id="com.github.speedtest_gui",
                          flags=Gio.ApplicationFlags.FLAGS_NONE)
         
+        # The runner and scheduler belong to the application rather than the
+        # window, so scheduled tests keep running while the window is closed
+        self.runner = SpeedtestRunner()
+        self.scheduler = TestScheduler(self, self.runner)
+        
+        self.server_cache = None
+        self.history = None
+        self.history_failed = False
+        self.history_window = None
+        self.history_flush_id = 0
+        
+        # Statistics over the history, built from it on first use and then
+        # updated with every result. Results that complete while it is being
+        # built wait in stats_pending.
+        self.stats = None
+        self.stats_building = False
+        self.stats_pending = []
+        
+        # Watches the results for lasting changes in speed or latency. It is
+        # brought up to date with the history at startup; results that
+        # complete meanwhile wait in changes_pending.
+        self.changes = None
+        self.changes_building = False
+        self.changes_pending = []
+        
+        # Set by --latency and --latency-dump
+        self.latency_overlay = False
+        self.latency_dump = None
+        
+        # Set up by --metrics-port
+        self.metrics = None
+        self.metrics_server = None
+        self.runner.connect("completed", self.on_test_completed)
+        
+        # The multi-server test that is running, if any. Tests share the
+        # bandwidth, so only it or the runner's test can run at a time.
+        self.multi_test = None
+        for signal in ("started", "completed", "error", "cancelled"):
+            self.runner.connect(signal, lambda runner, *args: self.emit("busy-changed"))
+        
         self.create_action("quit", self.quit_app, ["<primary>q"])
         self.create_action("about", self.on_about_action)
+        self.create_action("history", self.on_history_action, ["<primary>h"])
+        self.create_action("multi-server", self.on_multi_server_action)
+        self.create_action("export", self.on_export_action, ["<primary>e"])
+        self.create_action("summary", self.on_summary_action)
+        self.create_action("refresh-servers", self.on_refresh_servers_action)
+        
+        schedule_action = Gio.SimpleAction.new_stateful(
+            "scheduled-tests", None, GLib.Variant.new_boolean(False))
+        schedule_action.connect("change-state", self.on_scheduled_tests_changed)
+        self.add_action(schedule_action)
+        
+        self.add_main_option("schedule", 0, GLib.OptionFlags.NONE, GLib.OptionArg.INT,
+                             "Run a test every MINUTES minutes", "MINUTES")
+        self.add_main_option("log-level", 0, GLib.OptionFlags.NONE, GLib.OptionArg.STRING,
+                             "Log messages of at least this level (debug, info, warning, error)",
+                             "LEVEL")
+        self.add_main_option("latency", 0, GLib.OptionFlags.NONE, GLib.OptionArg.NONE,
+                             "Time progress events from the CLI to the screen and show "
+                             "the results over the window", None)
+        self.add_main_option("latency-dump", 0, GLib.OptionFlags.NONE, GLib.OptionArg.FILENAME,
+                             "Time progress events and write the histograms to FILE as "
+                             "JSON on exit", "FILE")
+        self.add_main_option("metrics-port", 0, GLib.OptionFlags.NONE, GLib.OptionArg.INT,
+                             "Serve OpenMetrics on http://127.0.0.1:PORT/metrics", "PORT")
+        
+    def do_startup(self):
+        Adw.Application.do_startup(self)
+        
+        # Background work waits until the window has been drawn
+        GLib.idle_add(self.start_services, priority=GLib.PRIORITY_LOW)
+        
+    def start_services(self):
+        if self.server_cache is not None:
+            return GLib.SOURCE_REMOVE
+        
+        from . import cli
+        from .servers import ServerCache
+        
+        # Check the Speedtest CLI off the main thread so that starting a
+        # test doesn't have to wait for it
+        cli.revalidate_in_background()
+        
+        # Fetch and rank the server list in the background, and start over
+        # whenever the network changes
+        self.server_cache = ServerCache()
+        self.server_cache.load()
+        self.server_cache.refresh_in_background()
+        self.runner.server_cache = self.server_cache
+        Gio.NetworkMonitor.get_default().connect("network-changed", self.on_network_changed)
+        
+        # The exporter's histograms start out with the recent history
+        if self.metrics is not None and self.get_history() is not None:
+            from .metrics import RECENT_RESULTS
+            self.metrics.seed(reversed(self.history.page(RECENT_RESULTS)))
+        
+        self.build_changes()
+        return GLib.SOURCE_REMOVE
+        
+    def get_history(self):
+        """The result history, opened on first use. None if it can't be opened."""
+        if self.history is None and not self.history_failed:
+            from .history import HistoryStore
+            try:
+                self.history = HistoryStore()
+            except Exception as e:
+                log.error("Could not open result history: %s", e)
+                self.history_failed = True
+        return self.history
+        
+    def do_shutdown(self):
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.history is not None:
+            self.history.close()
+        if self.latency_dump is not None:
+            try:
+                self.runner.latency.dump(self.latency_dump)
+            except OSError as e:
+                log.error("Could not write latency histograms: %s", e)
+        Adw.Application.do_shutdown(self)
+        
+    def do_handle_local_options(self, options):
+        if options.contains("log-level"):
+            name = options.lookup_value("log-level", GLib.VariantType.new("s")).get_string()
+            level = logsetup.parse_level(name)
+            if level is None:
+                print(f"Unknown log level: {name}")
+                return 1
+            logsetup.setup(level)
+            
+        if options.contains("latency") or options.contains("latency-dump"):
+            from .latency import LatencyTracker
+            self.runner.set_latency_tracker(LatencyTracker())
+            self.latency_overlay = options.contains("latency")
+            if options.contains("latency-dump"):
+                path = options.lookup_value("latency-dump", GLib.VariantType.new("ay"))
+                self.latency_dump = path.get_bytestring().decode()
+            
+        if options.contains("metrics-port"):
+            port = options.lookup_value("metrics-port", GLib.VariantType.new("i")).get_int32()
+            if not self.start_metrics(port):
+                return 1
+            
+        if options.contains("schedule"):
+            minutes = options.lookup_value("schedule", GLib.VariantType.new("i")).get_int32()
+            if minutes > 0:
+                self.scheduler.set_interval(minutes)
+                self.lookup_action("scheduled-tests").change_state(GLib.Variant.new_boolean(True))
+        return -1
+        
+    def start_metrics(self, port):
+        from .metrics import Metrics, MetricsServer
+        
+        metrics = Metrics()
+        try:
+            server = MetricsServer(metrics, port)
+        except OSError as e:
+            print(f"Could not serve metrics on port {port}: {e.strerror}")
+            return False
+        
+        # The snapshot is rendered when something happens, never on a scrape
+        self.metrics = metrics
+        self.runner.connect("started", lambda runner: self.metrics.test_started())
+        self.runner.connect("completed", lambda runner, result: self.metrics.test_completed(result))
+        self.runner.connect("error", lambda runner, message: self.metrics.test_failed(message))
+        self.runner.connect("cancelled", lambda runner: self.metrics.test_cancelled())
+        self.metrics_server = server
+        server.start()
+        return True
         
     def do_activate(self):
         win = self.props.active_window
@@ -19,6 +209,214 @@ class SpeedtestApplication(Adw.Application):
             win = SpeedtestWindow(application=self)
         win.present()
         
+    def on_test_completed(self, runner, results):
+        timestamp = time.time()
+        if self.stats is not None:
+            self.stats.add(results, timestamp)
+            self.emit("stats-changed")
+        elif self.stats_building:
+            self.stats_pending.append((results, timestamp))
+        
+        history = self.get_history()
+        if history is None:
+            return
+        
+        if self.changes is not None:
+            self.detect_changes(results, timestamp)
+        elif self.changes_building:
+            self.changes_pending.append((results, timestamp))
+        history.add(results, timestamp)
+        self.schedule_history_flush()
+        
+    def schedule_history_flush(self):
+        if not self.history_flush_id:
+            self.history_flush_id = GLib.timeout_add_seconds(
+                self.HISTORY_FLUSH_SECONDS, self.flush_history)
+        
+    def flush_history(self):
+        self.history_flush_id = 0
+        try:
+            if self.history.flush():
+                self.emit("history-changed")
+        except Exception as e:
+            log.error("Could not save results: %s", e)
+        return GLib.SOURCE_REMOVE
+        
+    def on_history_action(self, action, param):
+        if self.get_history() is None:
+            return
+        
+        if self.history_window is None:
+            from .history_view import HistoryWindow
+            self.history_window = HistoryWindow(self.history, application=self,
+                                                transient_for=self.props.active_window)
+            handler_id = self.connect("history-changed",
+                                      lambda app: self.history_window.refresh())
+            self.history_window.connect("close-request", self.on_history_window_closed, handler_id)
+        self.history_window.present()
+        
+    def build_stats(self):
+        """Build the statistics from the history in the background"""
+        if self.stats is not None or self.stats_building or self.get_history() is None:
+            return
+        
+        # Everything before now is read from the database; results that
+        # complete from now on are added once the build is done
+        self.history.flush()
+        until = time.time()
+        self.stats_building = True
+        
+        def build():
+            from .stats import StatsEngine
+            engine = StatsEngine()
+            try:
+                engine.rebuild(self.history.iter_rows(until=until))
+            except Exception as e:
+                log.error("Could not summarise the history: %s", e)
+                engine = None
+            GLib.idle_add(self.on_stats_built, engine)
+        
+        thread = threading.Thread(target=build)
+        thread.daemon = True
+        thread.start()
+        
+    def on_stats_built(self, engine):
+        self.stats_building = False
+        pending = self.stats_pending
+        self.stats_pending = []
+        if engine is not None:
+            for results, timestamp in pending:
+                engine.add(results, timestamp)
+            self.stats = engine
+        self.emit("stats-changed")
+        return GLib.SOURCE_REMOVE
+        
+    def build_changes(self):
+        """Run the change detectors over results they haven't seen, in the background"""
+        if self.changes is not None or self.changes_building or self.get_history() is None:
+            return
+        
+        from .changes import STATE_NAME
+        
+        # The detectors' saved state covers the results up to its
+        # last_timestamp, so only newer ones are read
+        self.history.flush()
+        state = self.history.get_state(STATE_NAME)
+        until = time.time()
+        self.changes_building = True
+        
+        def build():
+            from .changes import ChangeDetector
+            try:
+                detector = ChangeDetector.load(state)
+                # Without usable state every result is read again, and the
+                # changes found replace the stored ones
+                replace = detector.last_timestamp is None
+                changes = detector.add_rows(
+                    self.history.iter_rows(since=detector.last_timestamp, until=until))
+            except Exception as e:
+                log.error("Could not check the history for changes: %s", e)
+                detector, changes, replace = None, [], False
+            GLib.idle_add(self.on_changes_built, detector, changes, replace)
+        
+        thread = threading.Thread(target=build)
+        thread.daemon = True
+        thread.start()
+        
+    def on_changes_built(self, detector, changes, replace):
+        from .changes import STATE_NAME
+        
+        self.changes_building = False
+        pending = self.changes_pending
+        self.changes_pending = []
+        if detector is None:
+            return GLib.SOURCE_REMOVE
+        
+        # Changes found in older results are only marked on the chart;
+        # notifications are for results that just completed
+        self.changes = detector
+        if replace:
+            self.history.replace_changes(changes)
+        else:
+            self.history.add_changes(changes)
+        self.history.set_state(STATE_NAME, detector.dump())
+        for results, timestamp in pending:
+            self.detect_changes(results, timestamp)
+        self.schedule_history_flush()
+        return GLib.SOURCE_REMOVE
+        
+    def detect_changes(self, results, timestamp):
+        from .changes import STATE_NAME
+        
+        # Saved with the result in the next flush; costs O(servers) per result
+        changes = self.changes.add(results, timestamp)
+        self.history.add_changes(changes)
+        self.history.set_state(STATE_NAME, self.changes.dump())
+        for change in changes:
+            self.notify_change(change)
+        
+    def notify_change(self, change):
+        from .changes import WATCHED, describe
+        
+        log.info("Detected a change: %s", describe(change))
+        notification = Gio.Notification.new(f"{WATCHED[change['metric']][0]} changed")
+        notification.set_body(describe(change))
+        notification.set_default_action("app.history")
+        self.send_notification(f"change-{change['server_id']}-{change['metric']}", notification)
+        
+    def on_summary_action(self, action, param):
+        if self.get_history() is None:
+            return
+        
+        from .stats_view import SummaryWindow
+        self.build_stats()
+        window = SummaryWindow(self, transient_for=self.props.active_window)
+        window.present()
+        
+    def on_export_action(self, action, param):
+        if self.get_history() is None:
+            return
+        
+        from .export_view import ExportWindow
+        window = ExportWindow(self.history, application=self,
+                              transient_for=self.props.active_window)
+        window.present()
+        
+    def on_history_window_closed(self, window, handler_id):
+        self.disconnect(handler_id)
+        self.history_window = None
+        return False
+        
+    def on_network_changed(self, monitor, available):
+        if available:
+            self.server_cache.refresh_in_background()
+        
+    def on_refresh_servers_action(self, action, param):
+        self.start_services()
+        self.server_cache.refresh_in_background(force=True)
+        
+    def on_multi_server_action(self, action, param):
+        from .multi_view import MultiServerWindow
+        
+        window = MultiServerWindow(application=self, transient_for=self.props.active_window)
+        window.present()
+        
+    def busy(self):
+        """Whether a single or a multi-server test is running"""
+        return self.runner.running or self.multi_test is not None
+        
+    def set_multi_test(self, test):
+        """Record the multi-server test that is running, or None once it has ended"""
+        self.multi_test = test
+        self.emit("busy-changed")
+        
+    def on_scheduled_tests_changed(self, action, value):
+        action.set_state(value)
+        if value.get_boolean():
+            self.scheduler.start()
+        else:
+            self.scheduler.stop()
+        
     def on_about_action(self, widget, _):
         about = Adw.AboutWindow(
             transient_for=self.props.active_window,
@@ -43,4 +441,4 @@ class SpeedtestApplication(Adw.Application):
         self.add_action(action)
         
         if shortcuts:
-            self.set_accels_for_action(f"app.{name}", shortcuts) 
\ No newline at end of file
+            self.set_accels_for_action(f"app.{name}", shortcuts)
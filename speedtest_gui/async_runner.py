@@ -0,0 +1,325 @@
+import gi
+gi.require_version('GLib', '2.0')
+gi.require_version('Gio', '2.0')
+from gi.repository import GObject, GLib, Gio
+
+import logging
+import signal
+import time
+
+from .cli import PROBE_TIMEOUT, CliError, find_cli, from_probe, remember
+from .coalescer import ProgressCoalescer
+from .decoder import decode_line
+from .log import OutputRing
+from .process import MAX_DURATION, STALL_TIMEOUT, TERMINATE_GRACE
+from .session import SpeedtestSession, build_command, failure_message
+
+log = logging.getLogger(__name__)
+
+
+class AsyncSpeedtestRunner(GObject.Object):
+    """Runs the Speedtest CLI without any threads of our own.
+
+    A drop-in alternative to SpeedtestRunner with the same signals. The CLI
+    is started with Gio.Subprocess and its stdout and stderr are read with
+    Gio.DataInputStream.read_line_async, so every line is decoded and
+    handled directly on the main context. Several instances can run at
+    once without extra threads. A CLI that isn't in the probe cache yet,
+    or has changed since, is probed with Gio.Subprocess too.
+    """
+    __gtype_name__ = 'AsyncSpeedtestRunner'
+
+    __gsignals__ = {
+        'started': (GObject.SignalFlags.RUN_FIRST, None, ()),
+        'progress': (GObject.SignalFlags.RUN_FIRST, None, (str, float, str)),
+        'completed': (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+        'error': (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+        'cancelled': (GObject.SignalFlags.RUN_FIRST, None, ())
+    }
+
+    def __init__(self, max_progress_rate=None, server_cache=None,
+                 terminate_grace=TERMINATE_GRACE, stall_timeout=STALL_TIMEOUT,
+                 max_duration=MAX_DURATION, binary=None):
+        super().__init__()
+        self.running = False
+        self.process = None
+        self.server_cache = server_cache
+        # Speedtest CLI to run instead of the one found by searching
+        self.binary = binary
+
+        self.terminate_grace = terminate_grace
+        self.stall_timeout = stall_timeout
+        self.max_duration = max_duration
+
+        self.coalescer = ProgressCoalescer(self._emit_progress, max_progress_rate)
+        self.latency = None
+
+        self._cancellable = None
+        self._session = None
+        self._output = OutputRing()
+        # The CLI's last output lines when the most recent test failed
+        self.error_output = []
+        self._pending = 0
+        self._watchdog_id = 0
+        self._started_at = 0.0
+        self._last_output = 0.0
+
+    def start_test(self, server_id=None):
+        if self.running:
+            return
+
+        self.running = True
+        self.coalescer.discard()
+        self.coalescer.reset_stats()
+        self._output.clear()
+        self.emit("started")
+
+        if server_id is None and self.server_cache is not None:
+            server_id = self.server_cache.best_server_id()
+        if server_id is None:
+            self.coalescer.push("init", 0.1, "Finding optimal server...")
+        else:
+            self.coalescer.push("init", 0.1, "Connecting to server...")
+
+        try:
+            cli, path = find_cli(self.binary)
+        except CliError as e:
+            self._fail(str(e))
+            return
+
+        if cli is None:
+            # A new or changed CLI; probing it mustn't block the main loop
+            self._cancellable = Gio.Cancellable()
+            self._probe(path, server_id, self._cancellable)
+        else:
+            self._launch(cli, server_id)
+
+    def _launch(self, cli, server_id):
+        try:
+            cmd = build_command(cli, server_id)
+            log.debug("Running command: %s", cmd)
+            self.process = Gio.Subprocess.new(
+                cmd, Gio.SubprocessFlags.STDOUT_PIPE | Gio.SubprocessFlags.STDERR_PIPE)
+        except (CliError, GLib.Error) as e:
+            self._fail(str(e))
+            return
+
+        # The cancellable is this run's generation token: every callback
+        # gets it back and ignores itself once the run was cancelled
+        self._cancellable = Gio.Cancellable()
+        self._session = SpeedtestSession(self._push_progress)
+
+        self._started_at = self._last_output = time.monotonic()
+        if self.stall_timeout is not None or self.max_duration is not None:
+            self._watchdog_id = GLib.timeout_add_seconds(1, self._on_watchdog, self._cancellable)
+
+        # The run is over once stdout is drained and the process has exited
+        self._pending = 2
+        stdout = Gio.DataInputStream.new(self.process.get_stdout_pipe())
+        stderr = Gio.DataInputStream.new(self.process.get_stderr_pipe())
+        stdout.read_line_async(GLib.PRIORITY_DEFAULT, self._cancellable,
+                               self._on_stdout_line, self._cancellable)
+        stderr.read_line_async(GLib.PRIORITY_LOW, self._cancellable,
+                               self._on_stderr_line, self._cancellable)
+        self.process.wait_async(self._cancellable, self._on_exited, self._cancellable)
+
+    def _probe(self, path, server_id, cancellable):
+        """Run the CLI with --version and --help like cli.probe(), then start the test"""
+        def on_version(status, output, error):
+            if status != 0:
+                if status is None:
+                    self._fail(f"Failed to run speedtest command: {error}")
+                else:
+                    self._fail(f"Speedtest CLI not working properly: {error}")
+                return
+            self._run_probe(path, "--help", cancellable,
+                            lambda status, help_output, help_error:
+                            on_help(output, help_output + help_error))
+
+        def on_help(version_output, help_text):
+            try:
+                cli = from_probe(path, version_output, help_text)
+            except CliError as e:
+                self._fail(str(e))
+                return
+            remember(cli, self.binary)
+            self._launch(cli, server_id)
+
+        self._run_probe(path, "--version", cancellable, on_version)
+
+    def _run_probe(self, path, argument, cancellable, callback):
+        """Run the CLI with one argument and call callback(status, stdout, stderr).
+
+        status is None if the CLI couldn't be run, with the reason as stderr.
+        The CLI is killed after PROBE_TIMEOUT seconds. Nothing is called once
+        the run is cancelled.
+        """
+        try:
+            process = Gio.Subprocess.new(
+                [path, argument], Gio.SubprocessFlags.STDOUT_PIPE | Gio.SubprocessFlags.STDERR_PIPE)
+        except GLib.Error as e:
+            callback(None, "", e.message)
+            return
+        # cancel_test() stops it like the CLI itself
+        self.process = process
+
+        def on_timeout():
+            timeout_id[0] = 0
+            process.force_exit()
+            return GLib.SOURCE_REMOVE
+
+        def on_communicated(process, result):
+            if timeout_id[0]:
+                GLib.source_remove(timeout_id[0])
+            if cancellable.is_cancelled():
+                return
+            self.process = None
+            try:
+                ok, stdout, stderr = process.communicate_utf8_finish(result)
+            except GLib.Error as e:
+                callback(None, "", e.message)
+                return
+            if not process.get_if_exited():
+                callback(None, "", f"{argument} did not finish within {PROBE_TIMEOUT} seconds")
+                return
+            callback(process.get_exit_status(), stdout or "", stderr or "")
+
+        timeout_id = [GLib.timeout_add_seconds(PROBE_TIMEOUT, on_timeout)]
+        process.communicate_utf8_async(None, cancellable, on_communicated)
+
+    def cancel_test(self):
+        if not self.running:
+            return
+
+        if self.process is not None:
+            self._stop_process(self.process)
+        if self._cancellable is not None:
+            self._cancellable.cancel()
+
+        self._remove_watchdog()
+        self.running = False
+        self.process = None
+        self._session = None
+        self.coalescer.discard()
+        self.emit("cancelled")
+
+    def _stop_process(self, process):
+        """SIGTERM now, SIGKILL if the CLI is still running after the grace period"""
+        if process.get_identifier() is None:
+            return
+        process.send_signal(signal.SIGTERM)
+
+        def kill():
+            if process.get_identifier() is not None:
+                log.warning("Process %s ignored SIGTERM, killing it", process.get_identifier())
+                process.force_exit()
+            return GLib.SOURCE_REMOVE
+
+        GLib.timeout_add(int(self.terminate_grace * 1000), kill)
+
+    def _on_watchdog(self, cancellable):
+        if cancellable.is_cancelled():
+            return GLib.SOURCE_REMOVE
+
+        now = time.monotonic()
+        if self.stall_timeout is not None and now - self._last_output > self.stall_timeout:
+            message = f"Speedtest stalled: no output for {self.stall_timeout:.0f} seconds"
+        elif self.max_duration is not None and now - self._started_at > self.max_duration:
+            message = f"Speedtest timed out after {self.max_duration:.0f} seconds"
+        else:
+            return GLib.SOURCE_CONTINUE
+
+        log.warning("%s", message)
+        self._watchdog_id = 0
+        self._stop_process(self.process)
+        cancellable.cancel()
+        self._fail(message)
+        return GLib.SOURCE_REMOVE
+
+    def _remove_watchdog(self):
+        if self._watchdog_id:
+            GLib.source_remove(self._watchdog_id)
+            self._watchdog_id = 0
+
+    def set_latency_tracker(self, tracker):
+        self.latency = tracker
+        self.coalescer.tracker = tracker
+
+    def _emit_progress(self, phase, value, status):
+        self.emit("progress", phase, value, status)
+
+    def _push_progress(self, phase, value, status):
+        # Called while handling the line that was just read
+        read_at = time.monotonic() if self.latency is not None else None
+        self.coalescer.push(phase, value, status, read_at)
+
+    def _on_stdout_line(self, stream, result, cancellable):
+        if cancellable.is_cancelled():
+            return
+        try:
+            line, length = stream.read_line_finish(result)
+        except GLib.Error as e:
+            log.warning("Reading speedtest output failed: %s", e.message)
+            line = None
+
+        if line is None:
+            self._step_done(cancellable)
+            return
+
+        # Any line shows the CLI is alive, even one that isn't an event
+        self._last_output = time.monotonic()
+        self._output.record("stdout", line)
+        event = decode_line(line)
+        if event is not None:
+            self._session.handle(event)
+        stream.read_line_async(GLib.PRIORITY_DEFAULT, cancellable, self._on_stdout_line, cancellable)
+
+    def _on_stderr_line(self, stream, result, cancellable):
+        if cancellable.is_cancelled():
+            return
+        try:
+            line, length = stream.read_line_finish(result)
+        except GLib.Error:
+            return
+        if line is None:
+            return
+
+        self._output.record("stderr", line)
+        log.debug("stderr: %r", line)
+        stream.read_line_async(GLib.PRIORITY_LOW, cancellable, self._on_stderr_line, cancellable)
+
+    def _on_exited(self, process, result, cancellable):
+        if cancellable.is_cancelled():
+            return
+        try:
+            process.wait_finish(result)
+        except GLib.Error:
+            pass
+        self._step_done(cancellable)
+
+    def _step_done(self, cancellable):
+        self._pending -= 1
+        if self._pending > 0 or cancellable.is_cancelled():
+            return
+
+        process = self.process
+        result = self._session.parsed_result()
+        if result is not None:
+            self._finish("completed", result)
+            return
+
+        status = process.get_exit_status() if process.get_if_exited() else -1
+        self._fail(failure_message(self._session, status, self._output))
+
+    def _fail(self, message):
+        self.error_output = self._output.lines()
+        log.error("%s\nRecent speedtest output:\n%s", message, "\n".join(self.error_output))
+        self._finish("error", message)
+
+    def _finish(self, signal_name, payload):
+        self._remove_watchdog()
+        self.running = False
+        self.process = None
+        self._session = None
+        self.coalescer.flush()
+        self.emit(signal_name, payload)
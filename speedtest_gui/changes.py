@@ -0,0 +1,250 @@
+import json
+import math
+import time
+
+# Metrics watched for shifts, with the unit they are shown in and whether a
+# rise is an improvement
+WATCHED = {
+    "download": ("Download", "Mbps", True),
+    "upload": ("Upload", "Mbps", True),
+    "ping": ("Ping", "ms", False),
+}
+
+# history.COLUMNS positions of the fields the detector reads from rows
+TIMESTAMP, SERVER_ID, SERVER = 0, 1, 2
+METRIC_COLUMNS = {"download": 5, "upload": 6, "ping": 7}
+
+# Name of the detector state in the history's state table, and its version.
+# State of another version is dropped.
+STATE_NAME = "change_detector"
+STATE_VERSION = 2
+
+
+class Cusum:
+    """Two-sided CUSUM detector for a shift in the mean of one series.
+
+    The first WARMUP values set the baseline. After that each value is
+    standardised against the baseline and added to an upper and a lower
+    cumulative sum, less DRIFT standard deviations; a sum that rises more
+    than THRESHOLD above its lowest point is a change. The values since
+    that point, at most RUN_LIMIT of them, are kept, and the change is
+    taken to start where splitting them best separates the new level from
+    the baseline. The baseline keeps learning from every value, and starts
+    over from the values after the change once one is reported. add()
+    costs O(1).
+
+    The standard deviation is at least MIN_SPREAD times the mean, since
+    speed tests against a quiet server vary less than they will later, and
+    standardised values are clipped to CLIP, so that a few outliers can't
+    raise an alarm on their own. Shifts smaller than MIN_SHIFT times the
+    baseline, give or take the uncertainty of the new mean, are not
+    reported; the sums start over but the baseline stays.
+    """
+
+    __slots__ = ("count", "mean", "m2", "high", "high_min", "high_run",
+                 "low", "low_min", "low_run")
+
+    WARMUP = 10
+    DRIFT = 0.5
+    THRESHOLD = 8.0
+    CLIP = 3.0
+    MIN_SPREAD = 0.05
+    MIN_SHIFT = 0.15
+    RUN_LIMIT = 32
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self.high = self.low = 0.0
+        self.high_min = self.low_min = 0.0
+        # [timestamp, value] of every value since the sum's lowest point
+        self.high_run = []
+        self.low_run = []
+
+    def _learn(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def spread(self):
+        variance = self.m2 / (self.count - 1) if self.count > 1 else 0.0
+        return max(math.sqrt(variance), abs(self.mean) * self.MIN_SPREAD, 1e-9)
+
+    def _step(self, total, lowest, run, z, value, timestamp):
+        """Update one side's sum with z. Returns the sum and its lowest point."""
+        total = max(0.0, total + z - self.DRIFT)
+        if total <= lowest:
+            # A change, if any, starts after this value
+            run.clear()
+            return total, total
+        run.append([timestamp, value])
+        if len(run) > self.RUN_LIMIT:
+            del run[0]
+        return total, lowest
+
+    def _split(self, run):
+        """(index, mean) of the suffix of run that differs most from the baseline.
+
+        This is the most likely start of a single shift in the mean: the
+        split maximising the suffix's length times its squared distance
+        from the baseline.
+        """
+        best_index, best_mean, best_score = 0, 0.0, -1.0
+        total = 0.0
+        for index in range(len(run) - 1, -1, -1):
+            total += run[index][1]
+            count = len(run) - index
+            mean = total / count
+            score = count * (mean - self.mean) ** 2
+            if score >= best_score:
+                best_index, best_mean, best_score = index, mean, score
+        return best_index, best_mean
+
+    def add(self, value, timestamp):
+        """Add a value. Returns (since, before, after) if it completes a change.
+
+        since is the timestamp of the first value after the change, before
+        and after the means on either side of it.
+        """
+        if self.count < self.WARMUP:
+            self._learn(value)
+            return None
+
+        z = max(-self.CLIP, min(self.CLIP, (value - self.mean) / self.spread))
+        self.high, self.high_min = self._step(self.high, self.high_min, self.high_run,
+                                              z, value, timestamp)
+        self.low, self.low_min = self._step(self.low, self.low_min, self.low_run,
+                                            -z, value, timestamp)
+
+        if self.high - self.high_min > self.THRESHOLD:
+            run = self.high_run
+        elif self.low - self.low_min > self.THRESHOLD:
+            run = self.low_run
+        else:
+            self._learn(value)
+            return None
+
+        index, after = self._split(run)
+        since = run[index][0]
+        count = len(run) - index
+        before = self.mean
+
+        # The shift has to clear MIN_SHIFT by more than the uncertainty of
+        # a mean of so few values
+        margin = self.spread / math.sqrt(count)
+        if abs(after - before) - margin < self.MIN_SHIFT * abs(before):
+            self._reset_sums()
+            self._learn(value)
+            return None
+
+        # The values since the change become the new baseline, assumed to
+        # vary as much relative to their mean as the old ones did
+        relative = self.spread / abs(before) if before else 0.0
+        self.count = count
+        self.mean = after
+        self.m2 = (count - 1) * (relative * after) ** 2
+        self._reset_sums()
+        return since, before, after
+
+    def state(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_state(cls, state):
+        detector = cls()
+        for name, value in zip(cls.__slots__, state):
+            setattr(detector, name, value)
+        return detector
+
+
+class ChangeDetector:
+    """Watches every server's results for lasting shifts in speed or latency.
+
+    Each server and watched metric has its own Cusum, so a new result costs
+    O(1) however long the history is. The detectors and the time of the last
+    result they saw are saved with dump() and restored with load(), so after
+    a restart only results newer than that have to be read.
+    """
+
+    def __init__(self):
+        self.detectors = {}
+        self.last_timestamp = None
+
+    def add(self, result, timestamp=None):
+        """Add a result dict. Returns the changes it completes as dicts."""
+        if timestamp is None:
+            timestamp = time.time()
+        self.last_timestamp = timestamp
+
+        changes = []
+        server_id = result.get("server_id")
+        for metric in WATCHED:
+            value = result.get(metric)
+            if value is None:
+                continue
+            detector = self.detectors.get((server_id, metric))
+            if detector is None:
+                detector = self.detectors[(server_id, metric)] = Cusum()
+            change = detector.add(value, timestamp)
+            if change is not None:
+                since, before, after = change
+                changes.append({"timestamp": since, "detected": timestamp,
+                                "server_id": server_id, "server": result.get("server"),
+                                "metric": metric, "before": before, "after": after})
+        return changes
+
+    def add_rows(self, rows):
+        """Add history rows, oldest first. Returns the changes they complete.
+
+        Rows at or before the last result already seen are skipped.
+        """
+        changes = []
+        last = self.last_timestamp
+        for row in rows:
+            if last is not None and row[TIMESTAMP] <= last:
+                continue
+            result = {metric: row[column] for metric, column in METRIC_COLUMNS.items()}
+            result["server_id"] = row[SERVER_ID]
+            result["server"] = row[SERVER]
+            changes.extend(self.add(result, row[TIMESTAMP]))
+        return changes
+
+    def dump(self):
+        return json.dumps({
+            "version": STATE_VERSION,
+            "last_timestamp": self.last_timestamp,
+            "detectors": [[server_id, metric, detector.state()]
+                          for (server_id, metric), detector in self.detectors.items()],
+        }, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, text):
+        """A detector restored from dump()'s output, or a new one if text is None"""
+        detector = cls()
+        if text is None:
+            return detector
+        state = json.loads(text)
+        if state.get("version") != STATE_VERSION:
+            return detector
+        detector.last_timestamp = state["last_timestamp"]
+        for server_id, metric, values in state["detectors"]:
+            detector.detectors[(server_id, metric)] = Cusum.from_state(values)
+        return detector
+
+
+def describe(change):
+    """A one-line description of a change, for notifications and tooltips"""
+    name, unit, rise_is_better = WATCHED[change["metric"]]
+    before, after = change["before"], change["after"]
+    if (after > before) == rise_is_better:
+        verb = "improved"
+    else:
+        verb = "got worse"
+    server = change["server"] or "the server"
+    return f"{name} to {server} {verb}: {before:.1f} → {after:.1f} {unit}"
@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+# Places the Speedtest CLI is looked for, in order, before falling back to PATH
+SEARCH_PATHS = [
+    "./ookla-speedtest-gui/speedtest",
+    "ookla-speedtest/speedtest",  # No leading ./
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                 "ookla-speedtest-gui", "speedtest"),  # Next to the application
+    "/home/macuseri686/ookla-speedtest-gui/speedtest",  # Full path
+]
+
+log = logging.getLogger(__name__)
+
+# Command line options we check for in the CLI's --help output
+CAPABILITY_FLAGS = {
+    "progress": "--progress",
+    "server_id": "--server-id",
+    "servers": "--servers",
+    "accept_license": "--accept-license",
+    "accept_gdpr": "--accept-gdpr",
+}
+
+# Names or paths a specific binary, e.g. tools/fake_speedtest.py for tests
+BINARY_ENV = "SPEEDTEST_BINARY"
+
+PROBE_TIMEOUT = 5
+CACHE_VERSION = 1
+
+
+class CliError(Exception):
+    pass
+
+
+class SpeedtestCli:
+    """A located Speedtest CLI binary together with its probed version"""
+
+    def __init__(self, path, version, capabilities, mtime_ns, size):
+        self.path = path
+        self.version = version
+        self.capabilities = set(capabilities)
+        self.mtime_ns = mtime_ns
+        self.size = size
+
+    def matches(self, stat):
+        """Whether stat still describes the binary that was probed"""
+        return stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+
+    def supports(self, capability):
+        return capability in self.capabilities
+
+    def to_dict(self):
+        return {
+            "path": self.path,
+            "version": self.version,
+            "capabilities": sorted(self.capabilities),
+            "mtime_ns": self.mtime_ns,
+            "size": self.size,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["path"], data["version"], data["capabilities"],
+                   data["mtime_ns"], data["size"])
+
+
+def cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "speedtest-gui")
+
+
+def cache_path():
+    return os.path.join(cache_dir(), "cli.json")
+
+
+def locate(binary=None):
+    """Return the absolute path of the Speedtest CLI, or None.
+
+    binary, a path or a command name, is used instead of searching when
+    given.
+    """
+    if binary:
+        if os.sep not in binary:
+            binary = shutil.which(binary)
+        if binary and os.path.isfile(binary):
+            return os.path.abspath(binary)
+        return None
+
+    for path in SEARCH_PATHS:
+        if os.path.isfile(path):
+            return os.path.abspath(path)
+
+    path = shutil.which("speedtest")
+    if path:
+        return os.path.abspath(path)
+    return None
+
+
+def probe(path):
+    """Run the CLI to find out its version and supported options"""
+    try:
+        version_check = subprocess.run([path, "--version"], capture_output=True,
+                                       text=True, timeout=PROBE_TIMEOUT)
+    except Exception as e:
+        raise CliError(f"Failed to run speedtest command: {str(e)}")
+
+    if version_check.returncode != 0:
+        raise CliError(f"Speedtest CLI not working properly: {version_check.stderr}")
+
+    help_text = ""
+    try:
+        help_check = subprocess.run([path, "--help"], capture_output=True,
+                                    text=True, timeout=PROBE_TIMEOUT)
+        help_text = help_check.stdout + help_check.stderr
+    except Exception:
+        pass
+
+    return from_probe(path, version_check.stdout, help_text)
+
+
+def from_probe(path, version_output, help_text):
+    """The CLI at path, from the output of its --version and --help"""
+    match = re.search(r"\d+(?:\.\d+)+", version_output)
+    version = match.group(0) if match else version_output.strip()
+
+    capabilities = {capability for capability, flag in CAPABILITY_FLAGS.items()
+                    if flag in help_text}
+
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        raise CliError(f"Failed to run speedtest command: {str(e)}")
+    return SpeedtestCli(path, version, capabilities, stat.st_mtime_ns, stat.st_size)
+
+
+def load_cache():
+    try:
+        with open(cache_path()) as f:
+            data = json.load(f)
+        if data.get("version") != CACHE_VERSION:
+            return {}
+        return data.get("entries", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(entries):
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        temp_path = cache_path() + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"version": CACHE_VERSION, "entries": entries}, f)
+        os.replace(temp_path, cache_path())
+    except OSError:
+        pass
+
+
+_lock = threading.Lock()
+_cli = None
+_cli_binary = None  # The binary that _cli was located for
+
+
+def get_cli(binary=None):
+    """Return the Speedtest CLI, probing it only when it has changed.
+
+    binary selects a specific executable; by default the SPEEDTEST_BINARY
+    environment variable is used, or the CLI is searched for. The result
+    is cached in memory for the life of the process and on disk across
+    runs, keyed on the binary's path, mtime and size. Only a stat() is
+    needed when the cache is valid. Raises CliError when no working CLI
+    is found.
+    """
+    binary = binary or os.environ.get(BINARY_ENV) or None
+
+    with _lock:
+        cli, path = _find(binary)
+        if cli is None:
+            cli = probe(path)
+            _remember(cli, binary)
+        return cli
+
+
+def find_cli(binary=None):
+    """Return (cli, path) without running the CLI.
+
+    cli is the cached SpeedtestCli if it still matches the binary at path,
+    or None if the binary at path has to be probed first, which callers
+    that mustn't block can do themselves and pass to remember(). Raises
+    CliError when no CLI is found.
+    """
+    binary = binary or os.environ.get(BINARY_ENV) or None
+    with _lock:
+        return _find(binary)
+
+
+def remember(cli, binary=None):
+    """Cache a CLI probed by the caller, as found for binary"""
+    binary = binary or os.environ.get(BINARY_ENV) or None
+    with _lock:
+        _remember(cli, binary)
+
+
+def _find(binary):
+    global _cli, _cli_binary
+
+    # Fast path: the binary found earlier in this process is unchanged
+    if _cli is not None and _cli_binary == binary:
+        try:
+            if _cli.matches(os.stat(_cli.path)):
+                return _cli, _cli.path
+        except OSError:
+            pass
+
+    path = locate(binary)
+    if path is None and binary:
+        raise CliError(f"Speedtest CLI not found at {binary}")
+    if path is None:
+        raise CliError("Speedtest CLI not found. Place the speedtest binary in the "
+                       "ookla-speedtest-gui directory or add it to your PATH")
+
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        raise CliError(f"Failed to run speedtest command: {str(e)}")
+
+    entry = load_cache().get(path)
+    if entry is not None:
+        try:
+            cli = SpeedtestCli.from_dict(entry)
+        except (KeyError, TypeError):
+            cli = None
+        if cli is not None and cli.matches(stat):
+            _cli, _cli_binary = cli, binary
+            return cli, path
+
+    return None, path
+
+
+def _remember(cli, binary):
+    global _cli, _cli_binary
+
+    entries = load_cache()
+    entries[cli.path] = cli.to_dict()
+    save_cache(entries)
+    _cli, _cli_binary = cli, binary
+
+
+def revalidate_in_background():
+    """Warm or refresh the cache on a background thread"""
+    def revalidate():
+        try:
+            get_cli()
+        except CliError as e:
+            log.warning("Speedtest CLI check failed: %s", e)
+
+    thread = threading.Thread(target=revalidate)
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -0,0 +1,179 @@
+import gi
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib
+
+import threading
+import time
+
+
+class ProgressCoalescer:
+    """Merge progress updates from a worker thread into one flush per frame.
+
+    Worker threads call push() for every event. Only the latest value per
+    phase is kept, and the pending values are delivered on the main loop at
+    most once per frame of the attached widget's frame clock. Without a
+    mapped widget, or when max_rate is set, flushes are throttled to
+    max_rate per second instead.
+
+    With a LatencyTracker as tracker, every delivered update that was
+    pushed with its read time is timed through dispatch and handling.
+
+    throttle() switches to a slow timer while the attached widget can't be
+    seen, since its frame clock may keep ticking for nothing or stop.
+    """
+
+    DEFAULT_RATE = 60
+
+    def __init__(self, callback, max_rate=None):
+        self.callback = callback
+        self.max_rate = max_rate
+
+        self.widget = None
+        self.tracker = None
+        self.throttle_rate = None
+        self.received = 0
+        self.delivered = 0
+        self.flushes = 0
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._scheduled = False
+        self._tick_id = 0
+        self._timeout_id = 0
+        self._last_flush = 0.0
+
+    def attach(self, widget):
+        """Drive flushes from widget's frame clock"""
+        self.widget = widget
+        widget.connect("unmap", self.on_widget_unmap)
+
+    def detach(self):
+        widget = self.widget
+        self.widget = None
+        if widget is not None and self._tick_id:
+            widget.remove_tick_callback(self._tick_id)
+            self._tick_id = 0
+            self._arm()
+
+    def on_widget_unmap(self, widget):
+        # Frame clock ticks stop while unmapped, so fall back to the timer
+        if self._tick_id:
+            widget.remove_tick_callback(self._tick_id)
+            self._tick_id = 0
+            self._arm()
+
+    def throttle(self, rate):
+        """Flush at most rate times a second from a timer, or per frame again if None"""
+        self.throttle_rate = rate
+        if self._tick_id:
+            self.widget.remove_tick_callback(self._tick_id)
+            self._tick_id = 0
+        if self._timeout_id:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = 0
+        self._arm()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "received": self.received,
+            "delivered": self.delivered,
+            "merged": self.received - self.delivered - pending,
+            "flushes": self.flushes,
+        }
+
+    def reset_stats(self):
+        """Clear the counters. Call between runs, once nothing is pending."""
+        self.received = 0
+        self.delivered = 0
+        self.flushes = 0
+
+    def push(self, phase, value, status, read_at=None):
+        """Queue an update, replacing any pending value for the same phase.
+
+        read_at is the time.monotonic() at which the update was read, for
+        the latency tracker. Safe to call from any thread.
+        """
+        with self._lock:
+            # Re-insert so that pending phases are delivered in the order
+            # they were last updated
+            self._pending.pop(phase, None)
+            self._pending[phase] = (value, status, read_at)
+            self.received += 1
+
+            if self._scheduled:
+                return
+            self._scheduled = True
+
+        GLib.idle_add(self._arm)
+
+    def flush(self):
+        """Deliver all pending updates now. Must be called on the main loop."""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._scheduled = False
+
+        self._cancel_sources()
+        if not pending:
+            return
+
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+        self.delivered += len(pending)
+        tracker = self.tracker
+        for phase, (value, status, read_at) in pending.items():
+            if tracker is None or read_at is None:
+                self.callback(phase, value, status)
+                continue
+            dispatched_at = time.monotonic()
+            self.callback(phase, value, status)
+            tracker.delivered(read_at, dispatched_at, time.monotonic())
+
+    def discard(self):
+        """Drop pending updates without delivering them"""
+        with self._lock:
+            self._pending = {}
+            self._scheduled = False
+
+        self._cancel_sources()
+
+    def _min_interval(self):
+        return 1.0 / (self.throttle_rate or self.max_rate or self.DEFAULT_RATE)
+
+    def _arm(self):
+        with self._lock:
+            if not self._scheduled:
+                return GLib.SOURCE_REMOVE
+
+        if self.widget is not None and self.widget.get_mapped() and self.throttle_rate is None:
+            if not self._tick_id:
+                self._tick_id = self.widget.add_tick_callback(self._on_tick)
+        elif not self._timeout_id:
+            delay = self._min_interval() - (time.monotonic() - self._last_flush)
+            self._timeout_id = GLib.timeout_add(max(int(delay * 1000), 0), self._on_timeout)
+
+        return GLib.SOURCE_REMOVE
+
+    def _on_tick(self, widget, frame_clock):
+        if self.max_rate and time.monotonic() - self._last_flush < self._min_interval():
+            return GLib.SOURCE_CONTINUE
+
+        self._tick_id = 0
+        self.flush()
+        return GLib.SOURCE_REMOVE
+
+    def _on_timeout(self):
+        self._timeout_id = 0
+        self.flush()
+        return GLib.SOURCE_REMOVE
+
+    def _cancel_sources(self):
+        if self._tick_id:
+            if self.widget is not None:
+                self.widget.remove_tick_callback(self._tick_id)
+            self._tick_id = 0
+        if self._timeout_id:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = 0
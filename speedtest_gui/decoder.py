@@ -0,0 +1,218 @@
+import json
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    loads = orjson.loads
+    JSON_BACKEND = "orjson"
+else:
+    loads = json.loads
+    JSON_BACKEND = "json"
+
+JSON_ERRORS = (ValueError, TypeError)
+
+BITS_PER_MEGABIT = 1_000_000
+
+
+class TestStartEvent:
+    __slots__ = ("server_id", "server_name", "server_location", "isp")
+
+    type = "testStart"
+
+    def __init__(self, server_id, server_name, server_location, isp):
+        self.server_id = server_id
+        self.server_name = server_name
+        self.server_location = server_location
+        self.isp = isp
+
+
+class PingEvent:
+    __slots__ = ("progress", "latency", "jitter")
+
+    type = "ping"
+
+    def __init__(self, progress, latency, jitter):
+        self.progress = progress
+        self.latency = latency
+        self.jitter = jitter
+
+
+class BandwidthEvent:
+    __slots__ = ("type", "bandwidth", "bytes", "elapsed", "progress")
+
+    def __init__(self, type, bandwidth, bytes, elapsed, progress):
+        self.type = type
+        self.bandwidth = bandwidth
+        self.bytes = bytes
+        self.elapsed = elapsed
+        self.progress = progress
+
+    @property
+    def mbps(self):
+        # Bandwidth is reported in bytes/s
+        return self.bandwidth * 8 / BITS_PER_MEGABIT
+
+
+class ResultEvent:
+    __slots__ = ("data",)
+
+    type = "result"
+
+    def __init__(self, data):
+        self.data = data
+
+
+class LogEvent:
+    __slots__ = ("level", "message")
+
+    type = "log"
+
+    def __init__(self, level, message):
+        self.level = level
+        self.message = message
+
+
+def format_location(server):
+    """Combine a server's location and country, e.g. "Portland, OR, United States" """
+    location = server.get("location", "Unknown")
+    country = server.get("country", "")
+    if location and country and location != country:
+        return f"{location}, {country}"
+    if not location and country:
+        return country
+    return location
+
+
+def _test_start(data):
+    server = data.get("server") or {}
+    return TestStartEvent(server.get("id"), server.get("name", "Unknown"),
+                          format_location(server), data.get("isp", "Unknown"))
+
+
+def _ping(data):
+    ping = data["ping"]
+    return PingEvent(ping.get("progress", 0), ping.get("latency", 0), ping.get("jitter", 0))
+
+
+def _download(data):
+    download = data["download"]
+    return BandwidthEvent("download", download["bandwidth"], download.get("bytes", 0),
+                          download.get("elapsed", 0), download.get("progress", 0))
+
+
+def _upload(data):
+    upload = data["upload"]
+    return BandwidthEvent("upload", upload["bandwidth"], upload.get("bytes", 0),
+                          upload.get("elapsed", 0), upload.get("progress", 0))
+
+
+def _result(data):
+    return ResultEvent(data)
+
+
+def _log(data):
+    return LogEvent(data.get("level", "info"), data.get("message", ""))
+
+
+# Event type -> record constructor
+HANDLERS = {
+    "testStart": _test_start,
+    "ping": _ping,
+    "download": _download,
+    "upload": _upload,
+    "result": _result,
+    "log": _log,
+}
+
+
+def decode_data(data):
+    """Turn a parsed JSON object into an event record, or None"""
+    handler = HANDLERS.get(data.get("type")) if isinstance(data, dict) else None
+    if handler is None:
+        return None
+    try:
+        return handler(data)
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
+def decode_line(line):
+    """Decode one NDJSON line (bytes or str) into an event record.
+
+    Returns None for malformed JSON and event types that are not handled.
+    """
+    try:
+        data = loads(line)
+    except JSON_ERRORS:
+        return None
+    return decode_data(data)
+
+
+class StreamDecoder:
+    """Iterate over the events in the CLI's NDJSON output.
+
+    The CLI writes one JSON object per line when run with --format=json
+    --progress=yes. The stream is read in binary mode into a reusable
+    buffer, split into lines and each line is turned into a small event
+    record through the HANDLERS table. Lines of other types are skipped.
+
+    The stream must provide readinto(), as unbuffered pipes and files do.
+    Each readinto() returns as soon as some data is available, so events
+    are produced as the CLI writes them. If output is an OutputRing every
+    raw line is recorded in it. last_read is the time.monotonic() of the
+    last read that returned data, whether or not it held an event.
+    """
+
+    def __init__(self, stream, buffer_size=65536, output=None):
+        self.stream = stream
+        self.output = output
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.lines = 0
+        self.malformed = 0
+        self.last_read = time.monotonic()
+
+    def __iter__(self):
+        stream = self.stream
+        buffer = self.buffer
+        view = self.view
+        pending = bytearray()
+
+        while True:
+            count = stream.readinto(buffer)
+            if not count:
+                break
+            self.last_read = time.monotonic()
+
+            pending += view[:count]
+            start = 0
+            end = pending.find(b"\n", start)
+            while end >= 0:
+                if end > start:
+                    event = self.decode(pending[start:end])
+                    if event is not None:
+                        yield event
+                start = end + 1
+                end = pending.find(b"\n", start)
+            del pending[:start]
+
+        # A final line without a trailing newline
+        if pending.strip():
+            event = self.decode(pending)
+            if event is not None:
+                yield event
+
+    def decode(self, line):
+        self.lines += 1
+        if self.output is not None:
+            self.output.record("stdout", line)
+        try:
+            data = loads(line)
+        except JSON_ERRORS:
+            self.malformed += 1
+            return None
+        return decode_data(data)
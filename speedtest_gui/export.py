@@ -0,0 +1,181 @@
+import csv
+import datetime
+import importlib.util
+import json
+import os
+
+from .history import COLUMNS
+
+# Rows are read and, for Parquet, written in batches of this many
+BATCH_SIZE = 10_000
+
+# How often progress is reported, in rows
+PROGRESS_INTERVAL = 5_000
+
+FORMATS = {
+    "csv": "CSV",
+    "jsonl": "JSON Lines",
+    "parquet": "Parquet",
+}
+
+EXTENSIONS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".parquet": "parquet",
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def parquet_available():
+    # Checked without importing pyarrow, which is slow to load
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def available_formats():
+    return [name for name in FORMATS if name != "parquet" or parquet_available()]
+
+
+def format_for_path(path):
+    """The format matching path's extension, or None"""
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def parse_time(text):
+    """Parse a Unix time or an ISO 8601 date or date and time, local by default"""
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise ExportError(f"Not a date or time: {text}")
+
+
+def iso_time(timestamp):
+    # UTC, as in Parquet files, and much cheaper than looking up the local zone
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(
+        timespec="seconds")
+
+
+def raw_json(raw):
+    return json.dumps(raw, separators=(",", ":")) if raw is not None else None
+
+
+def write_csv(rows, f, raw=False):
+    writer = csv.writer(f)
+    writer.writerow(COLUMNS + ("raw",) if raw else COLUMNS)
+    for row in rows:
+        if raw:
+            row = row[:-1] + (raw_json(row[-1]),)
+        writer.writerow((iso_time(row[0]),) + row[1:])
+
+
+def write_jsonl(rows, f, raw=False):
+    dumps = json.dumps
+    columns = COLUMNS + ("raw",) if raw else COLUMNS
+    for row in rows:
+        record = dict(zip(columns, row))
+        record["timestamp"] = iso_time(row[0])
+        f.write(dumps(record, separators=(",", ":")) + "\n")
+
+
+def write_parquet(rows, path, raw=False):
+    import pyarrow
+    import pyarrow.parquet
+
+    schema = pyarrow.schema([
+        ("timestamp", pyarrow.timestamp("ms", tz="UTC")),
+        ("server_id", pyarrow.int64()),
+        ("server", pyarrow.string()),
+        ("server_location", pyarrow.string()),
+        ("isp", pyarrow.string()),
+        ("download", pyarrow.float64()),
+        ("upload", pyarrow.float64()),
+        ("ping", pyarrow.float64()),
+        ("jitter", pyarrow.float64()),
+        ("packet_loss", pyarrow.float64()),
+        ("result_url", pyarrow.string()),
+    ] + ([("raw", pyarrow.string())] if raw else []))
+
+    def write_batch(writer, batch):
+        columns = [list(column) for column in zip(*batch)]
+        columns[0] = [int(timestamp * 1000) for timestamp in columns[0]]
+        if raw:
+            columns[-1] = [raw_json(value) for value in columns[-1]]
+        writer.write_batch(pyarrow.record_batch(columns, schema=schema))
+
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                write_batch(writer, batch)
+                batch = []
+        if batch:
+            write_batch(writer, batch)
+
+
+def export(store, path, format=None, since=None, until=None, server_id=None,
+           progress=None, cancelled=None, raw=False):
+    """Write the results in store matching the filters to path.
+
+    Rows stream from the database to the file, so memory use doesn't grow
+    with the number of rows. With raw, a last column holds the CLI's full
+    result as JSON, decoded only now. progress(written, total) is called every
+    PROGRESS_INTERVAL rows and once at the end. When cancelled() returns
+    True the export stops with ExportCancelled. The file is written under
+    a temporary name and only replaces path once complete. Returns the
+    number of rows written.
+    """
+    format = format or format_for_path(path) or "csv"
+    if format not in FORMATS:
+        raise ExportError(f"Unknown export format: {format}")
+    if format == "parquet" and not parquet_available():
+        raise ExportError("Exporting to Parquet needs pyarrow")
+
+    total = store.count(since, until, server_id)
+    written = 0
+
+    def tracked(rows):
+        nonlocal written
+        for row in rows:
+            yield row
+            written += 1
+            if written % PROGRESS_INTERVAL == 0:
+                if cancelled is not None and cancelled():
+                    raise ExportCancelled()
+                if progress is not None:
+                    progress(written, total)
+
+    rows = tracked(store.iter_rows(since, until, server_id, batch_size=BATCH_SIZE, raw=raw))
+    partial = path + ".part"
+    try:
+        if format == "parquet":
+            write_parquet(rows, partial, raw)
+        else:
+            with open(partial, "w", newline="" if format == "csv" else None,
+                      encoding="utf-8") as f:
+                if format == "csv":
+                    write_csv(rows, f, raw)
+                else:
+                    write_jsonl(rows, f, raw)
+        os.replace(partial, path)
+    except BaseException:
+        try:
+            os.unlink(partial)
+        except OSError:
+            pass
+        raise
+
+    if progress is not None:
+        progress(written, total)
+    return written
@@ -0,0 +1,192 @@
+import gi
+gi.require_version('Gtk', '4.0')
+gi.require_version('Adw', '1')
+from gi.repository import Gtk, Adw, GLib
+
+import logging
+import threading
+import time
+
+from .export import FORMATS, ExportCancelled, ExportError, available_formats, export
+
+# Choices for which results to export, as (title, seconds back or None)
+PERIODS = (
+    ("All results", None),
+    ("Last 24 hours", 24 * 3600),
+    ("Last 7 days", 7 * 24 * 3600),
+    ("Last 30 days", 30 * 24 * 3600),
+    ("Last year", 365 * 24 * 3600),
+)
+
+log = logging.getLogger(__name__)
+
+
+class ExportWindow(Adw.Window):
+    """Exports the result history to a file in the background"""
+    __gtype_name__ = 'ExportWindow'
+
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.set_title("Export Results")
+        self.set_default_size(480, 420)
+
+        self.store = store
+        self.formats = available_formats()
+        self.job = None
+        self.chooser = None
+
+        self.format_row = Adw.ComboRow(title="Format")
+        self.format_row.set_model(Gtk.StringList.new([FORMATS[name] for name in self.formats]))
+        self.period_row = Adw.ComboRow(title="Results")
+        self.period_row.set_model(Gtk.StringList.new([title for title, _ in PERIODS]))
+        self.server_entry = Adw.EntryRow(title="Server ID (all servers if empty)")
+        self.raw_switch = Gtk.Switch(valign=Gtk.Align.CENTER)
+        raw_row = Adw.ActionRow(title="Full CLI results",
+                                subtitle="Add everything the Speedtest CLI reported as JSON")
+        raw_row.add_suffix(self.raw_switch)
+        raw_row.set_activatable_widget(self.raw_switch)
+
+        settings_group = Adw.PreferencesGroup()
+        settings_group.add(self.format_row)
+        settings_group.add(self.period_row)
+        settings_group.add(self.server_entry)
+        settings_group.add(raw_row)
+
+        self.progress_bar = Gtk.ProgressBar(visible=False, show_text=True)
+        self.status_label = Gtk.Label(wrap=True, justify=Gtk.Justification.CENTER)
+        self.status_label.add_css_class("dim-label")
+
+        self.export_button = Gtk.Button(label="Export…", halign=Gtk.Align.CENTER)
+        self.export_button.add_css_class("suggested-action")
+        self.export_button.add_css_class("pill")
+        self.export_button.connect("clicked", self.on_export_clicked)
+
+        self.cancel_button = Gtk.Button(label="Cancel", halign=Gtk.Align.CENTER, visible=False)
+        self.cancel_button.add_css_class("destructive-action")
+        self.cancel_button.add_css_class("pill")
+        self.cancel_button.connect("clicked", self.on_cancel_clicked)
+
+        buttons = Gtk.Box(spacing=12, halign=Gtk.Align.CENTER)
+        buttons.append(self.export_button)
+        buttons.append(self.cancel_button)
+
+        content = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=24)
+        content.append(settings_group)
+        content.append(buttons)
+        content.append(self.progress_bar)
+        content.append(self.status_label)
+
+        clamp = Adw.Clamp(maximum_size=800, margin_top=24, margin_bottom=24,
+                          margin_start=12, margin_end=12)
+        clamp.set_child(content)
+
+        toolbar = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        toolbar.append(Adw.HeaderBar())
+        toolbar.append(clamp)
+        self.set_content(toolbar)
+
+        self.connect("close-request", self.on_close_request)
+
+    def selected_format(self):
+        return self.formats[self.format_row.get_selected()]
+
+    def parse_server_id(self):
+        """The server ID entered, None for all servers, or False if invalid"""
+        text = self.server_entry.get_text().strip()
+        if not text:
+            return None
+        return int(text) if text.isdigit() else False
+
+    def on_export_clicked(self, button):
+        server_id = self.parse_server_id()
+        if server_id is False:
+            self.server_entry.add_css_class("error")
+            return
+        self.server_entry.remove_css_class("error")
+
+        format = self.selected_format()
+        self.chooser = Gtk.FileChooserNative(title="Export Results", transient_for=self,
+                                             action=Gtk.FileChooserAction.SAVE,
+                                             modal=True)
+        self.chooser.set_current_name(f"speedtest-results.{format}")
+        self.chooser.connect("response", self.on_chooser_response, format, server_id)
+        self.chooser.show()
+
+    def on_chooser_response(self, chooser, response, format, server_id):
+        self.chooser = None
+        if response != Gtk.ResponseType.ACCEPT:
+            return
+        path = chooser.get_file().get_path()
+
+        seconds = PERIODS[self.period_row.get_selected()][1]
+        since = time.time() - seconds if seconds is not None else None
+
+        # Results still waiting to be written would be missing otherwise
+        self.store.flush()
+
+        job = threading.Event()
+        self.job = job
+        self.export_button.set_visible(False)
+        self.cancel_button.set_visible(True)
+        self.progress_bar.set_fraction(0)
+        self.progress_bar.set_text(None)
+        self.progress_bar.set_visible(True)
+        self.status_label.set_text(f"Exporting to {GLib.path_get_basename(path)}…")
+
+        thread = threading.Thread(target=self.run_export,
+                                  args=(job, path, format, since, server_id,
+                                        self.raw_switch.get_active()))
+        thread.daemon = True
+        thread.start()
+
+    def on_cancel_clicked(self, button):
+        if self.job is not None:
+            self.job.set()
+        self.cancel_button.set_sensitive(False)
+
+    def on_close_request(self, window):
+        if self.job is not None:
+            self.job.set()
+        return False
+
+    def run_export(self, job, path, format, since, server_id, raw):
+        # job is set when the export is cancelled
+        def progress(written, total):
+            GLib.idle_add(self.on_export_progress, job, written, total)
+
+        message = "Export failed"
+        try:
+            rows = export(self.store, path, format, since=since, server_id=server_id,
+                          progress=progress, cancelled=job.is_set, raw=raw)
+            message = f"Exported {rows:,} results to {path}"
+        except ExportCancelled:
+            message = "Export cancelled"
+        except (ExportError, OSError) as e:
+            message = f"Export failed: {e}"
+        except Exception as e:
+            # Reading the history or writing the file can fail in other ways
+            log.exception("Could not export to %s", path)
+            message = f"Export failed: {e}"
+        finally:
+            # The window would stay in the exporting state otherwise
+            GLib.idle_add(self.on_export_finished, job, message)
+
+    # Called on the main loop
+
+    def on_export_progress(self, job, written, total):
+        if job is self.job and total:
+            self.progress_bar.set_fraction(min(written / total, 1.0))
+            self.progress_bar.set_text(f"{written:,} of {total:,}")
+        return GLib.SOURCE_REMOVE
+
+    def on_export_finished(self, job, message):
+        if job is not self.job:
+            return GLib.SOURCE_REMOVE
+
+        self.job = None
+        self.export_button.set_visible(True)
+        self.cancel_button.set_visible(False)
+        self.cancel_button.set_sensitive(True)
+        self.progress_bar.set_visible(False)
+        self.status_label.set_text(message)
+        return GLib.SOURCE_REMOVE
@@ -0,0 +1,319 @@
+import gi
+gi.require_version('Gtk', '4.0')
+gi.require_version('Adw', '1')
+gi.require_version('Graphene', '1.0')
+from gi.repository import Gtk, Adw, GLib, Graphene
+
+import math
+import cairo
+
+# Geometry of the gauge in its own 300x300 coordinate space. The widget scales
+# this box to whatever size it is allocated.
+VIEW_SIZE = 300
+CENTER = 150
+RADIUS = 100
+STROKE_WIDTH = 20
+MAX_ANGLE = 270                          # Leave a 90-degree opening at the bottom
+START_ANGLE = 270 - (MAX_ANGLE / 2)      # Start from the left side
+
+TICK_INNER_LENGTH = 5
+TICK_OUTER_LENGTH = 15
+MINOR_TICK_OUTER_LENGTH = 7
+TICK_WIDTH = 2
+LABEL_DISTANCE = 10
+LABEL_FONT_SIZE = 12
+
+# The gauge starts out linear up to LINEAR_MAX Mbps. Faster links switch it
+# to a log scale from LOG_MIN to the next power of ten.
+LINEAR_MAX = 500
+LINEAR_TICK_STEP = 50
+LOG_MIN = 1
+
+# Stiffness of the critically damped spring the value follows, in rad/s. It
+# settles within about 5 / SPRING_RATE seconds.
+SPRING_RATE = 14.0
+
+# The animation stops once the value is this close to its target, in Mbps,
+# and moving slower than this per second
+SETTLE_DISTANCE = 0.05
+SETTLE_SPEED = 0.5
+
+PHASE_GRADIENTS = {
+    "download": ((0x00, 0x66, 0xcc), (0x00, 0xcc, 0xff)),
+    "upload": ((0xff, 0x66, 0x00), (0xff, 0xcc, 0x00)),
+}
+IDLE_GRADIENT = ((0x88, 0x88, 0x88), (0xcc, 0xcc, 0xcc))
+
+# Track and tick colours for light and dark styles
+THEME_COLORS = {
+    False: {"track": (0xe0, 0xe0, 0xe0), "tick": (0x66, 0x66, 0x66)},
+    True: {"track": (0x44, 0x44, 0x44), "tick": (0xaa, 0xaa, 0xaa)},
+}
+
+
+def rgb(color):
+    return tuple(channel / 255 for channel in color)
+
+
+def spring_step(displacement, velocity, rate, dt):
+    """Advance a critically damped spring by dt seconds.
+
+    displacement is the distance from the target. This is the exact
+    solution rather than an integration step, so it is stable for any frame
+    interval, including a long gap after the window was hidden. Returns the
+    new displacement and velocity.
+    """
+    decay = math.exp(-rate * dt)
+    slope = velocity + rate * displacement
+    return ((displacement + slope * dt) * decay,
+            (velocity - rate * slope * dt) * decay)
+
+
+class GaugeScale:
+    """Maps speeds to a share of the gauge's arc, linear or logarithmic.
+
+    A linear scale ends at LINEAR_MAX. Once a speed doesn't fit, fit()
+    switches to a log scale that ends at the next power of ten, so the
+    gauge is never pinned at its end and slow speeds stay readable. The
+    scale never shrinks again, so it doesn't jump between tests.
+    """
+
+    def __init__(self):
+        self.log = False
+        self.maximum = LINEAR_MAX
+
+    @property
+    def key(self):
+        return (self.log, self.maximum)
+
+    def fit(self, value):
+        """Grow to show value. Returns True if the scale changed."""
+        if value <= self.maximum:
+            return False
+        self.log = True
+        self.maximum = 10 ** math.ceil(math.log10(value))
+        return True
+
+    def fraction(self, value):
+        if not self.log:
+            return min(max(value / self.maximum, 0.0), 1.0)
+        if value <= LOG_MIN:
+            return 0.0
+        share = math.log10(value / LOG_MIN) / math.log10(self.maximum / LOG_MIN)
+        return min(share, 1.0)
+
+    def ticks(self):
+        """(value, label) for every tick; minor ticks have no label"""
+        if not self.log:
+            return [(value, str(value)) for value in range(0, self.maximum + 1, LINEAR_TICK_STEP)]
+        ticks = []
+        decade = LOG_MIN
+        while decade < self.maximum:
+            ticks.append((decade, format_speed(decade)))
+            ticks.append((2 * decade, None))
+            ticks.append((5 * decade, None))
+            decade *= 10
+        ticks.append((decade, format_speed(decade)))
+        return ticks
+
+
+def format_speed(mbps):
+    if mbps >= 1000:
+        return f"{mbps // 1000}G"
+    return str(mbps)
+
+
+class SpeedGauge(Gtk.Widget):
+    """Speed gauge drawn directly with Cairo.
+
+    The track, tick marks and labels only depend on the widget size, the
+    colour scheme and the scale, so they are recorded once into a render
+    node and reused. Each frame only redraws the value arc.
+
+    New values are targets: the arc follows them on a critically damped
+    spring, driven by a tick callback, so it moves at the display's refresh
+    rate however often values arrive. The tick callback is removed once the
+    arc has settled, so an idle gauge costs nothing.
+    """
+    __gtype_name__ = 'SpeedGauge'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.value = 0.0      # Latest speed set, in Mbps
+        self.shown = 0.0      # Speed the arc currently shows
+        self.velocity = 0.0   # Of shown, in Mbps per second
+        self.phase = "idle"
+        self.scale = GaugeScale()
+
+        self._tick_id = 0
+        self._last_frame_time = 0
+
+        self._static_node = None
+        self._static_key = None
+
+        self._style_manager = Adw.StyleManager.get_default()
+        self._style_manager.connect("notify::dark", self.on_dark_changed)
+
+    def set_value(self, value, phase, animate=True):
+        """Set the speed in Mbps to move to, and the test phase.
+
+        Without animate the arc jumps straight to value.
+        """
+        if value == self.value and phase == self.phase:
+            return
+
+        self.value = value
+        if phase != self.phase:
+            self.phase = phase
+            self.queue_draw()
+        if self.scale.fit(value):
+            self._static_node = None
+            self.queue_draw()
+
+        if not animate or not self.get_settings().get_property("gtk-enable-animations"):
+            self.shown = value
+            self.velocity = 0.0
+            self.queue_draw()
+        elif not self._tick_id:
+            self._last_frame_time = 0
+            self._tick_id = self.add_tick_callback(self._on_tick)
+
+    def _on_tick(self, widget, frame_clock):
+        now = frame_clock.get_frame_time()
+        # The first frame only sets the start time
+        dt = (now - self._last_frame_time) / 1_000_000 if self._last_frame_time else 0.0
+        self._last_frame_time = now
+
+        displacement, self.velocity = spring_step(self.shown - self.value, self.velocity,
+                                                  SPRING_RATE, dt)
+        self.shown = self.value + displacement
+        settled = abs(displacement) < SETTLE_DISTANCE and abs(self.velocity) < SETTLE_SPEED
+        if settled:
+            self.shown = self.value
+            self.velocity = 0.0
+        self.queue_draw()
+
+        if settled:
+            self._tick_id = 0
+            return GLib.SOURCE_REMOVE
+        return GLib.SOURCE_CONTINUE
+
+    def on_dark_changed(self, style_manager, pspec):
+        self._static_node = None
+        self.queue_draw()
+
+    def do_snapshot(self, snapshot):
+        width = self.get_width()
+        height = self.get_height()
+        if width <= 0 or height <= 0:
+            return
+
+        dark = self._style_manager.get_dark()
+        key = (width, height, dark, self.scale.key)
+        if self._static_node is None or self._static_key != key:
+            self._static_node = self.build_static_node(width, height, dark)
+            self._static_key = key
+
+        if self._static_node is not None:
+            snapshot.append_node(self._static_node)
+
+        percentage = self.scale.fraction(self.shown)
+        if percentage <= 0:
+            return
+
+        cr = snapshot.append_cairo(Graphene.Rect().init(0, 0, width, height))
+        self.transform_to_view(cr, width, height)
+        self.draw_value_arc(cr, percentage)
+
+    def transform_to_view(self, cr, width, height):
+        """Map the 300x300 gauge coordinates onto the widget allocation"""
+        scale = min(width, height) / VIEW_SIZE
+        cr.translate((width - VIEW_SIZE * scale) / 2, (height - VIEW_SIZE * scale) / 2)
+        cr.scale(scale, scale)
+
+    def build_static_node(self, width, height, dark):
+        """Record the track, ticks and labels into a reusable render node"""
+        colors = THEME_COLORS[dark]
+        static = Gtk.Snapshot()
+        cr = static.append_cairo(Graphene.Rect().init(0, 0, width, height))
+        self.transform_to_view(cr, width, height)
+
+        # Tick marks and labels (drawn first so they appear behind the gauge)
+        cr.set_source_rgb(*rgb(colors["tick"]))
+        cr.set_line_width(TICK_WIDTH)
+        cr.select_font_face("sans-serif", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+        cr.set_font_size(LABEL_FONT_SIZE)
+
+        for value, text in self.scale.ticks():
+            fraction = self.scale.fraction(value)
+            tick_angle = START_ANGLE + MAX_ANGLE * fraction
+            tick_rad = math.radians(tick_angle)
+            cos_a = math.cos(tick_rad)
+            sin_a = math.sin(tick_rad)
+
+            outer_length = TICK_OUTER_LENGTH if text is not None else MINOR_TICK_OUTER_LENGTH
+            x1 = CENTER + (RADIUS - TICK_INNER_LENGTH) * cos_a
+            y1 = CENTER + (RADIUS - TICK_INNER_LENGTH) * sin_a
+            x2 = CENTER + (RADIUS + outer_length) * cos_a
+            y2 = CENTER + (RADIUS + outer_length) * sin_a
+
+            cr.move_to(x1, y1)
+            cr.line_to(x2, y2)
+            cr.stroke()
+            if text is None:
+                continue
+
+            # Special case for the middle tick, which is centred and pushed
+            # out a bit further
+            extents = cr.text_extents(text)
+            if abs(fraction - 0.5) < 1e-9:
+                label_x = x2 + (LABEL_DISTANCE + 5) * cos_a - extents.x_advance / 2
+                label_y = y2 + (LABEL_DISTANCE + 5) * sin_a
+            elif 90 <= tick_angle <= 270:  # Left half, anchor at the end
+                label_x = x2 + LABEL_DISTANCE * cos_a - extents.x_advance
+                label_y = y2 + LABEL_DISTANCE * sin_a
+            else:  # Right half, anchor at the start
+                label_x = x2 + LABEL_DISTANCE * cos_a
+                label_y = y2 + LABEL_DISTANCE * sin_a
+
+            cr.move_to(label_x, label_y - (extents.y_bearing + extents.height / 2))
+            cr.show_text(text)
+
+        # Background track (nearly full circle with opening at bottom)
+        cr.set_source_rgb(*rgb(colors["track"]))
+        cr.set_line_width(STROKE_WIDTH)
+        cr.set_line_cap(cairo.LINE_CAP_ROUND)
+        cr.arc(CENTER, CENTER, RADIUS,
+               math.radians(START_ANGLE), math.radians(START_ANGLE + MAX_ANGLE))
+        cr.stroke()
+
+        del cr
+        return static.to_node()
+
+    def draw_value_arc(self, cr, percentage):
+        end_angle = START_ANGLE + MAX_ANGLE * percentage
+        start_rad = math.radians(START_ANGLE)
+        end_rad = math.radians(end_angle)
+
+        # The gradient spans the horizontal extent of the arc itself
+        xs = [math.cos(start_rad), math.cos(end_rad)]
+        if START_ANGLE <= 180 <= end_angle:
+            xs.append(-1.0)
+        if START_ANGLE <= 360 <= end_angle:
+            xs.append(1.0)
+        x0 = CENTER + RADIUS * min(xs)
+        x1 = CENTER + RADIUS * max(xs)
+        if x1 - x0 < 1:
+            x1 = x0 + 1
+
+        start_color, stop_color = PHASE_GRADIENTS.get(self.phase, IDLE_GRADIENT)
+        gradient = cairo.LinearGradient(x0, 0, x1, 0)
+        gradient.add_color_stop_rgb(0, *rgb(start_color))
+        gradient.add_color_stop_rgb(1, *rgb(stop_color))
+
+        cr.set_source(gradient)
+        cr.set_line_width(STROKE_WIDTH)
+        cr.set_line_cap(cairo.LINE_CAP_ROUND)
+        cr.arc(CENTER, CENTER, RADIUS, start_rad, end_rad)
+        cr.stroke()
@@ -0,0 +1,220 @@
+import argparse
+import json
+import sys
+import threading
+import time
+
+from . import cli, log
+from .multi import MultiServerTest
+from .process import MAX_DURATION, STALL_TIMEOUT
+from .session import SpeedtestError, run_speedtest
+
+# Headless mode must stay importable without GTK, Adw or a display. Only
+# import GLib-free modules here.
+
+
+_output_lock = threading.Lock()
+
+
+def write_record(record):
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    with _output_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def result_record(run, result):
+    record = {"type": "result", "run": run, "time": time.time()}
+    record.update(result)
+    # Records keep to the parsed fields; the CLI's full result and the
+    # sample timeline are only saved in the GUI's history
+    del record["raw"]
+    del record["timeline"]
+    return record
+
+
+def run_once(run, server_id, options, metrics=None):
+    """Run a single test, writing its progress and outcome as records"""
+    def progress(phase, value, status):
+        write_record({"type": "progress", "run": run, "time": time.time(),
+                      "phase": phase, "value": value, "status": status})
+
+    if metrics is not None:
+        metrics.test_started()
+    try:
+        result = run_speedtest(progress, server_id=server_id, **options)
+    except SpeedtestError as e:
+        if metrics is not None:
+            metrics.test_failed(str(e))
+        write_record({"type": "error", "run": run, "time": time.time(), "message": str(e),
+                      "output": e.output})
+        return False
+
+    if metrics is not None:
+        metrics.test_completed(result)
+
+    write_record(result_record(run, result))
+    return True
+
+
+def run_multi(run, server_ids, concurrency, options):
+    """Test several servers, writing per-server records and a summary"""
+    def progress(server_id, phase, value, status):
+        write_record({"type": "progress", "run": run, "time": time.time(),
+                      "server_id": server_id, "phase": phase, "value": value, "status": status})
+
+    def finished(server_run):
+        if server_run.result is not None:
+            record = result_record(run, server_run.result)
+        else:
+            record = {"type": "error", "run": run, "time": time.time(),
+                      "server_id": server_run.server_id,
+                      "message": server_run.error or server_run.state,
+                      "output": server_run.output}
+        write_record(record)
+
+    test = MultiServerTest(server_ids, concurrency, progress=progress, finished=finished, **options)
+    aggregate = test.run()
+
+    write_record({"type": "summary", "run": run, "time": time.time(),
+                  "servers": [{"server_id": server["server_id"], "state": server["state"]}
+                              for server in aggregate["servers"]],
+                  "summary": aggregate["summary"]})
+    return aggregate["failed"] == 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python3 -m speedtest_gui --headless",
+        description="Run speed tests without a display and write NDJSON records to stdout."
+    )
+    parser.add_argument("--count", type=int, default=1,
+                        help="Number of tests to run, 0 to run until interrupted (default: 1)")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="Seconds between the start of consecutive tests (default: 0)")
+    parser.add_argument("--server-id", type=int, action="append", dest="server_ids",
+                        help="Test against this server instead of the one the CLI picks. "
+                             "Repeat to test several servers and get a summary")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="How many servers to test at the same time (default: 1)")
+    parser.add_argument("--log-level", choices=log.LEVELS,
+                        help=f"Log messages of at least this level to stderr (default: warning, "
+                             f"or the {log.LOG_ENV} environment variable)")
+    parser.add_argument("--stall-timeout", type=float, default=STALL_TIMEOUT,
+                        help="Abort a test that writes no output for this many seconds, "
+                             f"0 to wait forever (default: {STALL_TIMEOUT:.0f})")
+    parser.add_argument("--timeout", type=float, default=MAX_DURATION,
+                        help="Abort a test that runs longer than this many seconds, "
+                             f"0 for no limit (default: {MAX_DURATION:.0f})")
+    parser.add_argument("--binary", metavar="PATH",
+                        help="Run this Speedtest CLI executable instead of searching for one "
+                             f"(default: the {cli.BINARY_ENV} environment variable)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve OpenMetrics for single-server tests on "
+                             "http://127.0.0.1:PORT/metrics while running")
+    return parser.parse_args(argv)
+
+
+def parse_export_args(argv):
+    from .export import FORMATS
+
+    parser = argparse.ArgumentParser(
+        prog="python3 -m speedtest_gui --headless export",
+        description="Export the result history to a file, writing NDJSON progress records "
+                    "to stdout."
+    )
+    parser.add_argument("path", help="File to write")
+    parser.add_argument("--format", choices=list(FORMATS),
+                        help="Output format (default: from the file extension, or csv)")
+    parser.add_argument("--since", help="Only results from this date or time on "
+                                        "(ISO 8601 or Unix time)")
+    parser.add_argument("--until", help="Only results before this date or time")
+    parser.add_argument("--server-id", type=int, help="Only results from this server")
+    parser.add_argument("--raw", action="store_true",
+                        help="Add a column with the Speedtest CLI's full result as JSON")
+    return parser.parse_args(argv)
+
+
+def export_main(argv):
+    from .export import ExportError, export, parse_time
+    from .history import HistoryStore
+
+    args = parse_export_args(argv)
+
+    def progress(written, total):
+        write_record({"type": "export_progress", "time": time.time(),
+                      "rows": written, "total": total})
+
+    try:
+        since = parse_time(args.since) if args.since else None
+        until = parse_time(args.until) if args.until else None
+        store = HistoryStore()
+        try:
+            rows = export(store, args.path, args.format, since, until, args.server_id,
+                          progress=progress, raw=args.raw)
+        finally:
+            store.close()
+    except (ExportError, OSError) as e:
+        write_record({"type": "error", "time": time.time(), "message": str(e)})
+        return 1
+    except KeyboardInterrupt:
+        # export() has removed the unfinished file
+        return 130
+    except Exception as e:
+        # Reading the history or writing the file can fail in other ways;
+        # the traceback is logged at debug level
+        log.logger.debug("Export failed", exc_info=True)
+        write_record({"type": "error", "time": time.time(),
+                      "message": f"{type(e).__name__}: {e}"})
+        return 1
+
+    write_record({"type": "export", "time": time.time(), "path": args.path, "rows": rows})
+    return 0
+
+
+def main(argv):
+    if argv[:1] == ["export"]:
+        return export_main(argv[1:])
+
+    args = parse_args(argv)
+    if args.log_level:
+        log.setup(log.parse_level(args.log_level))
+    options = {"stall_timeout": args.stall_timeout or None, "max_duration": args.timeout or None,
+               "binary": args.binary}
+
+    metrics = server = None
+    if args.metrics_port is not None:
+        from .metrics import Metrics, MetricsServer
+        metrics = Metrics()
+        try:
+            server = MetricsServer(metrics, args.metrics_port)
+        except OSError as e:
+            print(f"Could not serve metrics on port {args.metrics_port}: {e.strerror}",
+                  file=sys.stderr)
+            return 2
+        server.start()
+
+    failures = 0
+    run = 0
+    try:
+        while args.count == 0 or run < args.count:
+            run += 1
+            started = time.monotonic()
+            if args.server_ids and len(args.server_ids) > 1:
+                succeeded = run_multi(run, args.server_ids, args.concurrency, options)
+            else:
+                succeeded = run_once(run, args.server_ids[0] if args.server_ids else None, options,
+                                     metrics)
+            if not succeeded:
+                failures += 1
+
+            if args.count and run >= args.count:
+                break
+            time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if server is not None:
+            server.stop()
+
+    return 1 if failures else 0
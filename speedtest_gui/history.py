@@ -0,0 +1,339 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from .rawcodec import TRAIN_SAMPLES, RawCodec
+from .timeline import Timeline
+
+# Result columns stored for every test, in table order after id
+COLUMNS = (
+    "timestamp",
+    "server_id",
+    "server",
+    "server_location",
+    "isp",
+    "download",
+    "upload",
+    "ping",
+    "jitter",
+    "packet_loss",
+    "result_url",
+)
+
+# Columns stored for every detected change, see changes.ChangeDetector
+CHANGE_COLUMNS = ("timestamp", "detected", "server_id", "server", "metric", "before", "after")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    server_id INTEGER,
+    server TEXT,
+    server_location TEXT,
+    isp TEXT,
+    download REAL,
+    upload REAL,
+    ping REAL,
+    jitter REAL,
+    packet_loss REAL,
+    result_url TEXT,
+    raw BLOB,
+    timeline BLOB
+);
+CREATE INDEX IF NOT EXISTS results_timestamp ON results (timestamp);
+CREATE INDEX IF NOT EXISTS results_server ON results (server_id, timestamp);
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    detected REAL NOT NULL,
+    server_id INTEGER,
+    server TEXT,
+    metric TEXT NOT NULL,
+    before REAL,
+    after REAL
+);
+CREATE INDEX IF NOT EXISTS changes_timestamp ON changes (timestamp);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS raw_dictionaries (
+    id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL
+);
+"""
+
+
+def data_dir():
+    base = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "speedtest-gui")
+
+
+def default_path():
+    return os.path.join(data_dir(), "history.db")
+
+
+def filter_clause(since=None, until=None, server_id=None):
+    """Return the SQL WHERE clause and parameters for the filters.
+
+    Selects results from since up to, but not including, until (Unix
+    times) and of server_id. Filters that are None are left out.
+    """
+    conditions, params = [], []
+    if since is not None:
+        conditions.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("timestamp < ?")
+        params.append(until)
+    if server_id is not None:
+        conditions.append("server_id = ?")
+        params.append(server_id)
+    if not conditions:
+        return "", params
+    return " WHERE " + " AND ".join(conditions), params
+
+
+class HistoryStore:
+    """SQLite database of completed test results.
+
+    Results passed to add() are buffered and written in one transaction by
+    flush(), which also happens automatically once batch_size results are
+    waiting. Changes and state values are written in the same transaction,
+    so they always match the results. Reads only see flushed results.
+
+    The CLI's full result object, when a result has one, is kept compressed
+    by a RawCodec in the raw column and only decoded by raw_result() and
+    iter_rows(raw=True). The run's sample timeline is kept the same way in
+    the timeline column and decoded by timeline().
+    """
+
+    def __init__(self, path=None, batch_size=50):
+        if path is None:
+            path = default_path()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.pending_changes = []
+        # Whether the stored changes are dropped before pending_changes are written
+        self.replacing_changes = False
+        self.pending_state = {}
+
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+        # Databases from before raw results and timelines were kept don't
+        # have their columns
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(results)")]
+        for name in ("raw", "timeline"):
+            if name not in columns:
+                with self.connection:
+                    self.connection.execute(f"ALTER TABLE results ADD COLUMN {name} BLOB")
+
+        self.codec = RawCodec(dict(self.connection.execute(
+            "SELECT id, data FROM raw_dictionaries")))
+        if self.codec.current == 0:
+            # Until a dictionary is trained, train from the newest stored
+            # results, so that it doesn't take TRAIN_SAMPLES tests in one run
+            blobs = self.connection.execute(
+                "SELECT raw FROM results WHERE raw IS NOT NULL "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?", (TRAIN_SAMPLES,)).fetchall()
+            raws = []
+            for blob, in reversed(blobs):
+                try:
+                    raws.append(self.codec.decode(blob))
+                except (ValueError, zlib.error):
+                    continue
+            self.codec.seed(raws)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.connection.close()
+
+    def add(self, result, timestamp=None):
+        """Queue a parsed result dict as returned by the runner"""
+        row = (
+            time.time() if timestamp is None else timestamp,
+            result.get("server_id"),
+            result.get("server"),
+            result.get("server_location"),
+            result.get("isp"),
+            result.get("download"),
+            result.get("upload"),
+            result.get("ping"),
+            result.get("jitter"),
+            result.get("packet_loss"),
+            result.get("result_url"),
+            self.codec.encode(result["raw"]) if result.get("raw") is not None else None,
+            result["timeline"].to_bytes() if result.get("timeline") is not None else None,
+        )
+        self.pending.append(row)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def add_changes(self, changes):
+        """Queue changes as returned by ChangeDetector.add()"""
+        self.pending_changes.extend(tuple(change[name] for name in CHANGE_COLUMNS)
+                                    for change in changes)
+
+    def replace_changes(self, changes):
+        """Queue changes to replace all stored ones, for detectors that started over"""
+        self.replacing_changes = True
+        self.pending_changes = []
+        self.add_changes(changes)
+
+    def set_state(self, name, value):
+        """Queue a text value to be stored under name"""
+        self.pending_state[name] = value
+
+    def get_state(self, name):
+        """The text value stored under name, or None"""
+        if name in self.pending_state:
+            return self.pending_state[name]
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def flush(self):
+        """Write queued results, changes and state. Returns the number of results written."""
+        if (not self.pending and not self.pending_changes and not self.pending_state
+                and not self.replacing_changes and not self.codec.new_dictionaries):
+            return 0
+
+        rows, changes, state = self.pending, self.pending_changes, self.pending_state
+        self.pending, self.pending_changes, self.pending_state = [], [], {}
+        replacing, self.replacing_changes = self.replacing_changes, False
+        dictionaries = self.codec.new_dictionaries
+        self.codec.new_dictionaries = []
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        change_placeholders = ", ".join("?" for _ in CHANGE_COLUMNS)
+        try:
+            with self._lock, self.connection:
+                # Dictionaries are saved with the first results compressed with them
+                self.connection.executemany(
+                    "INSERT INTO raw_dictionaries (id, data) VALUES (?, ?)", dictionaries)
+                self.connection.executemany(
+                    f"INSERT INTO results ({', '.join(COLUMNS)}, raw, timeline) "
+                    f"VALUES ({placeholders}, ?, ?)", rows)
+                if replacing:
+                    self.connection.execute("DELETE FROM changes")
+                self.connection.executemany(
+                    f"INSERT INTO changes ({', '.join(CHANGE_COLUMNS)}) "
+                    f"VALUES ({change_placeholders})", changes)
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)", state.items())
+        except Exception:
+            # Queue everything again, ahead of anything queued since, so the
+            # next flush retries it. Results already compressed with a new
+            # dictionary can't be read back without it.
+            self.pending = rows + self.pending
+            self.pending_changes = changes + self.pending_changes
+            self.replacing_changes = self.replacing_changes or replacing
+            self.pending_state = {**state, **self.pending_state}
+            self.codec.new_dictionaries = dictionaries + self.codec.new_dictionaries
+            raise
+        return len(rows)
+
+    def count(self, since=None, until=None, server_id=None):
+        """Number of stored results, optionally only those matching the filters"""
+        where, params = filter_clause(since, until, server_id)
+        with self._lock:
+            return self.connection.execute(
+                f"SELECT COUNT(*) FROM results{where}", params).fetchone()[0]
+
+    def iter_rows(self, since=None, until=None, server_id=None, batch_size=1000, raw=False):
+        """Yield result rows as tuples in COLUMNS order, oldest first.
+
+        Rows are fetched batch_size at a time, each batch starting after the
+        last row of the one before, so memory use doesn't depend on how many
+        rows there are and the store is only locked while a batch is read.
+        Filters as in filter_clause(). With raw, each row ends with the
+        CLI's full result as a dict, or None if it wasn't kept.
+        """
+        where, params = filter_clause(since, until, server_id)
+        where += " AND (timestamp, id) > (?, ?)" if where else " WHERE (timestamp, id) > (?, ?)"
+        columns = ", ".join(COLUMNS + ("raw",) if raw else COLUMNS)
+        query = (f"SELECT id, {columns} FROM results{where} "
+                 "ORDER BY timestamp, id LIMIT ?")
+        decode = self.codec.decode
+        after = (float("-inf"), 0)
+        while True:
+            with self._lock:
+                rows = self.connection.execute(query, params + [*after, batch_size]).fetchall()
+            for row in rows:
+                if raw:
+                    yield row[1:-1] + (decode(row[-1]) if row[-1] is not None else None,)
+                else:
+                    yield row[1:]
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1][1], rows[-1][0])
+
+    def raw_result(self, row_id):
+        """The CLI's full result for the row with this id, or None if it wasn't kept"""
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT raw FROM results WHERE id = ?", (row_id,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return self.codec.decode(row[0])
+
+    def timeline(self, row_id):
+        """The sample timeline of the row with this id, or None if it wasn't kept"""
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT timeline FROM results WHERE id = ?", (row_id,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return Timeline.from_bytes(row[0])
+
+    def page(self, limit, before=None):
+        """Return up to limit rows as dicts, newest first.
+
+        before is the (timestamp, id) of a row; only rows older than it are
+        returned, so a list is paged through by passing the last row of
+        each page. Rows are found through the timestamp index however deep
+        in the history the page is.
+        """
+        where, params = "", []
+        if before is not None:
+            where, params = " WHERE (timestamp, id) < (?, ?)", list(before)
+        with self._lock:
+            cursor = self.connection.execute(
+                f"SELECT id, {', '.join(COLUMNS)} FROM results{where} "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?", params + [limit])
+            names = [description[0] for description in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def key_after(self, skip, before=None):
+        """The (timestamp, id) of the row skip rows after before, newest first, or None.
+
+        For jumping ahead in a list without fetching the rows in between;
+        only the timestamp index is read.
+        """
+        where, params = "", []
+        if before is not None:
+            where, params = " WHERE (timestamp, id) < (?, ?)", list(before)
+        with self._lock:
+            row = self.connection.execute(
+                f"SELECT timestamp, id FROM results{where} "
+                "ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?", params + [skip]).fetchone()
+        return tuple(row) if row else None
+
+    def changes(self, since=None, until=None, server_id=None):
+        """Return the detected changes as dicts, oldest first. Filters as in filter_clause()."""
+        where, params = filter_clause(since, until, server_id)
+        with self._lock:
+            cursor = self.connection.execute(
+                f"SELECT {', '.join(CHANGE_COLUMNS)} FROM changes{where} "
+                "ORDER BY timestamp, id", params)
+            return [dict(zip(CHANGE_COLUMNS, row)) for row in cursor.fetchall()]
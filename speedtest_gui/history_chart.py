@@ -0,0 +1,115 @@
+import gi
+gi.require_version('Gtk', '4.0')
+gi.require_version('Graphene', '1.0')
+from gi.repository import Gtk, GLib, Graphene
+
+import cairo
+
+from .changes import describe
+from .gauge import PHASE_GRADIENTS, rgb
+
+LINE_WIDTH = 1.5
+PADDING = 6
+MARKER_SIZE = 5
+
+# How close to a marker, in pixels, the pointer has to be for its tooltip
+MARKER_HIT_DISTANCE = 4
+
+# Colours of the lines and markers per metric; ping has no line
+COLORS = {
+    "download": rgb(PHASE_GRADIENTS["download"][0]),
+    "upload": rgb(PHASE_GRADIENTS["upload"][0]),
+    "ping": rgb((0x91, 0x41, 0xac)),
+}
+
+
+class HistoryChart(Gtk.Widget):
+    """Download and upload speed of recent results, with detected changes.
+
+    Each change is marked with a vertical line where it started, in the
+    colour of the metric that changed; hovering a marker describes it.
+    """
+    __gtype_name__ = 'HistoryChart'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.set_size_request(-1, 120)
+        self.set_has_tooltip(True)
+        self.connect("query-tooltip", self.on_query_tooltip)
+
+        self.times = []
+        self.values = {"download": [], "upload": []}
+        self.changes = []
+        self.max_value = 0.0
+
+    def set_data(self, results, changes):
+        """Show results, as returned by HistoryStore.page(), and changes among them"""
+        results = list(reversed(results))
+        self.times = [result["timestamp"] for result in results]
+        for metric, values in self.values.items():
+            values[:] = [result[metric] or 0.0 for result in results]
+        self.changes = [change for change in changes
+                        if self.times and change["timestamp"] >= self.times[0]]
+        self.max_value = max(max(values, default=0.0) for values in self.values.values())
+        self.queue_draw()
+
+    def _x(self, timestamp, width):
+        start, end = self.times[0], self.times[-1]
+        if end <= start:
+            return width / 2
+        return PADDING + (width - 2 * PADDING) * (timestamp - start) / (end - start)
+
+    def _y(self, value, height):
+        return height - PADDING - (height - 2 * PADDING) * value / self.max_value
+
+    def do_snapshot(self, snapshot):
+        width = self.get_width()
+        height = self.get_height()
+        if width <= 0 or height <= 0 or len(self.times) < 2:
+            return
+
+        cr = snapshot.append_cairo(Graphene.Rect().init(0, 0, width, height))
+        cr.set_line_join(cairo.LINE_JOIN_ROUND)
+
+        for change in self.changes:
+            x = round(self._x(change["timestamp"], width)) + 0.5
+            cr.set_source_rgba(*COLORS[change["metric"]], 0.6)
+            cr.set_line_width(1)
+            cr.set_dash([3, 3])
+            cr.move_to(x, PADDING)
+            cr.line_to(x, height)
+            cr.stroke()
+            cr.set_dash([])
+            cr.move_to(x - MARKER_SIZE, 0)
+            cr.line_to(x + MARKER_SIZE, 0)
+            cr.line_to(x, MARKER_SIZE)
+            cr.close_path()
+            cr.fill()
+
+        if self.max_value <= 0:
+            return
+        cr.set_line_width(LINE_WIDTH)
+        for metric, values in self.values.items():
+            cr.set_source_rgb(*COLORS[metric])
+            for index, (timestamp, value) in enumerate(zip(self.times, values)):
+                point = (self._x(timestamp, width), self._y(value, height))
+                if index:
+                    cr.line_to(*point)
+                else:
+                    cr.move_to(*point)
+            cr.stroke()
+
+    def on_query_tooltip(self, widget, x, y, keyboard_mode, tooltip):
+        if len(self.times) < 2:
+            return False
+
+        width = self.get_width()
+        lines = []
+        for change in self.changes:
+            if abs(self._x(change["timestamp"], width) - x) <= MARKER_HIT_DISTANCE:
+                date = GLib.DateTime.new_from_unix_local(int(change["timestamp"]))
+                lines.append(f"{date.format('%Y-%m-%d %H:%M')}  {describe(change)}")
+        if not lines:
+            return False
+        tooltip.set_text("\n".join(lines))
+        return True
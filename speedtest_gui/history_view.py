@@ -0,0 +1,319 @@
+import gi
+gi.require_version('Gtk', '4.0')
+gi.require_version('Adw', '1')
+from gi.repository import Gtk, Adw, Gdk, GLib, GObject, Gio, Pango
+
+import collections
+import json
+
+from .history_chart import HistoryChart
+
+
+class HistoryItem(GObject.Object):
+    """One stored result, as handed out by HistoryModel"""
+    __gtype_name__ = 'HistoryItem'
+
+    def __init__(self, row):
+        super().__init__()
+        self.row = row
+
+
+class HistoryModel(GObject.Object, Gio.ListModel):
+    """List model over the result history that loads rows a page at a time.
+
+    Only the row count is queried up front. Pages of rows are fetched from
+    the store when the list view asks for an item in them, and a small LRU
+    cache keeps the pages around the visible range. Each page is fetched
+    as the rows after the last one of the page before, whose (timestamp,
+    id) is kept for every page seen, so scrolling never makes the store
+    step over the rows in between.
+    """
+    __gtype_name__ = 'HistoryModel'
+
+    PAGE_SIZE = 256
+    CACHED_PAGES = 8
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+        self.n_items = store.count()
+        self.pages = collections.OrderedDict()
+        # (timestamp, id) of the last row of each page fetched
+        self.boundaries = {}
+
+    def do_get_item_type(self):
+        return HistoryItem.__gtype__
+
+    def do_get_n_items(self):
+        return self.n_items
+
+    def do_get_item(self, position):
+        if position >= self.n_items:
+            return None
+
+        page_index, offset = divmod(position, self.PAGE_SIZE)
+        page = self.pages.get(page_index)
+        if page is None:
+            before = self._boundary(page_index - 1)
+            if before is None and page_index > 0:
+                rows = []
+            else:
+                rows = self.store.page(self.PAGE_SIZE, before)
+            if rows:
+                self.boundaries[page_index] = (rows[-1]["timestamp"], rows[-1]["id"])
+            page = [HistoryItem(row) for row in rows]
+            self.pages[page_index] = page
+            if len(self.pages) > self.CACHED_PAGES:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(page_index)
+
+        if offset >= len(page):
+            return None
+        return page[offset]
+
+    def _boundary(self, page_index):
+        """(timestamp, id) of the last row of a page, or None before the first"""
+        if page_index < 0:
+            return None
+        boundary = self.boundaries.get(page_index)
+        if boundary is not None:
+            return boundary
+
+        # A jump past pages not seen yet: skip from the nearest one before
+        # it over the timestamp index
+        known = max((index for index in self.boundaries if index < page_index), default=-1)
+        skip = (page_index - known) * self.PAGE_SIZE - 1
+        boundary = self.store.key_after(skip, self.boundaries.get(known))
+        if boundary is not None:
+            self.boundaries[page_index] = boundary
+        return boundary
+
+    def refresh(self):
+        """Pick up rows added since the model was created.
+
+        New results are newest, so they appear at the top of the list.
+        """
+        n_items = self.store.count()
+        added = n_items - self.n_items
+        if added <= 0:
+            return
+
+        self.n_items = n_items
+        self.pages.clear()
+        self.boundaries.clear()
+        self.items_changed(0, 0, added)
+
+
+class HistoryWindow(Adw.Window):
+    __gtype_name__ = 'HistoryWindow'
+
+    # Number of recent results shown in the chart
+    CHART_RESULTS = 500
+
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.set_title("History")
+        self.set_default_size(640, 560)
+
+        self.store = store
+        self.model = HistoryModel(store)
+        self.chart = HistoryChart(margin_start=12, margin_end=12, margin_top=12)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_setup_row)
+        factory.connect("bind", self.on_bind_row)
+
+        self.list_view = Gtk.ListView(model=Gtk.NoSelection(model=self.model), factory=factory,
+                                      single_click_activate=True)
+        self.list_view.add_css_class("navigation-sidebar")
+        self.list_view.connect("activate", self.on_row_activated)
+
+        scrolled = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
+        scrolled.set_child(self.list_view)
+
+        self.empty_page = Adw.StatusPage(icon_name="document-open-recent-symbolic",
+                                         title="No Results Yet",
+                                         description="Completed tests will be listed here")
+
+        results = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        results.append(self.chart)
+        results.append(scrolled)
+
+        self.stack = Gtk.Stack()
+        self.stack.add_named(results, "list")
+        self.stack.add_named(self.empty_page, "empty")
+
+        toolbar = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        toolbar.append(Adw.HeaderBar())
+        toolbar.append(self.stack)
+        self.set_content(toolbar)
+
+        self.model.connect("items-changed", self.on_items_changed)
+        self.update_empty_state()
+        self.update_chart()
+
+    def refresh(self):
+        self.model.refresh()
+        self.update_chart()
+
+    def update_chart(self):
+        results = self.store.page(self.CHART_RESULTS)
+        since = results[-1]["timestamp"] if results else None
+        self.chart.set_data(results, self.store.changes(since=since))
+
+    def on_row_activated(self, list_view, position):
+        item = self.model.get_item(position)
+        if item is not None:
+            window = ResultWindow(self.store, item.row, transient_for=self)
+            window.present()
+
+    def on_items_changed(self, model, position, removed, added):
+        self.update_empty_state()
+
+    def update_empty_state(self):
+        self.stack.set_visible_child_name("list" if self.model.n_items else "empty")
+
+    def on_setup_row(self, factory, list_item):
+        row = Gtk.Box(spacing=12, margin_top=6, margin_bottom=6, margin_start=6, margin_end=6)
+
+        details = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, hexpand=True)
+        date_label = Gtk.Label(xalign=0)
+        date_label.add_css_class("heading")
+        server_label = Gtk.Label(xalign=0, ellipsize=Pango.EllipsizeMode.END)
+        server_label.add_css_class("caption")
+        server_label.add_css_class("dim-label")
+        details.append(date_label)
+        details.append(server_label)
+
+        speeds_label = Gtk.Label(xalign=1)
+        speeds_label.add_css_class("numeric")
+
+        row.append(details)
+        row.append(speeds_label)
+
+        row.date_label = date_label
+        row.server_label = server_label
+        row.speeds_label = speeds_label
+        list_item.set_child(row)
+
+    def on_bind_row(self, factory, list_item):
+        item = list_item.get_item()
+        row = list_item.get_child()
+        if item is None:
+            return
+
+        result = item.row
+        date = GLib.DateTime.new_from_unix_local(int(result["timestamp"]))
+        row.date_label.set_text(date.format("%Y-%m-%d %H:%M"))
+
+        server = result["server"] or "Unknown"
+        if result["server_location"]:
+            server = f"{server} ({result['server_location']})"
+        row.server_label.set_text(server)
+
+        row.speeds_label.set_text(
+            f"↓ {result['download'] or 0:.1f}  ↑ {result['upload'] or 0:.1f} Mbps  "
+            f"{result['ping'] or 0:.1f} ms")
+
+
+def format_detail(value):
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value)
+
+
+def flatten(data, prefix=""):
+    """Yield (dotted key, value) for the scalars in nested dicts"""
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, name + ".")
+        else:
+            yield name, value
+
+
+class ResultWindow(Adw.Window):
+    """Everything the Speedtest CLI reported for one stored result.
+
+    The full result and the sample timeline are only decompressed when this
+    window is opened.
+    """
+    __gtype_name__ = 'ResultWindow'
+
+    def __init__(self, store, row, **kwargs):
+        super().__init__(modal=True, **kwargs)
+        date = GLib.DateTime.new_from_unix_local(int(row["timestamp"]))
+        self.set_title(date.format("%Y-%m-%d %H:%M"))
+        self.set_default_size(480, 600)
+
+        self.raw = store.raw_result(row["id"])
+        timeline = store.timeline(row["id"])
+
+        header = Adw.HeaderBar()
+        toolbar = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        toolbar.append(header)
+
+        if self.raw is None and timeline is None:
+            toolbar.append(Adw.StatusPage(icon_name="dialog-information-symbolic",
+                                          title="No Details",
+                                          description="Only the summary was saved for this test",
+                                          vexpand=True))
+            self.set_content(toolbar)
+            return
+
+        content = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=24)
+        if timeline is not None:
+            content.append(self.timeline_group(timeline))
+
+        if self.raw is not None:
+            copy_button = Gtk.Button(icon_name="edit-copy-symbolic", tooltip_text="Copy as JSON")
+            copy_button.connect("clicked", self.on_copy_clicked)
+            header.pack_end(copy_button)
+
+            # One group per object in the result, plus one for the top-level values
+            general = Adw.PreferencesGroup(title="Result")
+            content.append(general)
+            for key, value in self.raw.items():
+                if isinstance(value, dict):
+                    group = Adw.PreferencesGroup(title=key)
+                    for name, detail in flatten(value):
+                        group.add(self.detail_row(name, detail))
+                    content.append(group)
+                else:
+                    general.add(self.detail_row(key, value))
+
+        clamp = Adw.Clamp(maximum_size=800, margin_top=24, margin_bottom=24,
+                          margin_start=12, margin_end=12)
+        clamp.set_child(content)
+        scrolled = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
+        scrolled.set_child(clamp)
+        toolbar.append(scrolled)
+        self.set_content(toolbar)
+
+    def timeline_group(self, timeline):
+        group = Adw.PreferencesGroup(title="During the test")
+        for phase, summary in timeline.summary().items():
+            if summary is None:
+                continue
+            unit = "ms" if phase == "ping" else "Mbps"
+            details = [f"{summary['samples']} samples over {summary['duration']:.1f} s"]
+            if summary["ramp_up"] is not None:
+                details.append(f"full speed after {summary['ramp_up']:.1f} s")
+            row = Adw.ActionRow(title=phase.capitalize(), subtitle=", ".join(details))
+            label = Gtk.Label(label=f"{summary['steady_mean']:.1f} ± "
+                                    f"{summary['steady_stddev']:.1f} {unit}")
+            label.add_css_class("numeric")
+            row.add_suffix(label)
+            group.add(row)
+        return group
+
+    def detail_row(self, name, value):
+        row = Adw.ActionRow(title=name, subtitle=format_detail(value), subtitle_selectable=True)
+        row.add_css_class("property")
+        return row
+
+    def on_copy_clicked(self, button):
+        Gdk.Display.get_default().get_clipboard().set(json.dumps(self.raw, indent=2))
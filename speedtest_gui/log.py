@@ -0,0 +1,83 @@
+import collections
+import logging
+import os
+import sys
+
+# Only the standard library may be imported here, it is used by headless
+# mode as well as the GUI.
+
+LOG_ENV = "SPEEDTEST_GUI_LOG"
+DEFAULT_LEVEL = logging.WARNING
+LEVELS = ("debug", "info", "warning", "error", "critical")
+FORMAT = "%(levelname)s: %(name)s: %(message)s"
+OUTPUT_LINES = 200  # CLI output lines kept for error reports
+
+logger = logging.getLogger("speedtest_gui")
+
+
+def parse_level(name):
+    """Return the logging level for a name like "debug", or None if it isn't one"""
+    if not name:
+        return None
+    name = name.strip().lower()
+    if name not in LEVELS:
+        return None
+    return getattr(logging, name.upper())
+
+
+def setup(level=None):
+    """Send the application's log records to stderr.
+
+    The level comes from the argument, else from the SPEEDTEST_GUI_LOG
+    environment variable, else WARNING. stderr is used because stdout is
+    reserved for NDJSON records in headless mode. Calling it again only
+    changes the level.
+    """
+    if level is None:
+        level = parse_level(os.environ.get(LOG_ENV))
+        if os.environ.get(LOG_ENV) and level is None:
+            print(f"Warning: ignoring {LOG_ENV}={os.environ[LOG_ENV]}, "
+                  f"expected one of {', '.join(LEVELS)}", file=sys.stderr)
+    if level is None:
+        level = DEFAULT_LEVEL
+
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter(FORMAT))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level)
+
+
+class OutputRing:
+    """The most recent lines the Speedtest CLI wrote, for error reports.
+
+    Lines are stored as they were read, bytes or str, and only decoded
+    when the ring is read, so recording a line costs one deque append.
+    Appending is safe from several threads.
+    """
+
+    def __init__(self, capacity=OUTPUT_LINES):
+        self.entries = collections.deque(maxlen=capacity)
+
+    def record(self, stream, line):
+        self.entries.append((stream, line))
+
+    def clear(self):
+        self.entries.clear()
+
+    def lines(self, stream=None):
+        """Decoded lines, oldest first.
+
+        With a stream name only that stream's lines are returned, otherwise
+        each line is prefixed with the stream it came from.
+        """
+        lines = []
+        for name, line in list(self.entries):
+            if stream is not None and name != stream:
+                continue
+            if not isinstance(line, str):
+                line = bytes(line).decode(errors='replace')
+            line = line.rstrip()
+            lines.append(line if stream is not None else f"{name}: {line}")
+        return lines
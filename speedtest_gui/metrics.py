@@ -0,0 +1,263 @@
+import bisect
+import collections
+import http.server
+import logging
+import threading
+import time
+
+# Served as OpenMetrics text, which Prometheus asks for by default
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+DEFAULT_HOST = "127.0.0.1"
+
+# The histograms cover this many of the most recent results
+RECENT_RESULTS = 100
+
+BANDWIDTH_BUCKETS = (1e6, 5e6, 10e6, 25e6, 50e6, 100e6, 250e6, 500e6, 1e9, 2.5e9, 5e9, 10e9)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+# Error messages start with one of these, see session, process and cli
+ERROR_TYPES = (
+    ("Speedtest stalled", "stalled"),
+    ("Speedtest timed out", "timeout"),
+    ("Speedtest CLI not found", "cli_not_found"),
+    ("Speedtest CLI not working", "cli_broken"),
+    ("Failed to run speedtest", "cli_broken"),
+    ("Speedtest failed with code", "exit_status"),
+    ("Speedtest finished without a result", "no_result"),
+)
+ERROR_KINDS = sorted({kind for _, kind in ERROR_TYPES} | {"other"})
+
+STATES = ("idle", "running")
+
+log = logging.getLogger(__name__)
+
+
+def error_kind(message):
+    for prefix, kind in ERROR_TYPES:
+        if message.startswith(prefix):
+            return kind
+    return "other"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class RecentHistogram:
+    """Bucket counts over a sliding window of the last size values.
+
+    Adding a value costs O(log buckets) however long the window is.
+    """
+
+    def __init__(self, bounds, size=RECENT_RESULTS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.values = collections.deque()
+        self.size = size
+        self.sum = 0.0
+
+    def add(self, value):
+        if value is None:
+            return
+        if len(self.values) >= self.size:
+            old = self.values.popleft()
+            self.counts[bisect.bisect_left(self.bounds, old)] -= 1
+            self.sum -= old
+        self.values.append(value)
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def render(self, name, help_text, lines):
+        lines.append(f"# TYPE {name} gaugehistogram")
+        lines.append(f"# HELP {name} {help_text}")
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{format_value(bound)}"}} {cumulative}')
+        lines.append(f"{name}_gcount {cumulative}")
+        lines.append(f"{name}_gsum {format_value(self.sum)}")
+
+
+class Metrics:
+    """The latest results and runner health, rendered as OpenMetrics text.
+
+    Every test_* call updates the state and renders body again, so a scrape
+    only has to send bytes that are already there: it costs the same
+    however long the history is, and never waits for or starts a test.
+    Call the test_* methods from one thread; body can be read from any.
+    """
+
+    def __init__(self, recent=RECENT_RESULTS):
+        self.latest = None
+        self.latest_time = None
+        self.duration = None
+        self.last_error_time = None
+        self.state = "idle"
+        self.outcomes = {"completed": 0, "error": 0, "cancelled": 0}
+        self.errors = dict.fromkeys(ERROR_KINDS, 0)
+        self.recent = {
+            "download": RecentHistogram(BANDWIDTH_BUCKETS, recent),
+            "upload": RecentHistogram(BANDWIDTH_BUCKETS, recent),
+            "ping": RecentHistogram(LATENCY_BUCKETS, recent),
+            "jitter": RecentHistogram(LATENCY_BUCKETS, recent),
+        }
+
+        self._started_at = None
+        self.body = b""
+        self.render()
+
+    def seed(self, results):
+        """Fill the histograms from earlier results, oldest first.
+
+        results are dicts like the rows of HistoryStore.page(). The newest
+        also becomes the latest result if none was recorded yet.
+        """
+        last = None
+        for result in results:
+            self._add_recent(result)
+            last = result
+        if last is not None and self.latest is None:
+            self.latest = last
+            self.latest_time = last.get("timestamp")
+        self.render()
+
+    def test_started(self):
+        self._started_at = time.monotonic()
+        self.state = "running"
+        self.render()
+
+    def test_completed(self, result):
+        self._finish("completed")
+        self.latest = result
+        self.latest_time = time.time()
+        self._add_recent(result)
+        self.render()
+
+    def test_failed(self, message):
+        self._finish("error")
+        self.errors[error_kind(message)] += 1
+        self.last_error_time = time.time()
+        self.render()
+
+    def test_cancelled(self):
+        self._finish("cancelled")
+        self.render()
+
+    def _finish(self, outcome):
+        self.outcomes[outcome] += 1
+        if self._started_at is not None:
+            self.duration = time.monotonic() - self._started_at
+            self._started_at = None
+        self.state = "idle"
+
+    def _add_recent(self, result):
+        recent = self.recent
+        for name in ("download", "upload"):
+            if result.get(name) is not None:
+                recent[name].add(result[name] * 1_000_000)  # Mbps to bit/s
+        for name in ("ping", "jitter"):
+            if result.get(name) is not None:
+                recent[name].add(result[name] / 1000)  # ms to s
+
+    def render(self):
+        lines = []
+
+        def gauge(name, help_text, value):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"# HELP {name} {help_text}")
+            if value is not None:
+                lines.append(f"{name} {format_value(value)}")
+
+        latest = self.latest or {}
+
+        def scaled(name, factor):
+            value = latest.get(name)
+            return value * factor if value is not None else None
+
+        gauge("speedtest_download_bits_per_second", "Download speed of the latest test",
+              scaled("download", 1_000_000))
+        gauge("speedtest_upload_bits_per_second", "Upload speed of the latest test",
+              scaled("upload", 1_000_000))
+        gauge("speedtest_ping_seconds", "Latency of the latest test", scaled("ping", 1 / 1000))
+        gauge("speedtest_jitter_seconds", "Jitter of the latest test", scaled("jitter", 1 / 1000))
+        gauge("speedtest_packet_loss_ratio", "Packet loss of the latest test",
+              scaled("packet_loss", 1 / 100))
+        gauge("speedtest_last_result_timestamp_seconds", "When the latest test completed",
+              self.latest_time)
+        gauge("speedtest_last_error_timestamp_seconds", "When the latest test failed",
+              self.last_error_time)
+        gauge("speedtest_test_duration_seconds", "How long the latest finished test ran",
+              self.duration)
+
+        lines.append("# TYPE speedtest_tests counter")
+        lines.append("# HELP speedtest_tests Finished tests by outcome")
+        for outcome, count in self.outcomes.items():
+            lines.append(f'speedtest_tests_total{{outcome="{outcome}"}} {count}')
+
+        lines.append("# TYPE speedtest_errors counter")
+        lines.append("# HELP speedtest_errors Failed tests by cause")
+        for kind, count in self.errors.items():
+            lines.append(f'speedtest_errors_total{{type="{kind}"}} {count}')
+
+        lines.append("# TYPE speedtest_runner_state stateset")
+        lines.append("# HELP speedtest_runner_state Whether a test is running")
+        for state in STATES:
+            value = 1 if state == self.state else 0
+            lines.append(f'speedtest_runner_state{{speedtest_runner_state="{state}"}} {value}')
+
+        self.recent["download"].render("speedtest_recent_download_bits_per_second",
+                                       "Download speed of recent tests", lines)
+        self.recent["upload"].render("speedtest_recent_upload_bits_per_second",
+                                     "Upload speed of recent tests", lines)
+        self.recent["ping"].render("speedtest_recent_ping_seconds",
+                                   "Latency of recent tests", lines)
+        self.recent["jitter"].render("speedtest_recent_jitter_seconds",
+                                     "Jitter of recent tests", lines)
+
+        lines.append("# EOF\n")
+        # Replaced in one assignment, so a scrape sees the old or the new body
+        self.body = "\n".join(lines).encode()
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.metrics.body
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("%s %s", self.address_string(), format % args)
+
+
+class MetricsServer:
+    """Serves a Metrics' body over HTTP from a background thread"""
+
+    def __init__(self, metrics, port, host=DEFAULT_HOST):
+        self.server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.metrics = metrics
+        self.metrics = metrics
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        log.info("Serving metrics on http://%s:%d/metrics", *self.address)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
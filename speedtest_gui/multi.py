@@ -0,0 +1,160 @@
+import concurrent.futures
+import statistics
+import threading
+
+from .process import MAX_DURATION, STALL_TIMEOUT, TERMINATE_GRACE, stop_process
+from .session import SpeedtestError, run_speedtest
+
+SUMMARY_METRICS = ("download", "upload", "ping", "jitter")
+
+
+class ServerRun:
+    """State of the test against one server in a multi-server session"""
+
+    def __init__(self, server_id):
+        self.server_id = server_id
+        self.state = "pending"  # pending, running, completed, error, cancelled
+        self.phase = None
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.output = []  # Recent CLI output if the test failed
+
+    def to_dict(self):
+        return {
+            "server_id": self.server_id,
+            "state": self.state,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+def summarize(results):
+    """Return min/median/max of each metric over a list of parsed results"""
+    summary = {}
+    for metric in SUMMARY_METRICS:
+        values = [result[metric] for result in results if result.get(metric) is not None]
+        if values:
+            summary[metric] = {
+                "min": min(values),
+                "median": statistics.median(values),
+                "max": max(values),
+            }
+    return summary
+
+
+class MultiServerTest:
+    """Run tests against several servers through a small worker pool.
+
+    At most concurrency tests run at the same time. The default of 1 runs
+    the servers one after another so they don't compete for bandwidth.
+    Callbacks are invoked on the worker threads:
+
+    - progress(server_id, phase, value, status) for every progress update
+    - finished(server_run) when a server's test ends, however it ends
+
+    Each test is stopped by the watchdog limits of run_speedtest, and
+    cancel() kills any CLI still running terminate_grace seconds later.
+    """
+
+    def __init__(self, server_ids, concurrency=1, progress=None, finished=None,
+                 terminate_grace=TERMINATE_GRACE, stall_timeout=STALL_TIMEOUT,
+                 max_duration=MAX_DURATION, binary=None):
+        self.runs = [ServerRun(server_id) for server_id in server_ids]
+        self.concurrency = max(1, concurrency)
+        self.progress = progress
+        self.finished = finished
+        self.terminate_grace = terminate_grace
+        self.stall_timeout = stall_timeout
+        self.max_duration = max_duration
+        self.binary = binary
+
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._processes = set()
+
+    def run(self):
+        """Run all tests, blocking until they end, and return the aggregate"""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self._run_server, server_run) for server_run in self.runs]
+            try:
+                concurrent.futures.wait(futures)
+            except BaseException:
+                # Don't leave the CLIs running if we are interrupted
+                self.cancel()
+                raise
+        return self.aggregate()
+
+    def cancel(self):
+        """Stop every running test and skip the ones that haven't started"""
+        with self._lock:
+            self.cancelled = True
+            processes = list(self._processes)
+
+        for process in processes:
+            stop_process(process, self.terminate_grace)
+
+    def aggregate(self):
+        results = [server_run.result for server_run in self.runs if server_run.result is not None]
+        return {
+            "servers": [server_run.to_dict() for server_run in self.runs],
+            "summary": summarize(results),
+            "completed": len(results),
+            "failed": sum(1 for server_run in self.runs if server_run.state == "error"),
+        }
+
+    def _started(self, process):
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self.cancelled
+
+        # cancel() may have run between the CLI starting and registering it
+        if cancelled:
+            stop_process(process, self.terminate_grace)
+
+    def _run_server(self, server_run):
+        if self.cancelled:
+            server_run.state = "cancelled"
+            self._finish(server_run)
+            return
+
+        server_id = server_run.server_id
+        server_run.state = "running"
+
+        def progress(phase, value, status):
+            server_run.phase = phase
+            if phase in ("ping", "download", "upload"):
+                server_run.progress = value
+            if self.progress is not None:
+                self.progress(server_id, phase, value, status)
+
+        process = []
+
+        def started(p):
+            process.append(p)
+            self._started(p)
+
+        try:
+            server_run.result = run_speedtest(progress, server_id=server_id, started=started,
+                                              cancelled=lambda: self.cancelled,
+                                              stall_timeout=self.stall_timeout,
+                                              max_duration=self.max_duration,
+                                              grace=self.terminate_grace,
+                                              binary=self.binary)
+            server_run.state = "completed" if server_run.result is not None else "cancelled"
+        except SpeedtestError as e:
+            server_run.state = "cancelled" if self.cancelled else "error"
+            server_run.error = str(e)
+            server_run.output = e.output
+        except Exception as e:
+            server_run.state = "error"
+            server_run.error = f"Unexpected error: {str(e)}"
+        finally:
+            with self._lock:
+                self._processes.difference_update(process)
+
+        self._finish(server_run)
+
+    def _finish(self, server_run):
+        if self.finished is not None:
+            self.finished(server_run)
@@ -0,0 +1,248 @@
+import gi
+gi.require_version('Gtk', '4.0')
+gi.require_version('Adw', '1')
+from gi.repository import Gtk, Adw, GLib
+
+import re
+import threading
+
+from .coalescer import ProgressCoalescer
+from .multi import MultiServerTest
+
+PHASE_NAMES = {
+    "server_info": "Connecting",
+    "ping": "Testing ping",
+    "download": "Testing download",
+    "download_raw": "Testing download",
+    "upload": "Testing upload",
+    "upload_raw": "Testing upload",
+}
+
+
+class MultiServerWindow(Adw.Window):
+    """Tests a list of servers and shows per-server results and a summary"""
+    __gtype_name__ = 'MultiServerWindow'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.set_title("Test Multiple Servers")
+        self.set_default_size(560, 620)
+
+        self.app = self.get_application()
+        self.test = None
+        self.rows = {}
+        self.summary_rows = []
+
+        # Per-server progress from the worker threads is merged per frame
+        self.coalescer = ProgressCoalescer(self.on_server_progress)
+
+        self.server_entry = Adw.EntryRow(title="Server IDs (separated by spaces or commas)")
+        self.concurrency_row = Adw.ActionRow(title="Parallel tests",
+                                             subtitle="Tests running at once share your bandwidth")
+        self.concurrency_spin = Gtk.SpinButton.new_with_range(1, 8, 1)
+        self.concurrency_spin.set_valign(Gtk.Align.CENTER)
+        self.concurrency_row.add_suffix(self.concurrency_spin)
+
+        settings_group = Adw.PreferencesGroup()
+        settings_group.add(self.server_entry)
+        settings_group.add(self.concurrency_row)
+
+        self.start_button = Gtk.Button(label="Start Tests", halign=Gtk.Align.CENTER)
+        self.start_button.add_css_class("suggested-action")
+        self.start_button.add_css_class("pill")
+        self.start_button.connect("clicked", self.on_start_clicked)
+
+        self.cancel_button = Gtk.Button(label="Cancel", halign=Gtk.Align.CENTER, visible=False)
+        self.cancel_button.add_css_class("destructive-action")
+        self.cancel_button.add_css_class("pill")
+        self.cancel_button.connect("clicked", self.on_cancel_clicked)
+
+        buttons = Gtk.Box(spacing=12, halign=Gtk.Align.CENTER)
+        buttons.append(self.start_button)
+        buttons.append(self.cancel_button)
+
+        self.servers_group = Adw.PreferencesGroup(title="Servers", visible=False)
+        self.summary_group = Adw.PreferencesGroup(title="Summary",
+                                                  description="Minimum / median / maximum",
+                                                  visible=False)
+
+        content = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=24)
+        content.append(settings_group)
+        content.append(buttons)
+        content.append(self.servers_group)
+        content.append(self.summary_group)
+
+        clamp = Adw.Clamp(maximum_size=800, margin_top=24, margin_bottom=24,
+                          margin_start=12, margin_end=12)
+        clamp.set_child(content)
+        scrolled = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
+        scrolled.set_child(clamp)
+
+        toolbar = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        toolbar.append(Adw.HeaderBar())
+        toolbar.append(scrolled)
+        self.set_content(toolbar)
+
+        self.coalescer.attach(self)
+        self.busy_id = self.app.connect("busy-changed", self.on_busy_changed)
+        self.on_busy_changed(self.app)
+        self.connect("close-request", self.on_close_request)
+
+    def parse_server_ids(self):
+        ids = []
+        for token in re.split(r"[\s,]+", self.server_entry.get_text().strip()):
+            if token.isdigit():
+                ids.append(int(token))
+        return ids
+
+    def on_busy_changed(self, application):
+        # The main window's test would share the bandwidth with these
+        self.start_button.set_sensitive(not application.busy())
+        self.start_button.set_tooltip_text(
+            "A test is running" if application.busy() else None)
+
+    def on_start_clicked(self, button):
+        if self.app.busy():
+            return
+        server_ids = self.parse_server_ids()
+        if not server_ids:
+            self.server_entry.add_css_class("error")
+            return
+        self.server_entry.remove_css_class("error")
+
+        for row in self.rows.values():
+            self.servers_group.remove(row)
+        self.rows = {}
+        for server_id in server_ids:
+            row = Adw.ActionRow(title=f"Server {server_id}", subtitle="Waiting")
+            row.result_label = Gtk.Label(label="-")
+            row.add_suffix(row.result_label)
+            self.servers_group.add(row)
+            self.rows[server_id] = row
+
+        self.servers_group.set_visible(True)
+        self.summary_group.set_visible(False)
+        self.start_button.set_visible(False)
+        self.cancel_button.set_visible(True)
+
+        self.coalescer.discard()
+        test = MultiServerTest(server_ids, self.concurrency_spin.get_value_as_int())
+        # Callbacks carry their test, so a cancelled test that is still
+        # winding down can't update the rows of the next one
+        test.progress = lambda *args: self.on_worker_progress(test, *args)
+        test.finished = lambda server_run: self.on_worker_finished(test, server_run)
+        self.test = test
+        self.app.set_multi_test(test)
+        thread = threading.Thread(target=self.run_test, args=(test,))
+        thread.daemon = True
+        thread.start()
+
+    def on_cancel_clicked(self, button):
+        if self.test is not None:
+            self.test.cancel()
+        self.cancel_button.set_sensitive(False)
+
+    def on_close_request(self, window):
+        # The test winds down without the window; its callbacks are
+        # dropped so nothing touches the rows once they are gone
+        if self.test is not None:
+            self.test.progress = None
+            self.test.finished = None
+            self.test.cancel()
+            self.test = None
+        self.app.disconnect(self.busy_id)
+        self.coalescer.discard()
+        self.coalescer.detach()
+        return False
+
+    def run_test(self, test):
+        aggregate = test.run()
+        GLib.idle_add(self.on_test_ended, test, aggregate)
+
+    # Called on worker threads
+
+    def on_worker_progress(self, test, server_id, phase, value, status):
+        self.coalescer.push((test, server_id, phase), value, status)
+
+    def on_worker_finished(self, test, server_run):
+        GLib.idle_add(self.on_server_finished, test, server_run)
+
+    # Called on the main loop
+
+    def on_server_progress(self, key, value, status):
+        test, server_id, phase = key
+        if test is not self.test:
+            return
+        row = self.rows.get(server_id)
+        if row is None:
+            return
+
+        if phase == "server_info":
+            row.set_subtitle(status)
+        elif phase in ("download_raw", "upload_raw"):
+            row.set_subtitle(PHASE_NAMES[phase])
+            row.result_label.set_text(f"{value:.1f} Mbps")
+        elif phase in PHASE_NAMES:
+            row.set_subtitle(PHASE_NAMES[phase])
+
+    def on_server_finished(self, test, server_run):
+        if test is not self.test:
+            return GLib.SOURCE_REMOVE
+
+        # Progress still waiting for a frame would overwrite the final state
+        self.coalescer.flush()
+
+        row = self.rows.get(server_run.server_id)
+        if row is None:
+            return GLib.SOURCE_REMOVE
+
+        result = server_run.result
+        if result is not None:
+            row.set_title(result["server"])
+            row.set_subtitle(result.get("server_location") or "")
+            row.result_label.set_text(f"↓ {result['download']:.1f}  ↑ {result['upload']:.1f} Mbps  "
+                                      f"{result['ping']:.1f} ms")
+        elif server_run.state == "cancelled":
+            row.set_subtitle("Cancelled")
+            row.result_label.set_text("-")
+        else:
+            row.set_subtitle(f"Error: {server_run.error}")
+            row.result_label.set_text("-")
+        return GLib.SOURCE_REMOVE
+
+    def on_test_ended(self, test, aggregate):
+        # The application is busy until the CLIs have stopped, even if the
+        # window was closed
+        if self.app.multi_test is test:
+            self.app.set_multi_test(None)
+        return self.on_completed(test, aggregate)
+
+    def on_completed(self, test, aggregate):
+        if test is not self.test:
+            return GLib.SOURCE_REMOVE
+
+        self.test = None
+        self.start_button.set_visible(True)
+        self.cancel_button.set_visible(False)
+        self.cancel_button.set_sensitive(True)
+
+        for row in self.summary_rows:
+            self.summary_group.remove(row)
+        self.summary_rows = []
+
+        summary = aggregate["summary"]
+        for metric, title, unit in (("download", "Download", "Mbps"),
+                                    ("upload", "Upload", "Mbps"),
+                                    ("ping", "Ping", "ms"),
+                                    ("jitter", "Jitter", "ms")):
+            if metric not in summary:
+                continue
+            values = summary[metric]
+            row = Adw.ActionRow(title=title)
+            row.add_suffix(Gtk.Label(
+                label=f"{values['min']:.1f} / {values['median']:.1f} / {values['max']:.1f} {unit}"))
+            self.summary_group.add(row)
+            self.summary_rows.append(row)
+
+        self.summary_group.set_visible(bool(self.summary_rows))
+        return GLib.SOURCE_REMOVE
@@ -0,0 +1,38 @@
+import logging
+import threading
+
+# Kept apart from session.py so the GUI can create a runner without
+# importing the decoder until the first test starts.
+
+TERMINATE_GRACE = 3.0  # Seconds between SIGTERM and SIGKILL
+STALL_TIMEOUT = 30.0   # Seconds without any output before a test is aborted
+MAX_DURATION = 180.0   # Seconds a whole test may take
+
+log = logging.getLogger(__name__)
+
+
+def stop_process(process, grace=TERMINATE_GRACE):
+    """Send SIGTERM to the CLI and SIGKILL if it is still running after grace seconds.
+
+    Returns immediately, so it is safe to call from the main loop. Once the
+    process is gone its pipes close and any reader blocked on them returns.
+    """
+    if process.poll() is not None:
+        return None
+    try:
+        process.terminate()
+    except OSError:
+        return None
+
+    def kill():
+        if process.poll() is None:
+            log.warning("Process %d ignored SIGTERM, killing it", process.pid)
+            try:
+                process.kill()
+            except OSError:
+                pass
+
+    timer = threading.Timer(grace, kill)
+    timer.daemon = True
+    timer.start()
+    return timer
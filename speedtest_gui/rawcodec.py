@@ -0,0 +1,99 @@
+import json
+import struct
+import zlib
+
+# Results are compressed against a preset dictionary. Until enough have been
+# seen to train one, this stand-in is used: a result with every field the
+# CLI writes, so at least the names and structure compress away.
+BUILTIN_DICTIONARY = json.dumps({
+    "type": "result", "timestamp": "2025-01-01T00:00:00Z",
+    "ping": {"jitter": 0.0, "latency": 0.0, "low": 0.0, "high": 0.0},
+    "download": {"bandwidth": 0, "bytes": 0, "elapsed": 0,
+                 "latency": {"iqm": 0.0, "low": 0.0, "high": 0.0, "jitter": 0.0}},
+    "upload": {"bandwidth": 0, "bytes": 0, "elapsed": 0,
+               "latency": {"iqm": 0.0, "low": 0.0, "high": 0.0, "jitter": 0.0}},
+    "packetLoss": 0, "isp": "",
+    "interface": {"internalIp": "", "name": "", "macAddr": "", "isVpn": False,
+                  "externalIp": ""},
+    "server": {"id": 0, "host": "", "port": 8080, "name": "", "location": "",
+               "country": "", "ip": ""},
+    "result": {"id": "", "url": "https://www.speedtest.net/result/c/", "persisted": True},
+}, separators=(",", ":")).encode()
+
+# zlib only looks this far back, so a longer dictionary would be wasted
+DICTIONARY_SIZE = 32 * 1024
+
+# Results collected before a dictionary is trained from them
+TRAIN_SAMPLES = 24
+
+# Blobs start with the ID of the dictionary they were compressed with
+HEADER = struct.Struct(">H")
+
+
+class RawCodec:
+    """Compresses the CLI's full result objects for the history.
+
+    Each result is serialised as compact JSON and deflated against a
+    preset dictionary. Results of one connection share most of their text
+    (server, ISP, interface, addresses), so once TRAIN_SAMPLES results have
+    been encoded, a dictionary is made from them and used for all later
+    ones. Results stored before are passed to seed(), so training doesn't
+    start over with every run of the application. Dictionaries never
+    change once made; new ones show up in new_dictionaries until the
+    history has saved them.
+    """
+
+    def __init__(self, dictionaries=None):
+        self.dictionaries = {0: BUILTIN_DICTIONARY}
+        self.dictionaries.update(dictionaries or {})
+        self.current = max(self.dictionaries)
+        self.samples = []
+        self.new_dictionaries = []
+
+    def serialise(self, raw):
+        return json.dumps(raw, separators=(",", ":"), ensure_ascii=False).encode()
+
+    def seed(self, raws):
+        """Take earlier results, oldest first, as training samples.
+
+        Does nothing once a dictionary has been trained. Trains one right
+        away if there are enough.
+        """
+        if self.current != 0:
+            return
+        self.samples = [self.serialise(raw) for raw in raws][-TRAIN_SAMPLES:]
+        if len(self.samples) >= TRAIN_SAMPLES:
+            self.train()
+
+    def encode(self, raw):
+        data = self.serialise(raw)
+        if self.current == 0:
+            self.samples.append(data)
+            if len(self.samples) >= TRAIN_SAMPLES:
+                self.train()
+
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15,
+                                      zdict=self.dictionaries[self.current])
+        return HEADER.pack(self.current) + compressor.compress(data) + compressor.flush()
+
+    def decode(self, blob):
+        (dictionary_id,) = HEADER.unpack_from(blob)
+        dictionary = self.dictionaries.get(dictionary_id)
+        if dictionary is None:
+            raise ValueError(f"Unknown compression dictionary {dictionary_id}")
+        decompressor = zlib.decompressobj(-15, zdict=dictionary)
+        data = decompressor.decompress(blob[HEADER.size:]) + decompressor.flush()
+        return json.loads(data)
+
+    def train(self):
+        """Make a dictionary from the samples and start using it.
+
+        Matches near the end of the dictionary take the fewest bits, so
+        the newest samples go last, after the built-in one.
+        """
+        data = BUILTIN_DICTIONARY + b"".join(self.samples)
+        dictionary_id = max(self.dictionaries) + 1
+        self.dictionaries[dictionary_id] = data[-DICTIONARY_SIZE:]
+        self.new_dictionaries.append((dictionary_id, self.dictionaries[dictionary_id]))
+        self.current = dictionary_id
+        self.samples = []
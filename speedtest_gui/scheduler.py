@@ -0,0 +1,117 @@
+import gi
+gi.require_version('GLib', '2.0')
+from gi.repository import GObject, GLib
+
+import logging
+import random
+import time
+
+log = logging.getLogger(__name__)
+
+
+class TestScheduler(GObject.Object):
+    """Runs a test every few minutes while enabled.
+
+    Each delay is randomised by +/- jitter so that many machines on the same
+    schedule don't hit the servers at the same moment. After failed tests
+    the delay doubles, up to max_backoff times the interval, and goes back
+    to normal after the next successful test. A scheduled run is skipped
+    and counted as missed if a test, single or multi-server, is already
+    running.
+
+    While enabled the scheduler holds the application, so tests keep
+    running after the window is closed.
+    """
+    __gtype_name__ = 'TestScheduler'
+
+    __gsignals__ = {
+        'changed': (GObject.SignalFlags.RUN_FIRST, None, ())
+    }
+
+    def __init__(self, application, runner, interval_minutes=30, jitter=0.1, max_backoff=8):
+        super().__init__()
+        self.application = application
+        self.runner = runner
+        self.interval_minutes = interval_minutes
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+
+        self.enabled = False
+        self.next_run = None  # Wall clock time of the next run
+        self.missed_runs = 0
+        self.consecutive_errors = 0
+
+        self._source_id = 0
+
+        self.runner.connect("completed", self.on_completed)
+        self.runner.connect("error", self.on_error)
+
+    def start(self):
+        if self.enabled:
+            return
+
+        self.enabled = True
+        self.application.hold()
+        self.schedule_next()
+
+    def stop(self):
+        if not self.enabled:
+            return
+
+        self.enabled = False
+        self._cancel_timeout()
+        self.next_run = None
+        self.application.release()
+        self.emit("changed")
+
+    def set_interval(self, minutes):
+        self.interval_minutes = minutes
+        if self.enabled:
+            self.schedule_next()
+
+    def backoff_factor(self):
+        return min(2 ** self.consecutive_errors, self.max_backoff)
+
+    def schedule_next(self):
+        self._cancel_timeout()
+
+        delay = self.interval_minutes * 60 * self.backoff_factor()
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        delay = max(int(delay), 1)
+
+        self.next_run = time.time() + delay
+        self._source_id = GLib.timeout_add_seconds(delay, self.on_timeout)
+        self.emit("changed")
+
+    def on_timeout(self):
+        self._source_id = 0
+
+        if self.application.busy():
+            self.missed_runs += 1
+            log.info("Skipping scheduled test, a test is already running")
+        else:
+            log.info("Starting scheduled test")
+            self.runner.start_test()
+
+        self.schedule_next()
+        return GLib.SOURCE_REMOVE
+
+    def on_completed(self, runner, results):
+        # The run after a failed one was scheduled with the backed-off delay
+        self.consecutive_errors = 0
+        if self.enabled:
+            self.schedule_next()
+        else:
+            self.emit("changed")
+
+    def on_error(self, runner, error_message):
+        # Failed manual tests don't lengthen the schedule once it's enabled
+        if not self.enabled:
+            return
+        self.consecutive_errors += 1
+        self.schedule_next()
+
+    def _cancel_timeout(self):
+        if self._source_id:
+            GLib.source_remove(self._source_id)
+            self._source_id = 0
@@ -0,0 +1,96 @@
+from array import array
+
+
+class RingBuffer:
+    """Fixed-size buffer of (time, value) samples.
+
+    Storage is preallocated as two array('d') columns. Once full, the
+    oldest samples are overwritten.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+    def append(self, time, value):
+        if self.count < self.capacity:
+            index = (self.start + self.count) % self.capacity
+            self.count += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.times[index] = time
+        self.values[index] = value
+
+    def last(self):
+        if not self.count:
+            return None
+        index = (self.start + self.count - 1) % self.capacity
+        return self.times[index], self.values[index]
+
+    def max_value(self):
+        return max(self.column(self.values), default=0.0)
+
+    def column(self, data):
+        """Return the samples of one column in order, oldest first"""
+        end = self.start + self.count
+        if end <= self.capacity:
+            return data[self.start:end]
+        return data[self.start:] + data[:end - self.capacity]
+
+    def samples(self):
+        return self.column(self.times), self.column(self.values)
+
+
+def lttb(xs, ys, threshold):
+    """Downsample a series with Largest-Triangle-Three-Buckets.
+
+    Returns the indices of the points to keep. The first and last points are
+    always kept, and from each bucket in between the point that forms the
+    largest triangle with its neighbours is chosen, which keeps peaks and
+    dips that plain decimation would drop.
+    """
+    length = len(xs)
+    if threshold >= length or threshold < 3:
+        return list(range(length))
+
+    selected = [0]
+    bucket_size = (length - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket, used as the third triangle corner
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, length)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax = xs[a]
+        ay = ys[a]
+
+        best_area = -1.0
+        best = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+
+        selected.append(best)
+        a = best
+
+    selected.append(length - 1)
+    return selected
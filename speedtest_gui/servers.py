@@ -0,0 +1,206 @@
+import concurrent.futures
+import json
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+
+from .cli import CliError, cache_dir, get_cli
+
+SERVERS_TTL = 6 * 60 * 60  # Seconds before the server list is fetched again
+FETCH_TIMEOUT = 30
+PROBE_TIMEOUT = 1.0
+PROBE_WORKERS = 8
+CACHE_VERSION = 1
+
+log = logging.getLogger(__name__)
+
+
+def cache_path():
+    return os.path.join(cache_dir(), "servers.json")
+
+
+# Documentation addresses, never routed anywhere, used to find the route
+# to the internet for each address family
+PROBE_ADDRESSES = (
+    (socket.AF_INET, ("192.0.2.1", 9)),  # TEST-NET-1
+    (socket.AF_INET6, ("2001:db8::1", 9)),
+)
+
+
+def network_key():
+    """Identify the current network by the local addresses used to reach the internet.
+
+    Both the IPv4 and the IPv6 route are looked up, so that a change on
+    either, including on IPv6-only networks, is noticed. No packets are
+    sent; connecting a UDP socket only selects a route. Returns None when
+    there is no route at all.
+    """
+    addresses = []
+    for family, address in PROBE_ADDRESSES:
+        try:
+            with socket.socket(family, socket.SOCK_DGRAM) as sock:
+                sock.connect(address)
+                addresses.append(sock.getsockname()[0])
+        except OSError:
+            addresses.append("")
+    if not any(addresses):
+        return None
+    return " ".join(addresses)
+
+
+def fetch_servers():
+    """Ask the Speedtest CLI for its list of nearby servers"""
+    try:
+        cli = get_cli()
+        output = subprocess.run([cli.path, "--servers", "--format=json"], capture_output=True,
+                                text=True, timeout=FETCH_TIMEOUT)
+    except (CliError, OSError, subprocess.TimeoutExpired) as e:
+        log.info("Could not fetch server list: %s", e)
+        return []
+
+    if output.returncode != 0:
+        log.info("Could not fetch server list: %s", output.stderr.strip())
+        return []
+
+    try:
+        data = json.loads(output.stdout)
+    except ValueError:
+        return []
+    return [server for server in data.get("servers", []) if "id" in server]
+
+
+def probe_latency(server):
+    """Return the TCP connect time to a server in milliseconds, or None"""
+    host = server.get("host")
+    if not host:
+        return None
+    if ":" in host:
+        host, _, port = host.rpartition(":")
+        port = int(port) if port.isdigit() else server.get("port", 8080)
+    else:
+        port = server.get("port", 8080)
+
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((host, port), timeout=PROBE_TIMEOUT):
+            pass
+    except OSError:
+        return None
+    return (time.perf_counter() - start) * 1000
+
+
+def rank_servers(servers):
+    """Probe all servers in parallel and sort them by connect latency"""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+        latencies = list(executor.map(probe_latency, servers))
+
+    ranked = []
+    for server, latency in zip(servers, latencies):
+        server = dict(server)
+        server["latency"] = latency
+        ranked.append(server)
+
+    # Unreachable servers go last, in the CLI's original order
+    ranked.sort(key=lambda server: (server["latency"] is None, server["latency"] or 0))
+    return ranked
+
+
+class ServerCache:
+    """Ranked list of Speedtest servers, cached on disk.
+
+    The list is valid for ttl seconds and only on the network it was
+    fetched on. Tests can then start with an explicit --server-id instead
+    of waiting for the CLI's own server discovery.
+    """
+
+    def __init__(self, ttl=SERVERS_TTL):
+        self.ttl = ttl
+        self.servers = []
+        self.fetched_at = 0.0
+        self.network = None
+
+        self._refresh_lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(cache_path()) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != CACHE_VERSION:
+            return
+        self.servers = data.get("servers", [])
+        self.fetched_at = data.get("fetched_at", 0.0)
+        self.network = data.get("network")
+
+    def save(self):
+        try:
+            os.makedirs(cache_dir(), exist_ok=True)
+            temp_path = cache_path() + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"version": CACHE_VERSION, "fetched_at": self.fetched_at,
+                           "network": self.network, "servers": self.servers}, f)
+            os.replace(temp_path, cache_path())
+        except OSError:
+            pass
+
+    def is_fresh(self):
+        return bool(self.servers) and time.time() - self.fetched_at < self.ttl
+
+    def invalidate(self):
+        self.servers = []
+        self.fetched_at = 0.0
+        self.save()
+
+    def best_server_id(self):
+        """The lowest latency server, or None if the cache can't be trusted"""
+        servers = self.servers
+        if not servers or not self.is_fresh() or servers[0].get("latency") is None:
+            return None
+        return servers[0]["id"]
+
+    def check_network(self):
+        """Invalidate the cache if we are on a different network than when it was fetched"""
+        if self.servers and network_key() != self.network:
+            log.info("Network changed, discarding cached server list")
+            self.invalidate()
+
+    def refresh(self):
+        """Fetch and rank the server list. Blocks for a few seconds."""
+        with self._refresh_lock:
+            network = network_key()
+            servers = fetch_servers()
+            if not servers:
+                return False
+
+            self.servers = rank_servers(servers)
+            self.fetched_at = time.time()
+            self.network = network
+            self.save()
+
+            best = self.servers[0]
+            log.info("Ranked %d servers, best is %s (%s) at %s ms",
+                     len(self.servers), best.get('name'), best['id'], best.get('latency'))
+            return True
+
+    def refresh_in_background(self, force=False, done=None):
+        """Refresh on a background thread unless the cache is still fresh.
+
+        done(success) is called on that thread when finished.
+        """
+        def refresh():
+            self.check_network()
+            if force or not self.is_fresh():
+                success = self.refresh()
+            else:
+                success = True
+            if done is not None:
+                done(success)
+
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+        return thread
@@ -0,0 +1,236 @@
+import logging
+import subprocess
+import threading
+import time
+
+from .cli import CliError, get_cli
+from .decoder import JSON_BACKEND, StreamDecoder, format_location
+from .log import OutputRing
+from .process import MAX_DURATION, STALL_TIMEOUT, TERMINATE_GRACE, stop_process
+from .timeline import Timeline
+
+# Only GLib-free modules may be imported here, so the headless mode can use
+# the same parsing as the GUI without loading GTK.
+
+ERROR_DETAIL_LINES = 20  # stderr lines quoted in error messages
+
+log = logging.getLogger(__name__)
+
+
+class SpeedtestError(Exception):
+    def __init__(self, message, output=None):
+        super().__init__(message)
+        # The CLI's last stdout and stderr lines, each prefixed with its stream
+        self.output = output or []
+
+
+def build_command(cli, server_id=None):
+    cmd = [cli.path, "--format=json", "--progress=yes"]
+    if server_id is not None:
+        cmd.append(f"--server-id={server_id}")
+    return cmd
+
+
+def parse_result(result, server_location="Unknown", timeline=None):
+    """Convert the CLI's final result object to the format used by the UI"""
+    # Extract server location from result if not already set
+    if "server" in result and server_location == "Unknown":
+        server_location = format_location(result["server"])
+
+    server = result.get('server', {})
+    return {
+        'download': result.get('download', {}).get('bandwidth', 0) * 8 / 1_000_000,  # Convert to Mbps
+        'upload': result.get('upload', {}).get('bandwidth', 0) * 8 / 1_000_000,      # Convert to Mbps
+        'ping': result.get('ping', {}).get('latency', 0),
+        'jitter': result.get('ping', {}).get('jitter', 0),
+        'packet_loss': result.get('packetLoss', 0),
+        'isp': result.get('isp', 'Unknown'),
+        'server': f"{server.get('name', 'Unknown')} ({server.get('id', 'Unknown')})",
+        'server_id': server.get('id'),
+        'server_location': server_location,
+        'result_url': result.get('result', {}).get('url'),
+        'timestamp': result.get('timestamp'),
+        # Everything else the CLI reported, kept in the history
+        'raw': result,
+        'timeline': timeline,
+    }
+
+
+class SpeedtestSession:
+    """Turns decoded CLI events into progress updates and a final result.
+
+    progress is called as progress(phase, value, status_text) with the same
+    phases the runner's "progress" signal uses. Every ping, download and
+    upload sample is also recorded in timeline, which the parsed result
+    includes.
+    """
+
+    def __init__(self, progress):
+        self.progress = progress
+
+        self.server_name = "Unknown"
+        self.server_location = "Unknown"
+        self.server_suffix = ""
+        self.download_status = "Running download test"
+        self.upload_status = "Running upload test"
+
+        self.result = None
+        self.error_message = None
+        self.timeline = Timeline()
+
+    def handle(self, event):
+        event_type = event.type
+        progress = self.progress
+
+        if event_type == "download":
+            # Emit both the progress percentage and the raw speed value
+            mbps = event.mbps
+            self.timeline.append("download", mbps, event.progress)
+            progress("download", event.progress, self.download_status)
+            progress("download_raw", mbps, self.download_status)
+
+        elif event_type == "upload":
+            mbps = event.mbps
+            self.timeline.append("upload", mbps, event.progress)
+            progress("upload", event.progress, self.upload_status)
+            progress("upload_raw", mbps, self.upload_status)
+
+        elif event_type == "ping":
+            self.timeline.append("ping", event.latency, event.progress)
+            status_message = f"Testing ping: {event.latency:.2f} ms{self.server_suffix}"
+            progress("ping", event.progress, status_message)
+
+        elif event_type == "testStart":
+            # Server info only changes here, so the status messages for the
+            # later phases are built once
+            self.server_name = event.server_name
+            self.server_location = event.server_location
+            if self.server_name != "Unknown" and self.server_location != "Unknown":
+                self.server_suffix = f" - {self.server_name} ({self.server_location})"
+            self.download_status = "Running download test" + self.server_suffix
+            self.upload_status = "Running upload test" + self.server_suffix
+
+            status_message = f"Testing with {self.server_name} ({self.server_location})"
+            progress("server_info", 0, status_message)
+
+        elif event_type == "result":
+            self.result = event.data
+
+        elif event_type == "log" and event.level == "error":
+            self.error_message = event.message
+
+    def parsed_result(self):
+        if self.result is None:
+            return None
+        return parse_result(self.result, self.server_location, self.timeline)
+
+
+def failure_message(session, returncode, output):
+    """Describe a run that ended without a result"""
+    details = session.error_message or "\n".join(output.lines("stderr")[-ERROR_DETAIL_LINES:])
+    if returncode != 0:
+        return f"Speedtest failed with code {returncode}: {details}"
+    return f"Speedtest finished without a result: {details}"
+
+
+def run_speedtest(progress, server_id=None, started=None, cancelled=None,
+                  stall_timeout=STALL_TIMEOUT, max_duration=MAX_DURATION, grace=TERMINATE_GRACE,
+                  binary=None):
+    """Run one test with the Speedtest CLI and return the parsed result.
+
+    Blocks until the CLI exits. started(process) is called once the CLI is
+    running, and the output stops being processed as soon as cancelled()
+    returns True, in which case None is returned. Raises SpeedtestError if
+    the test fails, or if the CLI writes nothing for stall_timeout seconds
+    or runs longer than max_duration seconds. None disables either limit.
+    binary overrides which Speedtest CLI executable is run.
+    """
+    try:
+        cli = get_cli(binary)
+    except CliError as e:
+        raise SpeedtestError(str(e))
+
+    log.debug("Using speedtest %s at %s", cli.version, cli.path)
+
+    cmd = build_command(cli, server_id)
+    log.debug("Running command: %s", cmd)
+
+    # Output is read unbuffered in binary mode and decoded by StreamDecoder
+    # as it arrives
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=0
+    )
+    if started is not None:
+        started(process)
+
+    # Recent output of both streams is kept for error reports
+    output = OutputRing()
+
+    def read_stderr():
+        for line in process.stderr:
+            output.record("stderr", line)
+            log.debug("stderr: %r", line)
+
+    stderr_thread = threading.Thread(target=read_stderr)
+    stderr_thread.daemon = True
+    stderr_thread.start()
+
+    session = SpeedtestSession(progress)
+    decoder = StreamDecoder(process.stdout, output=output)
+
+    # The watchdog stops the CLI if it goes quiet or runs too long; the
+    # reader below then sees the end of the output. Any output counts,
+    # even lines that aren't events.
+    start_time = time.monotonic()
+    timed_out = []
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(1.0):
+            now = time.monotonic()
+            if stall_timeout is not None and now - decoder.last_read > stall_timeout:
+                timed_out.append(f"Speedtest stalled: no output for {stall_timeout:.0f} seconds")
+            elif max_duration is not None and now - start_time > max_duration:
+                timed_out.append(f"Speedtest timed out after {max_duration:.0f} seconds")
+            else:
+                continue
+            log.warning("%s", timed_out[0])
+            stop_process(process, grace)
+            return
+
+    if stall_timeout is not None or max_duration is not None:
+        watchdog = threading.Thread(target=watch)
+        watchdog.daemon = True
+        watchdog.start()
+
+    try:
+        for event in decoder:
+            if cancelled is not None and cancelled():
+                break
+            session.handle(event)
+    finally:
+        done.set()
+        # Don't wait on a CLI we stopped reading from, it may never exit
+        stop_process(process, grace)
+        process.wait()
+        stderr_thread.join(timeout=1)
+
+    log.debug("Decoded %d lines (%d malformed) using %s",
+              decoder.lines, decoder.malformed, JSON_BACKEND)
+
+    if cancelled is not None and cancelled():
+        log.debug("Process was cancelled")
+        return None
+
+    if timed_out:
+        raise SpeedtestError(timed_out[0], output.lines())
+
+    log.debug("Process completed with return code: %s", process.returncode)
+    result = session.parsed_result()
+    if result is None:
+        raise SpeedtestError(failure_message(session, process.returncode, output), output.lines())
+
+    return result
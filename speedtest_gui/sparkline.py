@@ -0,0 +1,158 @@
+import gi
+gi.require_version('Gtk', '4.0')
+gi.require_version('Graphene', '1.0')
+from gi.repository import Gtk, Graphene
+
+import cairo
+import time
+
+from .gauge import IDLE_GRADIENT, PHASE_GRADIENTS, rgb
+from .series import RingBuffer, lttb
+
+LINE_WIDTH = 2
+PADDING = 2
+
+# Initial axis ranges; both grow when a sample falls outside them
+INITIAL_SECONDS = 15
+INITIAL_MAX = 10
+GROWTH = 1.5
+
+
+class SpeedSparkline(Gtk.Widget):
+    """Throughput-over-time chart for the current test phase.
+
+    Samples are kept in a preallocated ring buffer per phase. The line is
+    drawn into a cached surface and each new sample only strokes the
+    segment from the previous point. The whole line is redrawn only when
+    the axes have to grow or the widget is resized, and then at most one
+    point per pixel column is drawn, chosen with LTTB.
+    """
+    __gtype_name__ = 'SpeedSparkline'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.buffers = {"download": RingBuffer(), "upload": RingBuffer()}
+        self.phase = None
+        self.phase_start = 0.0
+
+        self.time_span = INITIAL_SECONDS
+        self.max_value = INITIAL_MAX
+
+        self._surface = None
+        self._surface_key = None
+        self._last_point = None
+
+    def clear(self):
+        for buffer in self.buffers.values():
+            buffer.clear()
+        self.phase = None
+        self._reset_axes()
+        self._surface = None
+        self.queue_draw()
+
+    def add_sample(self, phase, value, draw=True):
+        """Add a sample of phase at the current time.
+
+        Without draw the sample is only recorded; the line is redrawn from
+        the buffer once the widget is drawn again.
+        """
+        buffer = self.buffers.get(phase)
+        if buffer is None:
+            return
+
+        now = time.monotonic()
+        if phase != self.phase:
+            # Each phase gets its own chart starting from zero
+            self.phase = phase
+            self.phase_start = now
+            buffer.clear()
+            self._reset_axes()
+            self._surface = None
+
+        elapsed = now - self.phase_start
+        buffer.append(elapsed, value)
+
+        if elapsed > self.time_span or value > self.max_value:
+            while elapsed > self.time_span:
+                self.time_span *= GROWTH
+            while value > self.max_value:
+                self.max_value *= GROWTH
+            self._surface = None
+        elif not draw:
+            self._surface = None
+        elif self._surface is not None:
+            self._append_segment(elapsed, value)
+
+        if draw:
+            self.queue_draw()
+
+    def _reset_axes(self):
+        self.time_span = INITIAL_SECONDS
+        self.max_value = INITIAL_MAX
+        self._last_point = None
+
+    def _to_point(self, elapsed, value, width, height):
+        x = PADDING + (width - 2 * PADDING) * elapsed / self.time_span
+        y = height - PADDING - (height - 2 * PADDING) * value / self.max_value
+        return x, y
+
+    def _prepare_context(self, surface):
+        cr = cairo.Context(surface)
+        start, stop = PHASE_GRADIENTS.get(self.phase, IDLE_GRADIENT)
+        cr.set_source_rgb(*rgb(start))
+        cr.set_line_width(LINE_WIDTH)
+        cr.set_line_join(cairo.LINE_JOIN_ROUND)
+        cr.set_line_cap(cairo.LINE_CAP_ROUND)
+        return cr
+
+    def _append_segment(self, elapsed, value):
+        width, height, scale = self._surface_key
+        point = self._to_point(elapsed, value, width, height)
+        if self._last_point is not None:
+            cr = self._prepare_context(self._surface)
+            cr.move_to(*self._last_point)
+            cr.line_to(*point)
+            cr.stroke()
+        self._last_point = point
+
+    def _redraw_surface(self, width, height, scale):
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width * scale, height * scale)
+        surface.set_device_scale(scale, scale)
+        self._surface = surface
+        self._surface_key = (width, height, scale)
+        self._last_point = None
+
+        buffer = self.buffers.get(self.phase)
+        if buffer is None or not len(buffer):
+            return
+
+        times, values = buffer.samples()
+        indices = lttb(times, values, max(width - 2 * PADDING, 3))
+
+        cr = self._prepare_context(surface)
+        for index in indices:
+            point = self._to_point(times[index], values[index], width, height)
+            if self._last_point is None:
+                cr.move_to(*point)
+            else:
+                cr.line_to(*point)
+            self._last_point = point
+        cr.stroke()
+
+        # Continue incremental drawing from the real last sample
+        self._last_point = self._to_point(times[-1], values[-1], width, height)
+
+    def do_snapshot(self, snapshot):
+        width = self.get_width()
+        height = self.get_height()
+        if width <= 0 or height <= 0:
+            return
+
+        scale = self.get_scale_factor()
+        if self._surface is None or self._surface_key != (width, height, scale):
+            self._redraw_surface(width, height, scale)
+
+        cr = snapshot.append_cairo(Graphene.Rect().init(0, 0, width, height))
+        cr.set_source_surface(self._surface, 0, 0)
+        cr.paint()
@@ -2,277 +2,181 @@ import gi
 gi.require_version('GLib', '2.0')
 from gi.repository import GObject, GLib
 
-import subprocess
-import json
-import re
+import logging
 import threading
 import time
-import shlex
-import sys
-import os
+
+from .coalescer import ProgressCoalescer
+from .process import MAX_DURATION, STALL_TIMEOUT, TERMINATE_GRACE, stop_process
+
+log = logging.getLogger(__name__)
 
 class SpeedtestRunner(GObject.Object):
     __gsignals__ = {
+        'started': (GObject.SignalFlags.RUN_FIRST, None, ()),
         'progress': (GObject.SignalFlags.RUN_FIRST, None, (str, float, str)),
         'completed': (GObject.SignalFlags.RUN_FIRST, None, (object,)),
-        'error': (GObject.SignalFlags.RUN_FIRST, None, (str,))
+        'error': (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+        'cancelled': (GObject.SignalFlags.RUN_FIRST, None, ())
     }
     
-    def __init__(self):
+    def __init__(self, max_progress_rate=None, server_cache=None,
+                 terminate_grace=TERMINATE_GRACE, stall_timeout=STALL_TIMEOUT,
+                 max_duration=MAX_DURATION, binary=None):
         super().__init__()
+        # Optional ServerCache used to skip the CLI's server discovery
+        self.server_cache = server_cache
         self.running = False
         self.process = None
         self.thread = None
+        self.server_id = None
+        
+        # Speedtest CLI to run instead of the one found by searching
+        self.binary = binary
+        
+        # The CLI's last output lines when the most recent test failed
+        self.error_output = []
+        
+        # Seconds before a cancelled CLI is killed, and the watchdog limits
+        self.terminate_grace = terminate_grace
+        self.stall_timeout = stall_timeout
+        self.max_duration = max_duration
         
-    def start_test(self):
+        # Every run gets a new generation. Anything a worker thread reports
+        # for an older generation comes from a cancelled run and is dropped.
+        self.generation = 0
+        self._generation_lock = threading.Lock()
+        
+        # Progress events are merged so the UI sees at most one update per
+        # phase per frame, however fast the CLI reports
+        self.coalescer = ProgressCoalescer(self._emit_progress, max_progress_rate)
+        
+        # Optional LatencyTracker timing progress events on their way to the
+        # screen
+        self.latency = None
+        
+    def set_latency_tracker(self, tracker):
+        self.latency = tracker
+        self.coalescer.tracker = tracker
+        
+    def start_test(self, server_id=None):
         if self.running:
             return
             
+        self.server_id = server_id
         self.running = True
-        self.thread = threading.Thread(target=self._run_test)
+        with self._generation_lock:
+            self.generation += 1
+            generation = self.generation
+        self.coalescer.discard()
+        self.coalescer.reset_stats()
+        self.thread = threading.Thread(target=self._run_test, args=(generation,))
         self.thread.daemon = True
         self.thread.start()
         
+        self.emit("started")
+        
     def cancel_test(self):
         if not self.running:
             return
             
+        # Retire the run before discarding its progress, so nothing it
+        # pushes afterwards can reach the window
+        with self._generation_lock:
+            self.generation += 1
+        self.coalescer.discard()
+        
+        # SIGTERM now and SIGKILL after the grace period. The worker thread
+        # unblocks as soon as the CLI's output closes.
         if self.process:
-            try:
-                self.process.terminate()
-            except:
-                pass
+            stop_process(self.process, self.terminate_grace)
                 
         self.running = False
+        self.process = None
+        self.emit("cancelled")
         
-    def _run_test(self):
-        try:
-            # Emit progress for initialization
-            GLib.idle_add(self.emit, "progress", "init", 0.1, "Finding optimal server...")
-            
-            print("DEBUG: Starting speedtest process")
-            
-            # Path to the Ookla speedtest CLI - updated path
-            speedtest_path = "./ookla-speedtest-gui/speedtest"
-            
-            # Check if the file exists at the specified path
-            if not os.path.isfile(speedtest_path):
-                # Try alternative paths
-                alternative_paths = [
-                    "ookla-speedtest/speedtest",  # No leading ./
-                    "/home/macuseri686/ookla-speedtest-gui/speedtest",  # Full path
-                    "speedtest"  # Just the command name, rely on PATH
-                ]
-                
-                for path in alternative_paths:
-                    if os.path.isfile(path):
-                        speedtest_path = path
-                        print(f"DEBUG: Found speedtest at {speedtest_path}")
-                        break
-                    elif path == "speedtest":
-                        # Try to find it in PATH
-                        try:
-                            which_result = subprocess.run(["which", "speedtest"], 
-                                                         capture_output=True, text=True)
-                            if which_result.returncode == 0:
-                                speedtest_path = which_result.stdout.strip()
-                                print(f"DEBUG: Found speedtest in PATH at {speedtest_path}")
-                                break
-                        except:
-                            pass
-            
-            print(f"DEBUG: Using speedtest path: {speedtest_path}")
-            
-            # Run the speedtest command with progress output
-            cmd = [speedtest_path, "--format=json", "--progress=yes"]
-            print(f"DEBUG: Running command: {' '.join(cmd)}")
-            
-            # First check if speedtest CLI is available
-            try:
-                print("DEBUG: Checking speedtest CLI availability")
-                version_check = subprocess.run(
-                    [speedtest_path, "--version"], 
-                    capture_output=True, 
-                    text=True, 
-                    timeout=5
-                )
-                print(f"DEBUG: Version check result: {version_check.returncode}")
-                print(f"DEBUG: Version check stdout: {version_check.stdout}")
-                print(f"DEBUG: Version check stderr: {version_check.stderr}")
-                
-                if version_check.returncode != 0:
-                    error_msg = f"Speedtest CLI not working properly: {version_check.stderr}"
-                    print(f"ERROR: {error_msg}")
-                    GLib.idle_add(self.emit, "error", error_msg)
-                    self.running = False
-                    return
-            except Exception as e:
-                error_msg = f"Failed to run speedtest command: {str(e)}"
-                print(f"ERROR: {error_msg}")
-                GLib.idle_add(self.emit, "error", error_msg)
-                self.running = False
-                return
-            
-            # Now run the actual test
-            print("DEBUG: Starting actual speedtest")
-            self.process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,  # Line buffered
-                universal_newlines=True
-            )
-            
-            # Start a thread to read stderr and print it
-            def read_stderr():
-                for line in self.process.stderr:
-                    print(f"DEBUG STDERR: {line.strip()}")
-            
-            stderr_thread = threading.Thread(target=read_stderr)
-            stderr_thread.daemon = True
-            stderr_thread.start()
-            
-            # Variables to store server info
-            server_name = "Unknown"
-            server_location = "Unknown"
-            
-            # Process output in real-time
-            output = ""
-            for line in self.process.stdout:
-                if not self.running:
-                    break
-                
-                line = line.strip()
-                print(f"DEBUG STDOUT: {line}")
-                
-                # Try to parse progress information
-                try:
-                    data = json.loads(line)
-                    
-                    # Check if this is a progress update
-                    if "type" in data:
-                        # Extract server info from testStart event
-                        if data["type"] == "testStart" and "server" in data:
-                            server_name = data["server"].get("name", "Unknown")
-                            server_location = data["server"].get("location", "Unknown")
-                            country = data["server"].get("country", "")
-                            
-                            # Combine location and country if both are available
-                            if server_location and country and server_location != country:
-                                server_location = f"{server_location}, {country}"
-                            elif not server_location and country:
-                                server_location = country
-                            
-                            # Update status with server info
-                            status_message = f"Testing with {server_name} ({server_location})"
-                            GLib.idle_add(self.emit, "progress", "server_info", 0, status_message)
-                        
-                        if data["type"] == "download":
-                            # Convert bandwidth from bytes/s to Mbps (bytes/s * 8 / 1,000,000)
-                            bandwidth_mbps = data["download"]["bandwidth"] * 8 / 1_000_000
-                            progress = data["download"].get("progress", 0)
-                            
-                            # Create a status message with the current speed and server info
-                            status_message = f"Running download test"
-                            if server_name != "Unknown" and server_location != "Unknown":
-                                status_message += f" - {server_name} ({server_location})"
-                            
-                            # Emit both the progress percentage and the raw speed value
-                            GLib.idle_add(self.emit, "progress", "download", progress, status_message)
-                            GLib.idle_add(self.emit, "progress", "download_raw", bandwidth_mbps, status_message)
-                            
-                        elif data["type"] == "upload":
-                            # Convert bandwidth from bytes/s to Mbps (bytes/s * 8 / 1,000,000)
-                            bandwidth_mbps = data["upload"]["bandwidth"] * 8 / 1_000_000
-                            progress = data["upload"].get("progress", 0)
-                            
-                            # Create a status message with the current speed and server info
-                            status_message = f"Running upload test"
-                            if server_name != "Unknown" and server_location != "Unknown":
-                                status_message += f" - {server_name} ({server_location})"
-                            
-                            # Emit both the progress percentage and the raw speed value
-                            GLib.idle_add(self.emit, "progress", "upload", progress, status_message)
-                            GLib.idle_add(self.emit, "progress", "upload_raw", bandwidth_mbps, status_message)
-                            
-                        elif data["type"] == "ping":
-                            # Update status for ping test
-                            progress = data["ping"].get("progress", 0)
-                            latency = data["ping"].get("latency", 0)
-                            status_message = f"Testing ping: {latency:.2f} ms"
-                            if server_name != "Unknown" and server_location != "Unknown":
-                                status_message += f" - {server_name} ({server_location})"
-                            GLib.idle_add(self.emit, "progress", "ping", progress, status_message)
-                            
-                        # Check if this is the final result
-                        elif data["type"] == "result":
-                            output = line
-                    
-                except json.JSONDecodeError:
-                    # Not valid JSON or not a progress update
-                    pass
+    def _emit_progress(self, phase, value, status):
+        self.emit("progress", phase, value, status)
+        
+    def _push_progress(self, generation, phase, value, status, read_at=None):
+        with self._generation_lock:
+            if generation == self.generation:
+                self.coalescer.push(phase, value, status, read_at)
+        
+    def _emit_final(self, generation, signal, payload):
+        if generation != self.generation:
+            return GLib.SOURCE_REMOVE
+        self.running = False
+        self.process = None
+        
+        # Deliver any progress still waiting for a frame before the final state
+        self.coalescer.flush()
+        stats = self.coalescer.stats()
+        log.debug("Progress events: %d received, %d delivered, %d merged in %d flushes",
+                  stats['received'], stats['delivered'], stats['merged'], stats['flushes'])
+        self.emit(signal, payload)
+        return GLib.SOURCE_REMOVE
+        
+    def _set_process(self, generation, process):
+        with self._generation_lock:
+            current = generation == self.generation
+            if current:
+                self.process = process
+        # cancel_test() may have run before the CLI was started
+        if not current:
+            stop_process(process, self.terminate_grace)
+        
+    def _run_test(self, generation):
+        # Imported here so the decoder isn't loaded before the first test
+        from .session import SpeedtestError, run_speedtest
+        
+        def progress(phase, value, status):
+            # The line behind this event has just been read and decoded
+            read_at = time.monotonic() if self.latency is not None else None
+            self._push_progress(generation, phase, value, status, read_at)
             
-            # Parse the JSON result
-            if output:
-                print("DEBUG: Processing JSON result")
-                try:
-                    result = json.loads(output)
-                    print(f"DEBUG: Parsed JSON successfully")
-                    
-                    # Extract server location from result if not already set
-                    if "server" in result and server_location == "Unknown":
-                        server_location = result["server"].get("location", "Unknown")
-                        country = result["server"].get("country", "")
-                        if server_location and country and server_location != country:
-                            server_location = f"{server_location}, {country}"
-                        elif not server_location and country:
-                            server_location = country
-                    
-                    # Convert to our format
-                    parsed_result = {
-                        'download': result.get('download', {}).get('bandwidth', 0) * 8 / 1_000_000,  # Convert to Mbps
-                        'upload': result.get('upload', {}).get('bandwidth', 0) * 8 / 1_000_000,      # Convert to Mbps
-                        'ping': result.get('ping', {}).get('latency', 0),
-                        'jitter': result.get('ping', {}).get('jitter', 0),
-                        'packet_loss': result.get('packetLoss', 0),
-                        'isp': result.get('isp', 'Unknown'),
-                        'server': f"{result.get('server', {}).get('name', 'Unknown')} ({result.get('server', {}).get('id', 'Unknown')})",
-                        'server_location': server_location,
-                        'result_url': result.get('result', {}).get('url')
-                    }
-                    
-                    print(f"DEBUG: Emitting completed signal with results: {parsed_result}")
-                    GLib.idle_add(self.emit, "completed", parsed_result)
-                except json.JSONDecodeError as e:
-                    print(f"Error parsing JSON: {e}")
-                    print(f"Output: {output}")
-                    GLib.idle_add(self.emit, "error", f"Failed to parse speedtest results: {str(e)}")
+        def cancelled():
+            return generation != self.generation
             
-            # Get the return code
-            print("DEBUG: Waiting for process to complete")
-            self.process.wait()
+        try:
+            # Use the best server from the ranked list when we have one, so
+            # the CLI doesn't spend the first seconds finding a server
+            server_id = self.server_id
+            if server_id is None and self.server_cache is not None:
+                server_id = self.server_cache.best_server_id()
             
-            if not self.running:
-                print("DEBUG: Process was cancelled")
-                return
+            # Emit progress for initialization
+            if server_id is None:
+                progress("init", 0.1, "Finding optimal server...")
+            else:
+                progress("init", 0.1, "Connecting to server...")
+            
+            log.debug("Starting speedtest process")
+            result = run_speedtest(progress,
+                                   server_id=server_id,
+                                   started=lambda process: self._set_process(generation, process),
+                                   cancelled=cancelled,
+                                   stall_timeout=self.stall_timeout,
+                                   max_duration=self.max_duration,
+                                   grace=self.terminate_grace,
+                                   binary=self.binary)
+            
+            if result is not None:
+                log.debug("Emitting completed signal with results: %s", result)
+                GLib.idle_add(self._emit_final, generation, "completed", result)
                 
-            print(f"DEBUG: Process completed with return code: {self.process.returncode}")
-            if self.process.returncode != 0 and not output:
-                stderr_output = self.process.stderr.read()
-                error_msg = f"Speedtest failed with code {self.process.returncode}: {stderr_output.strip()}"
-                print(f"ERROR: {error_msg}")
-                GLib.idle_add(self.emit, "error", error_msg)
+        except SpeedtestError as e:
+            if not cancelled():
+                error_msg = str(e)
+                self.error_output = e.output
+                log.error("%s\nRecent speedtest output:\n%s", error_msg, "\n".join(e.output))
+                GLib.idle_add(self._emit_final, generation, "error", error_msg)
                 
         except Exception as e:
-            if self.running:
+            if not cancelled():
                 error_msg = f"Unexpected error: {str(e)}"
-                print(f"ERROR: {error_msg}")
-                import traceback
-                traceback.print_exc()
-                GLib.idle_add(self.emit, "error", error_msg)
+                log.exception("%s", error_msg)
+                GLib.idle_add(self._emit_final, generation, "error", error_msg)
                 
         finally:
-            print("DEBUG: Test finished, cleaning up")
-            self.running = False
-            self.process = None 
\ No newline at end of file
+            log.debug("Test finished, cleaning up")
@@ -0,0 +1,492 @@
+import datetime
+import math
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Metrics summarised, as named in results and history rows
+METRICS = ("download", "upload", "ping", "jitter")
+
+# Local hours counted as the evening peak, when most people are online
+PEAK_HOURS = range(18, 23)
+
+# Hourly buckets are only kept this long; days and totals forever
+HOUR_RETENTION_DAYS = 31
+
+# Windows shown in the summary, as (title, days, hours of the day or None).
+# days None means all results.
+WINDOWS = (
+    ("Today", 1, None),
+    ("Last 7 days", 7, None),
+    ("Last 30 days", 30, None),
+    ("Evening peak, last 30 days", 30, PEAK_HOURS),
+    ("All results", None, None),
+)
+
+# Rows handled per NumPy batch during a rebuild
+REBUILD_CHUNK = 100_000
+
+# history.COLUMNS positions of the fields a rebuild needs
+TIMESTAMP, SERVER_ID, SERVER = 0, 1, 2
+METRIC_COLUMNS = {"download": 5, "upload": 6, "ping": 7, "jitter": 8}
+
+
+class RunningStats:
+    """Count, mean, variance, minimum and maximum, updated one value at a time.
+
+    Uses Welford's algorithm, and Chan et al.'s formula to merge two.
+    """
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    @classmethod
+    def from_moments(cls, count, mean, m2, minimum, maximum):
+        stats = cls()
+        stats.count, stats.mean, stats.m2, stats.min, stats.max = count, mean, m2, minimum, maximum
+        return stats
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+
+class TDigest:
+    """Mergeable sketch of a distribution for estimating quantiles.
+
+    A merging t-digest (Dunning and Ertl) with the k1 scale function:
+    values are clustered into at most about compression centroids, small
+    ones near the tails so that extreme quantiles stay accurate. Adding
+    values is amortised O(1); merging two digests costs O(compression).
+    """
+
+    BUFFER_FACTOR = 5
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer = []
+
+    @classmethod
+    def from_centroids(cls, means, weights, minimum, maximum, compression=100):
+        digest = cls(compression)
+        digest.means = list(means)
+        digest.weights = list(weights)
+        digest.count = sum(digest.weights)
+        digest.min, digest.max = minimum, maximum
+        return digest
+
+    def add(self, value, weight=1):
+        self._buffer.append((value, weight))
+        self.count += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self._buffer) >= self.BUFFER_FACTOR * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        if not other.count:
+            return
+        other._compress()
+        self._buffer.extend(zip(other.means, other.weights))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self._buffer) >= self.BUFFER_FACTOR * self.compression:
+            self._compress()
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k):
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(list(zip(self.means, self.weights)) + self._buffer)
+        self._buffer = []
+
+        total = self.count
+        means, weights = [], []
+        mean, weight = points[0]
+        done = 0.0
+        limit = self._q(self._k(0) + 1) * total
+        for point_mean, point_weight in points[1:]:
+            if done + weight + point_weight <= limit:
+                weight += point_weight
+                mean += (point_mean - mean) * point_weight / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                done += weight
+                limit = self._q(self._k(done / total) + 1) * total
+                mean, weight = point_mean, point_weight
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def quantile(self, q):
+        """Estimate the q quantile, 0 <= q <= 1. None when empty."""
+        self._compress()
+        if not self.count:
+            return None
+        means, weights = self.means, self.weights
+        if len(means) == 1:
+            return means[0]
+
+        index = q * self.count
+        if index <= weights[0] / 2:
+            return self.min + (means[0] - self.min) * index / (weights[0] / 2)
+
+        # Interpolate between the centres of neighbouring centroids
+        centre = weights[0] / 2
+        for i in range(len(means) - 1):
+            next_centre = centre + (weights[i] + weights[i + 1]) / 2
+            if index <= next_centre:
+                fraction = (index - centre) / (next_centre - centre)
+                return means[i] + (means[i + 1] - means[i]) * fraction
+            centre = next_centre
+
+        last = weights[-1] / 2
+        fraction = min((index - centre) / last, 1.0) if last else 1.0
+        return means[-1] + (self.max - means[-1]) * fraction
+
+
+class Aggregate:
+    """RunningStats and a TDigest over the same values"""
+
+    __slots__ = ("stats", "digest")
+
+    def __init__(self, stats=None, digest=None):
+        self.stats = stats or RunningStats()
+        self.digest = digest or TDigest()
+
+    def add(self, value):
+        self.stats.add(value)
+        self.digest.add(value)
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        self.digest.merge(other.digest)
+
+    def to_dict(self):
+        stats = self.stats
+        if not stats.count:
+            return {"count": 0}
+        return {"count": stats.count, "mean": stats.mean, "stddev": stats.stddev,
+                "min": stats.min, "max": stats.max,
+                "p50": self.digest.quantile(0.5), "p95": self.digest.quantile(0.95)}
+
+
+class Series:
+    """Aggregates of one metric, bucketed by local hour and day and in total.
+
+    Days are keyed by their date's ordinal and hours by day * 24 + hour.
+    """
+
+    __slots__ = ("total", "days", "hours")
+
+    def __init__(self):
+        self.total = Aggregate()
+        self.days = {}
+        self.hours = {}
+
+    def add(self, value, hour):
+        self.total.add(value)
+        for buckets, key in ((self.days, hour // 24), (self.hours, hour)):
+            aggregate = buckets.get(key)
+            if aggregate is None:
+                aggregate = buckets[key] = Aggregate()
+            aggregate.add(value)
+
+    def roll_up(self):
+        """Rebuild days and total from the hours"""
+        self.days = {}
+        self.total = Aggregate()
+        for hour in sorted(self.hours):
+            day = self.days.get(hour // 24)
+            if day is None:
+                day = self.days[hour // 24] = Aggregate()
+            day.merge(self.hours[hour])
+        for day in self.days.values():
+            self.total.merge(day)
+
+    def prune(self, oldest_day):
+        for hour in [hour for hour in self.hours if hour // 24 < oldest_day]:
+            del self.hours[hour]
+
+
+def hour_key(timestamp):
+    local = time.localtime(timestamp)
+    day = datetime.date(local.tm_year, local.tm_mon, local.tm_mday).toordinal()
+    return day * 24 + local.tm_hour
+
+
+def oldest_day(now):
+    """The first day whose hourly buckets are kept at time now"""
+    return hour_key(now) // 24 - HOUR_RETENTION_DAYS
+
+
+class StatsEngine:
+    """Streaming summaries of the result history.
+
+    Keeps a Series for every metric, both per server and over all servers
+    (server None). add() updates them with one result as it completes;
+    rebuild() recomputes everything from history rows, with NumPy if it is
+    installed. Summaries merge at most a few dozen buckets, however many
+    results there are. Hourly buckets past the retention are pruned when
+    the day changes, not on every add().
+    """
+
+    def __init__(self):
+        self.series = {}
+        self.server_names = {}
+        self._summaries = {}
+        # The oldest day kept by the last prune; the buckets only need
+        # pruning again once that moves on
+        self._oldest_day = None
+
+    def _series(self, metric, server_id):
+        series = self.series.get((metric, server_id))
+        if series is None:
+            series = self.series[(metric, server_id)] = Series()
+        return series
+
+    def add(self, result, timestamp=None):
+        """Update the aggregates with a completed result dict"""
+        hour = hour_key(time.time() if timestamp is None else timestamp)
+        server_id = result.get("server_id")
+        if server_id is not None and result.get("server"):
+            self.server_names[server_id] = result["server"]
+
+        for metric in METRICS:
+            value = result.get(metric)
+            if value is None:
+                continue
+            self._series(metric, None).add(value, hour)
+            if server_id is not None:
+                self._series(metric, server_id).add(value, hour)
+
+        self._summaries = {}
+        if self._oldest_day != oldest_day(time.time()):
+            self.prune()
+
+    def rebuild(self, rows, use_numpy=None):
+        """Recompute all aggregates from rows in history.COLUMNS order"""
+        self.series = {}
+        self.server_names = {}
+        self._summaries = {}
+        if use_numpy is None:
+            use_numpy = numpy is not None
+
+        if use_numpy:
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= REBUILD_CHUNK:
+                    self._add_hours_vectorized(chunk)
+                    chunk = []
+            if chunk:
+                self._add_hours_vectorized(chunk)
+        else:
+            for row in rows:
+                self._add_hours(row)
+
+        for series in self.series.values():
+            series.roll_up()
+        self.prune()
+
+    def _add_hours(self, row):
+        hour = hour_key(row[TIMESTAMP])
+        server_id = row[SERVER_ID]
+        if server_id is not None and row[SERVER]:
+            self.server_names[server_id] = row[SERVER]
+        for metric, column in METRIC_COLUMNS.items():
+            value = row[column]
+            if value is None:
+                continue
+            keys = [(metric, None)]
+            if server_id is not None:
+                keys.append((metric, server_id))
+            for key in keys:
+                hours = self._series(*key).hours
+                aggregate = hours.get(hour)
+                if aggregate is None:
+                    aggregate = hours[hour] = Aggregate()
+                aggregate.add(value)
+
+    def _add_hours_vectorized(self, rows):
+        for row in rows:
+            if row[SERVER_ID] is not None and row[SERVER]:
+                self.server_names[row[SERVER_ID]] = row[SERVER]
+
+        timestamps = numpy.fromiter((row[TIMESTAMP] for row in rows), float, len(rows))
+        server_ids = numpy.fromiter((-1 if row[SERVER_ID] is None else row[SERVER_ID]
+                                     for row in rows), numpy.int64, len(rows))
+
+        # Local time zones are at most quarter-hour offsets from UTC, so one
+        # lookup per UTC quarter hour finds every row's local hour
+        quarters, inverse = numpy.unique(numpy.floor_divide(timestamps, 900).astype(numpy.int64),
+                                         return_inverse=True)
+        hours = numpy.array([hour_key(quarter * 900) for quarter in quarters.tolist()],
+                            numpy.int64)[inverse]
+
+        for metric, column in METRIC_COLUMNS.items():
+            values = numpy.fromiter((numpy.nan if row[column] is None else row[column]
+                                     for row in rows), float, len(rows))
+            present = ~numpy.isnan(values)
+            # Group by hour over all servers, and by hour and server
+            self._merge_groups(metric, None, hours[present], None, values[present])
+            known = present & (server_ids >= 0)
+            self._merge_groups(metric, True, hours[known], server_ids[known], values[known])
+
+    def _merge_groups(self, metric, per_server, hours, server_ids, values):
+        if not len(values):
+            return
+        compression = TDigest().compression
+        groups = hours if server_ids is None else hours * (1 << 32) + server_ids
+        order = numpy.lexsort((values, groups))
+        groups, values = groups[order], values[order]
+
+        starts = numpy.flatnonzero(numpy.diff(groups)) + 1
+        starts = numpy.concatenate(([0], starts))
+        counts = numpy.diff(numpy.concatenate((starts, [len(values)])))
+        means = numpy.add.reduceat(values, starts) / counts
+        deviations = values - numpy.repeat(means, counts)
+        m2s = numpy.add.reduceat(deviations * deviations, starts)
+        minimums = values[starts]
+        maximums = values[starts + counts - 1]
+
+        # Centroids: the sorted values of each group split at whole steps of
+        # the k1 scale function, which bounds them like _compress() does
+        ranks = numpy.arange(len(values)) - numpy.repeat(starts, counts)
+        quantiles = (ranks + 0.5) / numpy.repeat(counts, counts)
+        labels = numpy.floor(compression / (2 * math.pi)
+                             * numpy.arcsin(2 * quantiles - 1)).astype(numpy.int64)
+        breaks = (numpy.diff(groups) != 0) | (numpy.diff(labels) != 0)
+        centroid_starts = numpy.concatenate(([0], numpy.flatnonzero(breaks) + 1))
+        centroid_weights = numpy.diff(numpy.concatenate((centroid_starts, [len(values)])))
+        centroid_means = numpy.add.reduceat(values, centroid_starts) / centroid_weights
+        first_centroid = numpy.searchsorted(centroid_starts, starts)
+        last_centroid = numpy.concatenate((first_centroid[1:], [len(centroid_starts)]))
+
+        group_keys = groups[starts].tolist()
+        centroid_means = centroid_means.tolist()
+        centroid_weights = centroid_weights.tolist()
+        for index, group in enumerate(group_keys):
+            if per_server:
+                hour, server_id = group >> 32, group & 0xffffffff
+            else:
+                hour, server_id = group, None
+            first, last = first_centroid[index], last_centroid[index]
+            aggregate = Aggregate(
+                RunningStats.from_moments(int(counts[index]), float(means[index]),
+                                          float(m2s[index]), float(minimums[index]),
+                                          float(maximums[index])),
+                TDigest.from_centroids(centroid_means[first:last], centroid_weights[first:last],
+                                       float(minimums[index]), float(maximums[index])))
+            hours = self._series(metric, server_id).hours
+            if hour in hours:
+                hours[hour].merge(aggregate)
+            else:
+                hours[hour] = aggregate
+
+    def prune(self, now=None):
+        self._oldest_day = oldest_day(time.time() if now is None else now)
+        for series in self.series.values():
+            series.prune(self._oldest_day)
+
+    def servers(self):
+        """(server_id, name) of every server with results, by name"""
+        ids = {server_id for metric, server_id in self.series if server_id is not None}
+        return sorted(((server_id, self.server_names.get(server_id, str(server_id)))
+                       for server_id in ids), key=lambda server: server[1])
+
+    def window(self, metric, server_id=None, days=None, hours_of_day=None, now=None):
+        """Return the Aggregate of metric over the last days.
+
+        days counts today, and None means all results. hours_of_day limits
+        the window to those local hours, which only works for days within
+        HOUR_RETENTION_DAYS.
+        """
+        series = self.series.get((metric, server_id))
+        aggregate = Aggregate()
+        if series is None:
+            return aggregate
+        if days is None:
+            aggregate.merge(series.total)
+            return aggregate
+
+        today = hour_key(time.time() if now is None else now) // 24
+        first_day = today - days + 1
+        if hours_of_day is None:
+            for day in range(first_day, today + 1):
+                if day in series.days:
+                    aggregate.merge(series.days[day])
+        else:
+            for day in range(first_day, today + 1):
+                for hour in hours_of_day:
+                    bucket = series.hours.get(day * 24 + hour)
+                    if bucket is not None:
+                        aggregate.merge(bucket)
+        return aggregate
+
+    def summary(self, server_id=None):
+        """Return {window title: {metric: Aggregate.to_dict()}} for WINDOWS.
+
+        Cached until the next add() or rebuild().
+        """
+        summary = self._summaries.get(server_id)
+        if summary is None:
+            summary = {title: {metric: self.window(metric, server_id, days, hours).to_dict()
+                               for metric in METRICS}
+                       for title, days, hours in WINDOWS}
+            self._summaries[server_id] = summary
+        return summary
@@ -0,0 +1,118 @@
+import gi
+gi.require_version('Gtk', '4.0')
+gi.require_version('Adw', '1')
+from gi.repository import Gtk, Adw
+
+from .stats import METRICS, WINDOWS
+
+METRIC_NAMES = {
+    "download": ("Download", "Mbps"),
+    "upload": ("Upload", "Mbps"),
+    "ping": ("Ping", "ms"),
+    "jitter": ("Jitter", "ms"),
+}
+
+
+class SummaryWindow(Adw.Window):
+    """Shows the statistics engine's summaries of the history.
+
+    The rows are built once; showing new numbers only sets their labels,
+    and the engine's summaries don't depend on how long the history is.
+    """
+    __gtype_name__ = 'SummaryWindow'
+
+    def __init__(self, application, **kwargs):
+        super().__init__(application=application, **kwargs)
+        self.set_title("Summary")
+        self.set_default_size(560, 680)
+
+        self.app = application
+        self.server_ids = [None]
+
+        self.server_row = Adw.ComboRow(title="Server")
+        self.server_row.set_model(Gtk.StringList.new(["All servers"]))
+        self.server_row.connect("notify::selected", lambda row, pspec: self.refresh())
+        server_group = Adw.PreferencesGroup()
+        server_group.add(self.server_row)
+
+        self.status_label = Gtk.Label(label="Calculating…")
+        self.status_label.add_css_class("dim-label")
+
+        content = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=24)
+        content.append(server_group)
+        content.append(self.status_label)
+
+        # rows[(window title, metric)] is the row showing that aggregate
+        self.rows = {}
+        self.groups = []
+        for title, days, hours in WINDOWS:
+            group = Adw.PreferencesGroup(title=title, visible=False)
+            for metric in METRICS:
+                row = Adw.ActionRow(title=METRIC_NAMES[metric][0])
+                row.value_label = Gtk.Label(label="-")
+                row.value_label.add_css_class("heading")
+                row.add_suffix(row.value_label)
+                group.add(row)
+                self.rows[(title, metric)] = row
+            content.append(group)
+            self.groups.append(group)
+
+        clamp = Adw.Clamp(maximum_size=800, margin_top=24, margin_bottom=24,
+                          margin_start=12, margin_end=12)
+        clamp.set_child(content)
+        scrolled = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
+        scrolled.set_child(clamp)
+
+        toolbar = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        toolbar.append(Adw.HeaderBar())
+        toolbar.append(scrolled)
+        self.set_content(toolbar)
+
+        self.handler_id = application.connect("stats-changed", lambda app: self.refresh())
+        self.connect("close-request", self.on_close_request)
+        self.refresh()
+
+    def on_close_request(self, window):
+        self.app.disconnect(self.handler_id)
+        return False
+
+    def update_servers(self, engine):
+        servers = engine.servers()
+        server_ids = [None] + [server_id for server_id, name in servers]
+        if server_ids == self.server_ids:
+            return
+        selected = self.server_ids[self.server_row.get_selected()]
+        self.server_ids = server_ids
+        model = Gtk.StringList.new(["All servers"] + [name for server_id, name in servers])
+        self.server_row.set_model(model)
+        if selected in server_ids:
+            self.server_row.set_selected(server_ids.index(selected))
+
+    def refresh(self):
+        engine = self.app.stats
+        if engine is None:
+            if not self.app.stats_building:
+                self.status_label.set_text("The summary could not be calculated")
+            return
+
+        self.update_servers(engine)
+        server_id = self.server_ids[min(self.server_row.get_selected(),
+                                        len(self.server_ids) - 1)]
+        summary = engine.summary(server_id)
+
+        self.status_label.set_visible(False)
+        for group, (title, days, hours) in zip(self.groups, WINDOWS):
+            group.set_visible(True)
+            for metric in METRICS:
+                row = self.rows[(title, metric)]
+                values = summary[title][metric]
+                unit = METRIC_NAMES[metric][1]
+                if not values["count"]:
+                    row.set_subtitle("No results")
+                    row.value_label.set_text("-")
+                    continue
+                row.value_label.set_text(f"{values['p50']:.1f} {unit}")
+                row.set_subtitle(f"p95 {values['p95']:.1f} · mean {values['mean']:.1f} "
+                                 f"± {values['stddev']:.1f} · "
+                                 f"{values['min']:.1f}–{values['max']:.1f} · "
+                                 f"{values['count']:,} tests")
@@ -0,0 +1,157 @@
+import math
+import struct
+import sys
+import time
+import zlib
+from array import array
+from itertools import accumulate
+
+# Phases recorded, in the order a test runs them. Ping values are latencies
+# in ms, download and upload values speeds in Mbps.
+PHASES = ("ping", "download", "upload")
+
+# A speed counts as ramped up once it reaches this share of the steady state
+RAMP_UP_SHARE = 0.9
+
+# The steady state is taken from samples after this share of the phase
+STEADY_FROM = 0.5
+
+# Progress is reported to four decimals, and stored as integers to match
+PROGRESS_SCALE = 10_000
+
+# Serialised timelines start with a version and a sample count per phase
+VERSION = 1
+HEADER = struct.Struct("<B" + "I" * len(PHASES))
+
+
+class Timeline:
+    """Every progress sample of one run, as columns of arrays per phase.
+
+    Times are seconds since started, a time.monotonic() reading taken when
+    the run began, so they aren't affected by clock changes. Each phase has
+    a times, a values and a progress (0-1) column; appending a sample costs
+    O(1) and 24 bytes.
+    """
+
+    def __init__(self, started=None):
+        self.started = time.monotonic() if started is None else started
+        self.columns = {phase: (array('d'), array('d'), array('d')) for phase in PHASES}
+
+    def __len__(self):
+        return sum(len(times) for times, values, progress in self.columns.values())
+
+    def append(self, phase, value, progress, now=None):
+        times, values, fractions = self.columns[phase]
+        times.append((time.monotonic() if now is None else now) - self.started)
+        values.append(value)
+        fractions.append(progress)
+
+    def samples(self):
+        """Yield (time, phase, value, progress) for every sample in time order.
+
+        The phases run one after the other, so this is the order the gauge
+        showed them in, for replaying a run.
+        """
+        for phase in PHASES:
+            times, values, fractions = self.columns[phase]
+            for sample in zip(times, values, fractions):
+                yield sample[0], phase, sample[1], sample[2]
+
+    def phase_summary(self, phase):
+        """Duration, sample count and steady state of one phase, or None if it has no samples.
+
+        The steady state is the mean and standard deviation of the values
+        from STEADY_FROM of the phase's progress on. For download and upload
+        ramp_up is how long after the phase began the speed first reached
+        RAMP_UP_SHARE of the steady mean.
+        """
+        times, values, fractions = self.columns[phase]
+        if not times:
+            return None
+
+        steady = [value for value, fraction in zip(values, fractions) if fraction >= STEADY_FROM]
+        if not steady:
+            steady = list(values)
+        mean = math.fsum(steady) / len(steady)
+        variance = (math.fsum((value - mean) ** 2 for value in steady) / (len(steady) - 1)
+                    if len(steady) > 1 else 0.0)
+
+        ramp_up = None
+        if phase != "ping":
+            target = mean * RAMP_UP_SHARE
+            for sample_time, value in zip(times, values):
+                if value >= target:
+                    ramp_up = sample_time - times[0]
+                    break
+
+        return {
+            "samples": len(times),
+            "duration": times[-1] - times[0],
+            "ramp_up": ramp_up,
+            "steady_mean": mean,
+            "steady_stddev": math.sqrt(variance),
+        }
+
+    def summary(self):
+        return {phase: self.phase_summary(phase) for phase in PHASES}
+
+    def to_bytes(self):
+        """Serialise for the history, in about 5 bytes per sample.
+
+        Times are stored to the millisecond and progress to the CLI's four
+        decimals, both as differences from the sample before, and values as
+        float32. The little-endian columns are then deflated.
+        """
+        chunks = [HEADER.pack(VERSION, *(len(self.columns[phase][0]) for phase in PHASES))]
+        for phase in PHASES:
+            times, values, fractions = self.columns[phase]
+            chunks.append(delta_column('i', (round(value * 1000) for value in times)))
+            chunks.append(little_endian(array('f', values)))
+            chunks.append(delta_column('H', (round(value * PROGRESS_SCALE) for value in fractions)))
+        return zlib.compress(b"".join(chunks))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """A timeline from to_bytes()'s output. Its times start from started=0."""
+        data = zlib.decompress(data)
+        version, *counts = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ValueError(f"Unknown timeline version {version}")
+
+        timeline = cls(started=0.0)
+        offset = HEADER.size
+        for phase, count in zip(PHASES, counts):
+            times, values, fractions = timeline.columns[phase]
+            deltas, offset = read_column('i', data, offset, count)
+            times.extend(value / 1000 for value in accumulate(deltas))
+            stored, offset = read_column('f', data, offset, count)
+            values.fromlist(stored.tolist())
+            deltas, offset = read_column('H', data, offset, count)
+            fractions.extend((value & 0xffff) / PROGRESS_SCALE for value in accumulate(deltas))
+        return timeline
+
+
+def little_endian(column):
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tobytes()
+
+
+def delta_column(typecode, values):
+    """Differences between consecutive values, which deflate far better"""
+    column = array(typecode)
+    previous = 0
+    for value in values:
+        # Progress differences are stored modulo 2**16 and added back up the same way
+        column.append((value - previous) & 0xffff if typecode == 'H' else value - previous)
+        previous = value
+    return little_endian(column)
+
+
+def read_column(typecode, data, offset, count):
+    column = array(typecode)
+    end = offset + column.itemsize * count
+    column.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column, end
@@ -0,0 +1,67 @@
+import logging
+
+# The main window's visual states. Each state lists the widgets, by their
+# id in window.ui, that are visible in it; every other managed widget is
+# hidden. Widgets that appear in no state are never touched by a state
+# change.
+STATES = {
+    "initial": {"initial_box", "start_button"},
+    "testing": {"gauge_container", "cancel_button"},
+    "results": {"initial_box", "start_button", "results_group", "results_powered_by_label"},
+    "error": {"initial_box", "start_button"},
+}
+
+# The state changes the window expects to make
+TRANSITIONS = {
+    "initial": {"testing"},
+    "testing": {"initial", "results", "error"},
+    "results": {"testing"},
+    "error": {"testing"},
+}
+
+INITIAL_STATE = "initial"
+
+# All widgets any state shows or hides
+WIDGETS = sorted(set().union(*STATES.values()))
+
+log = logging.getLogger(__name__)
+
+
+def visibility_diff(old, new):
+    """Return the widget names to show and to hide when going from old to new"""
+    return sorted(STATES[new] - STATES[old]), sorted(STATES[old] - STATES[new])
+
+
+# Computed once, so a transition only touches the widgets that change
+DIFFS = {(old, new): visibility_diff(old, new) for old in STATES for new in STATES}
+
+
+class ViewStateMachine:
+    """Switches the window between the states in STATES.
+
+    widgets maps every name in WIDGETS to its widget and is looked up once,
+    when the machine is created. The widgets must start out as they are in
+    the initial state, which window.ui takes care of.
+    """
+
+    def __init__(self, widgets, state=INITIAL_STATE):
+        missing = [name for name in WIDGETS if name not in widgets]
+        if missing:
+            raise KeyError(f"No widget for {', '.join(missing)}")
+
+        self.widgets = {name: widgets[name] for name in WIDGETS}
+        self.state = state
+
+    def set_state(self, state):
+        if state == self.state:
+            return
+        if state not in TRANSITIONS[self.state]:
+            # Still switch, so the window can't get stuck in a stale state
+            log.warning("Unexpected view state change from %s to %s", self.state, state)
+
+        show, hide = DIFFS[(self.state, state)]
+        for name in hide:
+            self.widgets[name].set_visible(False)
+        for name in show:
+            self.widgets[name].set_visible(True)
+        self.state = state
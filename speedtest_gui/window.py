@@ -1,19 +1,21 @@
 import gi
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
-from gi.repository import Gtk, Adw, GLib, Gdk, GdkPixbuf, Gio
+from gi.repository import Gtk, Adw, GLib, Gdk
 
-import math
-import os
-import re
-import tempfile
-from .speedtest_runner import SpeedtestRunner
+import time
+# Register the custom widget types used by the template
+from .gauge import SpeedGauge
+from .sparkline import SpeedSparkline
+from . import view_state
 
-# Get the directory of the current file
-current_dir = os.path.dirname(os.path.abspath(__file__))
-ui_path = os.path.join(current_dir, "ui", "window.ui")
+# Surface states in which nothing of the window can be seen
+HIDDEN_STATES = Gdk.ToplevelState.MINIMIZED | getattr(Gdk.ToplevelState, "SUSPENDED", 0)
 
-@Gtk.Template.from_file(ui_path)
+# Progress phases carrying a speed, and the gauge phase each one is shown in
+SPEED_PHASES = {"download_raw": "download", "upload_raw": "upload"}
+
+@Gtk.Template.from_resource("/com/github/speedtest_gui/ui/window.ui")
 class SpeedtestWindow(Adw.ApplicationWindow):
     __gtype_name__ = 'SpeedtestWindow'
     
@@ -22,10 +24,14 @@ class SpeedtestWindow(Adw.ApplicationWindow):
     cancel_button = Gtk.Template.Child()
     progress_bar = Gtk.Template.Child()
     status_label = Gtk.Template.Child()
-    gauge_picture = Gtk.Template.Child()
+    schedule_label = Gtk.Template.Child()
+    initial_box = Gtk.Template.Child()
+    gauge = Gtk.Template.Child()
     speed_value_label = Gtk.Template.Child()
+    mbps_label = Gtk.Template.Child()
     gauge_phase_label = Gtk.Template.Child()
     gauge_container = Gtk.Template.Child()
+    sparkline = Gtk.Template.Child()
     
     download_speed = Gtk.Template.Child()
     upload_speed = Gtk.Template.Child()
@@ -35,16 +41,37 @@ class SpeedtestWindow(Adw.ApplicationWindow):
     isp_label = Gtk.Template.Child()
     server_label = Gtk.Template.Child()
     result_url = Gtk.Template.Child()
+    result_url_row = Gtk.Template.Child()
     
     results_group = Gtk.Template.Child()
+    results_powered_by_label = Gtk.Template.Child()
+    powered_by_label = Gtk.Template.Child()
+    latency_label = Gtk.Template.Child()
+    
+    # While the window can't be seen, progress is delivered this often at most
+    HIDDEN_FLUSH_RATE = 2
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         
-        self.speedtest_runner = SpeedtestRunner()
-        self.speedtest_runner.connect("progress", self.on_progress)
-        self.speedtest_runner.connect("completed", self.on_completed)
-        self.speedtest_runner.connect("error", self.on_error)
+        # The runner is shared through the application so that scheduled
+        # tests outlive the window
+        application = self.get_application()
+        self.app = application
+        self.speedtest_runner = application.runner
+        self.scheduler = application.scheduler
+        self.handler_ids = [
+            (self.speedtest_runner, self.speedtest_runner.connect("started", self.on_started)),
+            (self.speedtest_runner, self.speedtest_runner.connect("progress", self.on_progress)),
+            (self.speedtest_runner, self.speedtest_runner.connect("completed", self.on_completed)),
+            (self.speedtest_runner, self.speedtest_runner.connect("error", self.on_error)),
+            (self.scheduler, self.scheduler.connect("changed", self.on_schedule_changed)),
+            (application, application.connect("busy-changed", self.on_busy_changed)),
+        ]
+        self.connect("close-request", self.on_close_request)
+        
+        # Flush coalesced progress in step with the gauge's frame clock
+        self.speedtest_runner.coalescer.attach(self.gauge)
         
         self.start_button.connect("clicked", self.on_start_clicked)
         self.cancel_button.connect("clicked", self.on_cancel_clicked)
@@ -54,179 +81,124 @@ class SpeedtestWindow(Adw.ApplicationWindow):
         self.max_speed = 100  # Default max speed in Mbps
         self.test_phase = "idle"  # idle, download, upload
         
-        # Initially hide the cancel button, gauge, and results
-        self.cancel_button.set_visible(False)
-        self.results_group.set_visible(False)
-        
-        # Hide the gauge and related elements initially
-        self.gauge_picture.set_visible(False)
-        self.speed_value_label.set_visible(False)
-        self.gauge_phase_label.set_visible(False)
-        
-        # Add "Powered by Ookla Speedtest" label
-        self.add_powered_by_label()
-        
-        # Find the initial UI box more precisely based on the UI structure
-        self.initial_ui_box = self.find_initial_ui_box()
+        # Which widgets are shown is driven by the view state. window.ui
+        # sets up the initial state.
+        self.view = view_state.ViewStateMachine(
+            {name: getattr(self, name) for name in view_state.WIDGETS})
+        
+        # Latency instrumentation, when the application turned it on
+        self.latency = self.speedtest_runner.latency
+        self.after_paint_id = 0
+        self.latency_overlay_id = 0
+        if self.latency is not None:
+            if application.latency_overlay:
+                self.latency_label.set_visible(True)
+                self.update_latency_overlay()
+                self.latency_overlay_id = GLib.timeout_add_seconds(1, self.update_latency_overlay)
+        
+        # While the window is unmapped, minimized or suspended by the
+        # compositor, progress only updates the deferred values and is
+        # delivered at HIDDEN_FLUSH_RATE. Once the window can be seen again,
+        # the latest values are shown in one update.
+        self.hidden = None
+        self.deferred_status = None
+        self.deferred_gauge = None
+        self.surface_state_id = 0
+        self.connect("realize", self.on_realize)
+        self.connect("map", lambda window: self.update_hidden())
+        self.connect("unmap", lambda window: self.update_hidden())
+        self.update_hidden()
+        
+        # Pick up a test that was started while no window was open
+        self.on_schedule_changed(self.scheduler)
+        self.on_busy_changed(application)
+        if self.speedtest_runner.running:
+            self.on_started(self.speedtest_runner)
+            self.status_label.set_text("Test in progress...")
+        
+    def on_close_request(self, window):
+        # Stop listening to the shared runner once the window goes away
+        for source, handler_id in self.handler_ids:
+            source.disconnect(handler_id)
+        self.handler_ids = []
+        # Nobody is listening to progress until another window opens
+        self.speedtest_runner.coalescer.throttle(self.HIDDEN_FLUSH_RATE)
+        self.speedtest_runner.coalescer.detach()
+        if self.surface_state_id:
+            self.get_surface().disconnect(self.surface_state_id)
+            self.surface_state_id = 0
+        if self.after_paint_id:
+            self.get_frame_clock().disconnect(self.after_paint_id)
+            self.after_paint_id = 0
+        if self.latency_overlay_id:
+            GLib.source_remove(self.latency_overlay_id)
+            self.latency_overlay_id = 0
+        return False
+        
+    def on_realize(self, window):
+        self.surface_state_id = self.get_surface().connect(
+            "notify::state", lambda surface, pspec: self.update_hidden())
+        
+        # Events handled before a frame is drawn are on screen once it has been
+        if self.latency is not None:
+            self.after_paint_id = self.get_frame_clock().connect("after-paint",
+                                                                 self.on_after_paint)
+        
+    def update_hidden(self):
+        hidden = not self.get_mapped()
+        surface = self.get_surface()
+        if not hidden and surface is not None:
+            hidden = bool(surface.get_state() & HIDDEN_STATES)
+        if hidden == self.hidden:
+            return
+        
+        self.hidden = hidden
+        self.speedtest_runner.coalescer.throttle(self.HIDDEN_FLUSH_RATE if hidden else None)
+        if not hidden:
+            self.show_deferred()
+        
+    def show_deferred(self):
+        """Show the latest progress that came in while the window was hidden"""
+        if self.deferred_status is not None:
+            self.status_label.set_text(self.deferred_status)
+            self.deferred_status = None
+        if self.deferred_gauge is not None:
+            speed, phase = self.deferred_gauge
+            self.deferred_gauge = None
+            self.update_gauge(speed, phase, animate=False)
+        self.sparkline.queue_draw()
+        
+    def on_after_paint(self, frame_clock):
+        self.latency.painted(time.monotonic())
+        
+    def update_latency_overlay(self):
+        self.latency_label.set_text(self.latency.format())
+        return GLib.SOURCE_CONTINUE
+        
+    def on_schedule_changed(self, scheduler):
+        if not scheduler.enabled or scheduler.next_run is None:
+            self.schedule_label.set_visible(False)
+            return
+        
+        next_run = GLib.DateTime.new_from_unix_local(int(scheduler.next_run))
+        text = f"Next scheduled test at {next_run.format('%H:%M')}"
+        if scheduler.consecutive_errors:
+            text += f" (retrying after {scheduler.consecutive_errors} failed)"
+        if scheduler.missed_runs:
+            text += f" · {scheduler.missed_runs} missed"
+        self.schedule_label.set_text(text)
+        self.schedule_label.set_visible(True)
+        
+    def update_gauge(self, speed, phase, animate=True):
+        if self.hidden:
+            self.deferred_gauge = (speed, phase)
+            return
         
-        # Center the initial UI box vertically
-        if self.initial_ui_box:
-            parent = self.initial_ui_box.get_parent()
-            if parent and isinstance(parent, Gtk.Box):
-                # Add expand property to center vertically
-                self.initial_ui_box.set_vexpand(True)
-                self.initial_ui_box.set_valign(Gtk.Align.CENTER)
-        
-        # Find the Mbps label directly in the UI
-        self.mbps_label = self.find_mbps_label()
-        
-        # Ensure the Mbps label is hidden initially
-        if self.mbps_label:
-            self.mbps_label.set_visible(False)
-        else:
-            print("Warning: Mbps label not found!")
-            
-            # Try to find it in the gauge container
-            if hasattr(self, 'gauge_container'):
-                def find_in_container(widget):
-                    if isinstance(widget, Gtk.Label) and widget.get_text() == "Mbps":
-                        return widget
-                    
-                    if hasattr(widget, 'get_first_child'):
-                        child = widget.get_first_child()
-                        while child:
-                            result = find_in_container(child)
-                            if result:
-                                return result
-                            child = child.get_next_sibling()
-                    elif isinstance(widget, Gtk.Box) or isinstance(widget, Gtk.Grid):
-                        for child in widget:
-                            result = find_in_container(child)
-                            if result:
-                                return result
-                    
-                    return None
-                
-                self.mbps_label = find_in_container(self.gauge_container)
-                if self.mbps_label:
-                    print(f"Mbps label found in gauge container: {self.mbps_label}")
-                    self.mbps_label.set_visible(False)
-        
-        # Hide the progress bar if it exists
-        if hasattr(self, 'progress_bar'):
-            self.progress_bar.set_visible(False)
-        
-    def create_gauge_svg(self, value, max_value, phase):
-        # Fixed max value for the gauge
-        fixed_max = 500  # Always show 0-500 Mbps range
-        
-        # Calculate the angle based on the value (0-270 degrees, leaving a 90-degree opening at the bottom)
-        percentage = min(value / fixed_max, 1.0)
-        max_angle = 270  # Leave a 90-degree opening at the bottom
-        start_angle = 270 - (max_angle / 2)  # Start from the left side
-        end_angle = start_angle + (max_angle * percentage)  # Fill clockwise
-        
-        # Define colors based on phase
-        if phase == "download":
-            gradient_start = "#0066cc"
-            gradient_stop = "#00ccff"
-        elif phase == "upload":
-            gradient_start = "#ff6600"
-            gradient_stop = "#ffcc00"
-        else:
-            gradient_start = "#888888"
-            gradient_stop = "#cccccc"
-        
-        # SVG parameters
-        cx, cy = 150, 150  # Center of the circle
-        r_outer = 100      # Outer radius
-        stroke_width = 20  # Width of the gauge track
-        
-        # Create tick marks at multiples of 50
-        ticks = ""
-        tick_values = [0, 50, 100, 150, 200, 250, 300, 350, 400, 450, 500]
-        tick_inner_length = 5   # Reduced inner length (how far ticks extend inside)
-        tick_outer_length = 15  # Length of ticks extending outside
-        tick_width = 2
-        
-        # Add tick marks and labels
-        for value in tick_values:
-            tick_percentage = value / fixed_max
-            tick_angle = start_angle + (max_angle * tick_percentage)
-            tick_rad = math.radians(tick_angle)
-            
-            # Start point of tick (inside the gauge radius)
-            x1 = cx + (r_outer - tick_inner_length) * math.cos(tick_rad)  # Start inside the gauge
-            y1 = cy + (r_outer - tick_inner_length) * math.sin(tick_rad)
-            
-            # End point of tick (extending outward)
-            x2 = cx + (r_outer + tick_outer_length) * math.cos(tick_rad)
-            y2 = cy + (r_outer + tick_outer_length) * math.sin(tick_rad)
-            
-            # Add the tick line
-            ticks += f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" stroke="#666" stroke-width="{tick_width}" />'
-            
-            # Calculate label position - fixed distance from end of tick mark
-            label_distance = 10  # Distance from end of tick mark to label
-            label_x = x2 + label_distance * math.cos(tick_rad)
-            label_y = y2 + label_distance * math.sin(tick_rad)
-            
-            # Determine text anchor based on position around the circle
-            # Special case for the middle (250) tick
-            if value == 250:
-                text_anchor = "middle"
-                # Move the label a bit further out for better centering
-                label_x = x2 + (label_distance + 5) * math.cos(tick_rad)
-                label_y = y2 + (label_distance + 5) * math.sin(tick_rad)
-            elif 90 <= tick_angle <= 270:  # Left half
-                text_anchor = "end"
-            else:  # Right half
-                text_anchor = "start"
-            
-            # Add the label
-            ticks += f'<text x="{label_x}" y="{label_y}" text-anchor="{text_anchor}" alignment-baseline="middle" font-size="12" fill="#666" font-family="sans-serif">{value}</text>'
-        
-        # Create SVG content - note the order: ticks first, then gauge arcs
-        svg = f'''<?xml version="1.0" encoding="UTF-8" standalone="no"?>
-        <svg width="300" height="300" viewBox="0 0 300 300" xmlns="http://www.w3.org/2000/svg">
-            <defs>
-                <linearGradient id="gauge-gradient" x1="0%" y1="0%" x2="100%" y2="0%">
-                    <stop offset="0%" stop-color="{gradient_start}" />
-                    <stop offset="100%" stop-color="{gradient_stop}" />
-                </linearGradient>
-            </defs>
-            
-            <!-- Tick marks and labels (placed first so they appear behind the gauge) -->
-            {ticks}
-            
-            <!-- Background track (nearly full circle with opening at bottom) -->
-            <path d="M {cx + r_outer * math.cos(math.radians(start_angle))} {cy + r_outer * math.sin(math.radians(start_angle))}
-                   A {r_outer} {r_outer} 0 1 1 {cx + r_outer * math.cos(math.radians(start_angle + max_angle))} {cy + r_outer * math.sin(math.radians(start_angle + max_angle))}"
-                  fill="none" stroke="#e0e0e0" stroke-width="{stroke_width}" stroke-linecap="round" />
-            
-            <!-- Value arc (follows the same path but only to the current percentage) -->
-            <path d="M {cx + r_outer * math.cos(math.radians(start_angle))} {cy + r_outer * math.sin(math.radians(start_angle))}
-                   A {r_outer} {r_outer} 0 {1 if end_angle - start_angle > 180 else 0} 1 {cx + r_outer * math.cos(math.radians(end_angle))} {cy + r_outer * math.sin(math.radians(end_angle))}"
-                  fill="none" stroke="url(#gauge-gradient)" stroke-width="{stroke_width}" stroke-linecap="round" />
-        </svg>'''
-        
-        # Create a temporary file to store the SVG
-        with tempfile.NamedTemporaryFile(suffix='.svg', delete=False) as temp:
-            temp.write(svg.encode('utf-8'))
-            temp_path = temp.name
-        
-        return temp_path
-        
-    def update_gauge(self, speed, phase):
         self.current_speed = speed
         self.test_phase = phase
         
-        # Create SVG gauge (always using fixed max of 500)
-        svg_path = self.create_gauge_svg(speed, 500, phase)
-        
-        # Load the SVG into the GtkPicture
-        file = Gio.File.new_for_path(svg_path)
-        self.gauge_picture.set_file(file)
+        # The arc animates towards the new value and rescales if it doesn't fit
+        self.gauge.set_value(speed, phase, animate)
         
         # Update the speed label
         self.speed_value_label.set_text(f"{speed:.1f}")
@@ -239,158 +211,41 @@ class SpeedtestWindow(Adw.ApplicationWindow):
         else:
             self.gauge_phase_label.set_text("READY")
         
-        # Clean up the temporary file (schedule for deletion after a delay)
-        GLib.timeout_add(1000, lambda path: os.unlink(path) if os.path.exists(path) else None, svg_path)
-        
-    def show_test_ui(self):
-        """Show the UI elements for the test and hide the initial UI"""
-        # Find and hide all initial UI elements by their names or types
-        for widget_name in ['logo_image', 'title_label', 'description_label', 'initial_content_box']:
-            widget = self.find_widget_by_name(widget_name)
-            if widget:
-                widget.set_visible(False)
-        
-        # Show test UI elements
-        self.gauge_picture.set_visible(True)
-        self.speed_value_label.set_visible(True)
-        self.gauge_phase_label.set_visible(True)
-        
-        # Show the Mbps label if we found it
-        if hasattr(self, 'mbps_label') and self.mbps_label:
-            self.mbps_label.set_visible(True)
-    
-    def show_initial_ui(self):
-        """Show the initial UI elements and hide the test UI"""
-        # Find and show all initial UI elements by their names or types
-        for widget_name in ['logo_image', 'title_label', 'description_label', 'initial_content_box']:
-            widget = self.find_widget_by_name(widget_name)
-            if widget:
-                widget.set_visible(True)
-        
-        # Hide test UI elements
-        self.gauge_picture.set_visible(False)
-        self.speed_value_label.set_visible(False)
-        self.gauge_phase_label.set_visible(False)
-        
-        # Hide the Mbps label if we found it
-        if hasattr(self, 'mbps_label') and self.mbps_label:
-            self.mbps_label.set_visible(False)
-    
-    def find_widget_by_name(self, name):
-        """Helper method to find widgets by name in the UI hierarchy"""
-        # Try direct attribute access first
-        if hasattr(self, name):
-            return getattr(self, name)
-        
-        # If not found, search through widget tree
-        def search_in_widget(widget, target_name):
-            # Check if this widget has the right name
-            if hasattr(widget, 'get_name') and widget.get_name() == target_name:
-                return widget
-            
-            # If it's a container, search its children
-            if isinstance(widget, Gtk.Box) or isinstance(widget, Gtk.Grid):
-                for child in widget:
-                    result = search_in_widget(child, target_name)
-                    if result:
-                        return result
-            
-            return None
-        
-        # Start the search from the content area
-        content = self.get_content()
-        if content:
-            return search_in_widget(content, name)
-        
-        return None
+    def on_busy_changed(self, application):
+        # A multi-server test would share the bandwidth with this one
+        multi_running = application.multi_test is not None
+        self.start_button.set_sensitive(not multi_running)
+        self.start_button.set_tooltip_text(
+            "Multi-server tests are running" if multi_running else None)
         
     def on_start_clicked(self, button):
-        self.start_button.set_visible(False)
-        self.cancel_button.set_visible(True)
-        self.results_group.set_visible(False)
-        
-        # Hide initial UI box
-        if self.initial_ui_box:
-            self.initial_ui_box.set_visible(False)
-        else:
-            # Fallback: try to find and hide individual elements
-            content = self.get_content()
-            if content:
-                def hide_initial_elements(widget):
-                    if isinstance(widget, Gtk.Image) and widget.get_icon_name() == "network-wireless-symbolic":
-                        widget.set_visible(False)
-                        return True
-                    
-                    if isinstance(widget, Gtk.Label):
-                        text = widget.get_text()
-                        if text == "Speedtest" or text == "Test your internet connection speed":
-                            widget.set_visible(False)
-                            return True
-                    
-                    if hasattr(widget, 'get_first_child'):
-                        child = widget.get_first_child()
-                        while child:
-                            if hide_initial_elements(child):
-                                child = child.get_next_sibling()
-                            child = child.get_next_sibling()
-                    elif isinstance(widget, Gtk.Box) or isinstance(widget, Gtk.Grid):
-                        for child in widget:
-                            hide_initial_elements(child)
-                    
-                    return False
-                
-                hide_initial_elements(content)
-        
-        # Show gauge elements
-        self.show_gauge_elements()
+        if self.app.busy():
+            return
+        self.speedtest_runner.start_test()
         
+    def on_started(self, runner):
+        self.deferred_status = None
+        self.view.set_state("testing")
         self.status_label.set_text("Initializing...")
         self.update_gauge(0, "idle")
-        
-        self.speedtest_runner.start_test()
+        self.sparkline.clear()
         
     def on_cancel_clicked(self, button):
+        self.deferred_status = None
         self.speedtest_runner.cancel_test()
-        self.cancel_button.set_visible(False)
-        self.start_button.set_visible(True)
+        self.view.set_state("initial")
         self.status_label.set_text("Test cancelled")
         
-        # Hide gauge elements
-        self.hide_gauge_elements()
-        
-        # Show initial UI box
-        if self.initial_ui_box:
-            self.initial_ui_box.set_visible(True)
-        else:
-            # Fallback: try to find and show individual elements
-            content = self.get_content()
-            if content:
-                def show_initial_elements(widget):
-                    if isinstance(widget, Gtk.Image) and widget.get_icon_name() == "network-wireless-symbolic":
-                        widget.set_visible(True)
-                        return True
-                    
-                    if isinstance(widget, Gtk.Label):
-                        text = widget.get_text()
-                        if text == "Speedtest" or text == "Test your internet connection speed":
-                            widget.set_visible(True)
-                            return True
-                    
-                    if hasattr(widget, 'get_first_child'):
-                        child = widget.get_first_child()
-                        while child:
-                            if show_initial_elements(child):
-                                child = child.get_next_sibling()
-                            child = child.get_next_sibling()
-                    elif isinstance(widget, Gtk.Box) or isinstance(widget, Gtk.Grid):
-                        for child in widget:
-                            show_initial_elements(child)
-                    
-                    return False
-                
-                show_initial_elements(content)
-        
     def on_progress(self, runner, phase, progress, status_text):
+        if self.hidden:
+            # Only keep what show_deferred() needs; the sparkline records
+            # the sample so its line is complete when it is drawn again
+            self.deferred_status = status_text
+            if phase in SPEED_PHASES:
+                self.update_gauge(progress, SPEED_PHASES[phase])
+                self.sparkline.add_sample(SPEED_PHASES[phase], progress, draw=False)
+            return
+        
         self.status_label.set_text(status_text)
         
         # Update gauge based on phase
@@ -411,21 +266,15 @@ class SpeedtestWindow(Adw.ApplicationWindow):
                 pass
         elif phase == "download_raw":
             self.update_gauge(progress, "download")
+            self.sparkline.add_sample("download", progress)
         elif phase == "upload_raw":
             self.update_gauge(progress, "upload")
+            self.sparkline.add_sample("upload", progress)
         
     def on_completed(self, runner, results):
-        self.cancel_button.set_visible(False)
-        self.start_button.set_visible(True)
+        self.deferred_status = None
         self.status_label.set_text("Test completed")
         
-        # Hide gauge elements
-        self.hide_gauge_elements()
-        
-        # Show initial UI box
-        if self.initial_ui_box:
-            self.initial_ui_box.set_visible(True)
-        
         # Update results
         self.download_speed.set_text(f"{results['download']:.2f} Mbps")
         self.upload_speed.set_text(f"{results['upload']:.2f} Mbps")
@@ -445,257 +294,9 @@ class SpeedtestWindow(Adw.ApplicationWindow):
             server_info = f"{server_info} ({results['server_location']})"
         self.server_label.set_text(server_info)
         
-        # Find and hide the entire result URL row
-        self.hide_result_url_row()
-        
-        # Make sure the powered by label for results is visible
-        if hasattr(self, 'results_powered_by_label'):
-            self.results_powered_by_label.set_visible(True)
-        
-        self.results_group.set_visible(True)
+        self.view.set_state("results")
         
     def on_error(self, runner, error_message):
-        self.cancel_button.set_visible(False)
-        self.start_button.set_visible(True)
+        self.deferred_status = None
         self.status_label.set_text(f"Error: {error_message}")
-        
-        # Hide gauge elements
-        self.hide_gauge_elements()
-        
-        # Show initial UI box
-        if self.initial_ui_box:
-            self.initial_ui_box.set_visible(True)
-
-    def hide_gauge_elements(self):
-        """Hide all elements related to the gauge display"""
-        self.gauge_picture.set_visible(False)
-        self.speed_value_label.set_visible(False)
-        self.gauge_phase_label.set_visible(False)
-        
-        # Hide the gauge container if available
-        if hasattr(self, 'gauge_container'):
-            # Either hide the whole container
-            self.gauge_container.set_visible(False)
-            
-            # Or iterate through all children to find and hide the Mbps label
-            def hide_mbps_in_container(widget):
-                if isinstance(widget, Gtk.Label) and widget.get_text() == "Mbps":
-                    widget.set_visible(False)
-                    return True
-                
-                if hasattr(widget, 'get_first_child'):
-                    child = widget.get_first_child()
-                    while child:
-                        if hide_mbps_in_container(child):
-                            return True
-                        child = child.get_next_sibling()
-                elif isinstance(widget, Gtk.Box) or isinstance(widget, Gtk.Grid):
-                    for child in widget:
-                        if hide_mbps_in_container(child):
-                            return True
-                
-                return False
-            
-            hide_mbps_in_container(self.gauge_container)
-        
-        # Also try the direct approach if we found the label
-        if self.mbps_label:
-            self.mbps_label.set_visible(False)
-
-    def show_gauge_elements(self):
-        """Show all elements related to the gauge display"""
-        self.gauge_picture.set_visible(True)
-        self.speed_value_label.set_visible(True)
-        self.gauge_phase_label.set_visible(True)
-        
-        # Show the gauge container if available
-        if hasattr(self, 'gauge_container'):
-            self.gauge_container.set_visible(True)
-        
-        # Also show the Mbps label if we found it
-        if self.mbps_label:
-            self.mbps_label.set_visible(True)
-
-    def find_initial_ui_box(self):
-        """Find the box containing the initial UI elements (logo, title, description)"""
-        content = self.get_content()
-        if not content:
-            return None
-        
-        # Find the initial UI box more precisely based on the UI structure
-        def find_box(widget):
-            # If this is a box with vertical orientation
-            if isinstance(widget, Gtk.Box) and widget.get_orientation() == Gtk.Orientation.VERTICAL:
-                # Check if it has the expected children (image and labels)
-                has_image = False
-                has_title_label = False
-                has_subtitle_label = False
-                
-                for child in widget:
-                    if isinstance(child, Gtk.Image):
-                        has_image = True
-                    elif isinstance(child, Gtk.Label):
-                        text = child.get_text()
-                        if text == "Speedtest":
-                            has_title_label = True
-                        elif text == "Test your internet connection speed":
-                            has_subtitle_label = True
-                
-                # If we found all expected elements, this is our target
-                if has_image and has_title_label and has_subtitle_label:
-                    return widget
-            
-            # If not found at this level, search children
-            if hasattr(widget, 'get_first_child'):
-                child = widget.get_first_child()
-                while child:
-                    result = find_box(child)
-                    if result:
-                        return result
-                    child = child.get_next_sibling()
-            elif isinstance(widget, Gtk.Box) or isinstance(widget, Gtk.Grid):
-                for child in widget:
-                    result = find_box(child)
-                    if result:
-                        return result
-            
-            return None
-        
-        return find_box(content)
-
-    def find_mbps_label(self):
-        """Find the Mbps label in the UI"""
-        content = self.get_content()
-        if not content:
-            return None
-        
-        def find_label(widget):
-            # Check if this is a label with "Mbps" text
-            if isinstance(widget, Gtk.Label) and widget.get_text() == "Mbps":
-                return widget
-            
-            # Search in children
-            if hasattr(widget, 'get_first_child'):
-                child = widget.get_first_child()
-                while child:
-                    result = find_label(child)
-                    if result:
-                        return result
-                    child = child.get_next_sibling()
-            elif isinstance(widget, Gtk.Box) or isinstance(widget, Gtk.Grid):
-                for child in widget:
-                    result = find_label(child)
-                    if result:
-                        return result
-            
-            return None
-        
-        # First try to find it in the gauge container
-        if hasattr(self, 'gauge_container'):
-            label = find_label(self.gauge_container)
-            if label:
-                return label
-        
-        # If not found in gauge container, search the entire content
-        return find_label(content)
-
-    def hide_result_url_row(self):
-        """Find and hide the entire ActionRow containing the result URL"""
-        # First try to find the parent of the result_url widget
-        parent = self.result_url.get_parent()
-        while parent and not isinstance(parent, Gtk.ListBoxRow) and not isinstance(parent, Adw.ActionRow):
-            parent = parent.get_parent()
-        
-        if parent:
-            parent.set_visible(False)
-        else:
-            # Fallback: just hide the URL widget itself
-            self.result_url.set_visible(False)
-            
-            # Also try to find the row by iterating through the results_group
-            if hasattr(self.results_group, 'get_first_child'):
-                child = self.results_group.get_first_child()
-                while child:
-                    if isinstance(child, Adw.ActionRow) and child.get_title() == "Result URL":
-                        child.set_visible(False)
-                        break
-                    child = child.get_next_sibling()
-
-    def add_powered_by_label(self):
-        """Add 'Powered by Ookla Speedtest' label to both initial screen and results page"""
-        # Create the label for the initial screen
-        self.powered_by_label = Gtk.Label()
-        self.powered_by_label.set_text("Powered by Ookla Speedtest")
-        self.powered_by_label.add_css_class("caption")  # Make it smaller
-        self.powered_by_label.set_opacity(0.7)  # Make it slightly transparent
-        self.powered_by_label.set_margin_top(12)
-        self.powered_by_label.set_margin_bottom(12)
-        self.powered_by_label.set_halign(Gtk.Align.CENTER)
-        
-        # Find the container for the initial screen
-        content = self.get_content()
-        if content:
-            # Find the main vertical box that contains everything
-            main_box = None
-            if hasattr(content, 'get_first_child'):
-                child = content.get_first_child()
-                while child:
-                    if isinstance(child, Gtk.Box) and child.get_orientation() == Gtk.Orientation.VERTICAL:
-                        main_box = child
-                        break
-                    child = child.get_next_sibling()
-            
-            if main_box:
-                # Find the AdwClamp which contains the main content
-                clamp = None
-                if hasattr(main_box, 'get_first_child'):
-                    child = main_box.get_first_child()
-                    while child:
-                        if isinstance(child, Adw.Clamp):
-                            clamp = child
-                            break
-                        elif isinstance(child, Gtk.ScrolledWindow):
-                            # The clamp might be inside a ScrolledWindow
-                            if hasattr(child, 'get_child'):
-                                if isinstance(child.get_child(), Adw.Clamp):
-                                    clamp = child.get_child()
-                                    break
-                        child = child.get_next_sibling()
-                
-                if clamp:
-                    # Get the main content box inside the clamp
-                    content_box = None
-                    if hasattr(clamp, 'get_child'):
-                        content_box = clamp.get_child()
-                    
-                    if content_box and isinstance(content_box, Gtk.Box):
-                        # Add the powered by label at the end of the content box
-                        content_box.append(self.powered_by_label)
-        
-        # Create a similar label for the results group
-        self.results_powered_by_label = Gtk.Label()
-        self.results_powered_by_label.set_text("Powered by Ookla Speedtest")
-        self.results_powered_by_label.add_css_class("caption")
-        self.results_powered_by_label.set_opacity(0.7)
-        self.results_powered_by_label.set_halign(Gtk.Align.CENTER)
-        self.results_powered_by_label.set_margin_top(12)
-        
-        # Add the label to the results group
-        if hasattr(self.results_group, 'add_suffix_widget'):
-            # For newer versions of libadwaita
-            self.results_group.add_suffix_widget(self.results_powered_by_label)
-        else:
-            # For older versions, we need to find the parent of the results group
-            parent = self.results_group.get_parent()
-            if parent and isinstance(parent, Gtk.Box):
-                # Create a container for the powered by label
-                label_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-                label_box.append(self.results_powered_by_label)
-                # Insert after the results group
-                index = -1
-                for i, child in enumerate(parent):
-                    if child == self.results_group:
-                        index = i
-                        break
-                if index >= 0:
-                    parent.insert_child_after(label_box, self.results_group)
\ No newline at end of file
+        self.view.set_state("error")
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Compile gresource.xml into speedtest_gui/resources.gresource.
+
+Uses glib-compile-resources when it is installed. Otherwise the bundle is
+written by a small pure Python implementation of the GVDB file format, so
+the UI can be rebuilt on machines without the GLib development tools. The
+result has the same entries, hashes and layout as glib-compile-resources
+output; only entries that share a hash bucket may be stored in a
+different order, which lookups don't depend on.
+
+    python3 tools/compile_resources.py [--python]
+"""
+
+import argparse
+import os
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MANIFEST = os.path.join(ROOT, "gresource.xml")
+SOURCE_DIR = os.path.join(ROOT, "speedtest_gui")
+TARGET = os.path.join(SOURCE_DIR, "resources.gresource")
+
+
+def read_manifest(manifest=MANIFEST, source_dir=SOURCE_DIR):
+    """Return {resource path: file contents} for every file in the manifest"""
+    files = {}
+    for gresource in ET.parse(manifest).getroot().iter("gresource"):
+        prefix = gresource.get("prefix", "/").rstrip("/") + "/"
+        for element in gresource.iter("file"):
+            name = element.text.strip()
+            with open(os.path.join(source_dir, name), "rb") as f:
+                data = f.read()
+            preprocess = element.get("preprocess")
+            if preprocess == "xml-stripblanks":
+                data = strip_blanks(data)
+            elif preprocess:
+                raise SystemExit(f"Unsupported preprocess option: {preprocess}")
+            files[prefix + element.get("alias", name)] = data
+    return files
+
+
+def strip_blanks(data):
+    """Drop whitespace-only text between tags, like xmllint --noblanks"""
+    declaration, _, body = data.partition(b"?>")
+    if not body:
+        declaration, body = b"", data
+    else:
+        declaration += b"?>\n"
+    return declaration + re.sub(rb">\s+<", b"><", body.strip()) + b"\n"
+
+
+# GVDB, the on-disk format of GResource bundles
+
+def djb_hash(key):
+    hash_value = 5381
+    for byte in key:
+        if byte >= 128:
+            byte -= 256  # GVDB hashes signed chars
+        hash_value = (hash_value * 33 + byte) & 0xffffffff
+    return hash_value
+
+
+class Item:
+    def __init__(self, key):
+        self.key = key
+        self.parent = None
+        self.children = []
+        self.value = None
+        self.index = None
+
+
+def resource_value(data):
+    """Serialize a file as the GVariant "v" holding "(uuay)": size, flags, data.
+
+    The data is stored with a trailing nul byte that the size excludes, as
+    glib-compile-resources does.
+    """
+    return struct.pack("<II", len(data), 0) + data + b"\0" + b"\0(uuay)"
+
+
+def build_items(files):
+    """Create an item for every file and each of its parent directories"""
+    items = {}
+
+    def parent_of(key):
+        if key == b"/":
+            return None
+        directory = key[:key.rstrip(b"/").rfind(b"/") + 1]
+        parent = items.get(directory)
+        if parent is None:
+            parent = items[directory] = Item(directory)
+            grandparent = parent_of(directory)
+            if grandparent is not None:
+                set_parent(parent, grandparent)
+        return parent
+
+    def set_parent(item, parent):
+        item.parent = parent
+        parent.children.append(item)
+        parent.children.sort(key=lambda child: child.key)
+
+    for path, data in files.items():
+        key = path.encode()
+        item = items[key] = Item(key)
+        set_parent(item, parent_of(key))
+        item.value = resource_value(data)
+    return list(items.values())
+
+
+class FileBuilder:
+    def __init__(self):
+        self.offset = 24  # After the file header
+        self.chunks = []
+
+    def allocate(self, alignment, data):
+        self.offset += -self.offset & (alignment - 1)
+        start = self.offset
+        self.chunks.append((start, data))
+        self.offset += len(data)
+        return start, self.offset
+
+    def write(self, root):
+        output = bytearray(self.offset)
+        output[:24] = b"GVariant" + struct.pack("<IIII", 0, 0, *root)
+        for start, data in self.chunks:
+            output[start:start + len(data)] = data
+        return bytes(output)
+
+
+def build_gvdb(files):
+    items = build_items(files)
+    n_buckets = len(items)
+    buckets = [[] for _ in range(n_buckets)]
+    for item in items:
+        buckets[djb_hash(item.key) % n_buckets].insert(0, item)
+
+    ordered = [item for bucket in buckets for item in bucket]
+    for index, item in enumerate(ordered):
+        item.index = index
+
+    # The table's header, bucket starts and items are filled in once the
+    # keys and values they point to have been placed after them
+    builder = FileBuilder()
+    table_size = 8 + 4 * n_buckets + 24 * len(ordered)
+    table = bytearray(table_size)
+    root = builder.allocate(4, table)
+    struct.pack_into("<II", table, 0, 5 << 27, n_buckets)
+
+    start = 0
+    for bucket_index, bucket in enumerate(buckets):
+        struct.pack_into("<I", table, 8 + 4 * bucket_index, start)
+        start += len(bucket)
+
+    items_offset = 8 + 4 * n_buckets
+    for item in ordered:
+        key = item.key[len(item.parent.key):] if item.parent else item.key
+        key_start, _ = builder.allocate(1, key)
+        if item.value is not None:
+            value, kind = builder.allocate(8, item.value), b"v"
+        else:
+            children = struct.pack(f"<{len(item.children)}I",
+                                   *(child.index for child in item.children))
+            value, kind = builder.allocate(4, children), b"L"
+        struct.pack_into("<IIIHccII", table, items_offset + 24 * item.index,
+                         djb_hash(item.key),
+                         item.parent.index if item.parent else 0xffffffff,
+                         key_start, len(key), kind, b"\0", *value)
+
+    return builder.write(root)
+
+
+def compile_with_glib(output):
+    subprocess.run(["glib-compile-resources", f"--sourcedir={SOURCE_DIR}",
+                    f"--target={output}", MANIFEST], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--python", action="store_true",
+                        help="Don't use glib-compile-resources even if it is installed")
+    args = parser.parse_args()
+
+    if not args.python and shutil.which("glib-compile-resources"):
+        compile_with_glib(TARGET)
+    else:
+        with open(TARGET, "wb") as f:
+            f.write(build_gvdb(read_manifest()))
+    print(f"Wrote {os.path.relpath(TARGET)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""A stand-in for the Speedtest CLI that replays a recorded session.
+
+Writes the NDJSON lines of a session from benchmarks/sessions to stdout,
+paced like the recording, so tests and benchmarks can run the application
+against a deterministic CLI without a network. It takes the same
+arguments as the real CLI, which it ignores, and can be made to misbehave:
+stall, write malformed lines or exit with an error.
+
+Point the application at it with the SPEEDTEST_BINARY environment variable
+or the headless --binary option. As the application passes the real CLI's
+arguments, every option below can also be set with an environment
+variable, FAKE_SPEEDTEST_ followed by the option name in upper case:
+
+    SPEEDTEST_BINARY=tools/fake_speedtest.py FAKE_SPEEDTEST_SPEED=10 \\
+        python3 -m speedtest_gui --headless
+
+    python3 tools/fake_speedtest.py --session dsl --firehose --repeat 100
+"""
+
+import argparse
+import datetime
+import json
+import os
+import signal
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+SESSIONS_DIR = os.path.join(ROOT, "benchmarks", "sessions")
+ENV_PREFIX = "FAKE_SPEEDTEST_"
+VERSION = "Speedtest by Ookla 1.2.0.84 (replay)"
+
+# A line that cuts off partway through an object, as a crashed CLI leaves
+MALFORMED_LINE = '{"type":"download","download":{"bandwidth":'
+
+HELP = f"""{VERSION}
+
+Usage: speedtest [<options>]
+  -h, --help                        Print usage information
+  -V, --version                     Print version number
+  -L, --servers                     List nearest servers
+  -s, --server-id=#                 Specify a server from the server list using its id
+  -f, --format=ARG                  Output format (default=human-readable)
+  -p, --progress=yes|no             Enable or disable progress bar
+      --accept-license              Accept license for the current server
+      --accept-gdpr                 Accept Ookla's GDPR terms
+
+Replays a recorded session instead of testing. Run
+tools/fake_speedtest.py --replay-help for the replay options.
+"""
+
+
+def option(name, default, convert=str):
+    """The default of an option, taken from its environment variable if set"""
+    value = os.environ.get(ENV_PREFIX + name.upper().replace("-", "_"))
+    if value is None or value == "":
+        return default
+    try:
+        return convert(value)
+    except ValueError:
+        raise SystemExit(f"Invalid {ENV_PREFIX}{name.upper().replace('-', '_')}: {value}")
+
+
+def flag(value):
+    return value.lower() in ("1", "yes", "true", "on")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="fake_speedtest.py", add_help=False,
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument("--replay-help", action="help",
+                        help="Show the replay options and exit")
+    parser.add_argument("-h", "--help", action="store_true", dest="cli_help")
+    parser.add_argument("-V", "--version", action="store_true")
+    parser.add_argument("-L", "--servers", action="store_true")
+    parser.add_argument("--session", default=option("session", "gigabit"),
+                        help="Name of a session in benchmarks/sessions or the path of an "
+                             "NDJSON file (default: gigabit)")
+    parser.add_argument("--speed", type=float, default=option("speed", 1.0, float),
+                        help="Replay this many times faster than recorded (default: 1)")
+    parser.add_argument("--rate", type=float, default=option("rate", 0.0, float),
+                        help="Write this many lines per second instead of following the "
+                             "recorded timing")
+    parser.add_argument("--firehose", action="store_true", default=option("firehose", False, flag),
+                        help="Write lines as fast as the reader takes them")
+    parser.add_argument("--repeat", type=int, default=option("repeat", 1, int),
+                        help="Write every download and upload line this many times, "
+                             "to produce thousands of events (default: 1)")
+    parser.add_argument("--stall-after", type=int, default=option("stall-after", 0, int),
+                        help="Stop writing after this many lines")
+    parser.add_argument("--stall", type=float, default=option("stall", 0.0, float),
+                        help="Seconds to stall for before going on, 0 to hang until killed "
+                             "(default: 0)")
+    parser.add_argument("--ignore-term", action="store_true",
+                        default=option("ignore-term", False, flag),
+                        help="Ignore SIGTERM, so only SIGKILL ends the process")
+    parser.add_argument("--malformed-every", type=int, default=option("malformed-every", 0, int),
+                        help="Write a truncated JSON line after every N lines")
+    parser.add_argument("--exit-code", type=int, default=option("exit-code", None, int),
+                        help="Exit status (default: 0, or 2 if the session has no result)")
+    # The real CLI's arguments, accepted and ignored
+    parser.add_argument("-s", "--server-id")
+    parser.add_argument("-f", "--format")
+    parser.add_argument("-p", "--progress")
+    parser.add_argument("--accept-license", action="store_true")
+    parser.add_argument("--accept-gdpr", action="store_true")
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+
+def session_path(session):
+    if os.sep in session or session.endswith(".ndjson"):
+        return session
+    return os.path.join(SESSIONS_DIR, f"{session}.ndjson")
+
+
+def read_session(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [line.rstrip("\n") for line in f if line.strip()]
+    except OSError as e:
+        raise SystemExit(f"Cannot read session {path}: {e.strerror}")
+
+
+def parse_timestamp(value):
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def schedule(lines):
+    """Seconds from the start of the session at which each line was written.
+
+    Timestamps only have second resolution, so download and upload lines
+    are placed by the elapsed time they report since their phase started,
+    and other lines that share a second are spread evenly across it.
+    """
+    events = []
+    for line in lines:
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            events.append({})
+
+    stamps = []
+    for event in events:
+        try:
+            stamps.append(parse_timestamp(event["timestamp"]))
+        except (KeyError, TypeError, ValueError):
+            stamps.append(stamps[-1] if stamps else 0.0)
+    start = stamps[0] if stamps else 0.0
+
+    times = []
+    phase, phase_start = None, 0.0
+    index = 0
+    while index < len(events):
+        event = events[index]
+        kind = event.get("type")
+        if kind in ("download", "upload") and isinstance(event.get(kind), dict):
+            if kind != phase:
+                phase, phase_start = kind, stamps[index] - start
+            times.append(phase_start + event[kind].get("elapsed", 0) / 1000)
+            index += 1
+            continue
+
+        # A run of lines in the same second
+        end = index
+        while (end < len(events) and stamps[end] == stamps[index]
+               and events[end].get("type") not in ("download", "upload")):
+            end += 1
+        count = end - index
+        for offset in range(count):
+            times.append(stamps[index] - start + offset / count)
+        index = end
+
+    # Never go back in time, whatever the recording says
+    for index in range(1, len(times)):
+        times[index] = max(times[index], times[index - 1])
+    return times
+
+
+def has_result(lines):
+    return any('"type":"result"' in line.replace(" ", "") for line in lines)
+
+
+def list_servers(lines):
+    """Print a server list holding the session's server"""
+    servers = []
+    for line in lines:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        server = event.get("server")
+        if isinstance(server, dict) and not any(s["id"] == server.get("id") for s in servers):
+            servers.append({key: server[key] for key in
+                            ("id", "host", "port", "name", "location", "country") if key in server})
+    print(json.dumps({"type": "serverList", "servers": servers}, separators=(",", ":")))
+
+
+def stall(seconds):
+    if seconds > 0:
+        time.sleep(seconds)
+        return
+    while True:
+        time.sleep(3600)
+
+
+def replay(lines, args):
+    times = schedule(lines)
+    speed = args.speed if args.speed > 0 else 1.0
+    out = sys.stdout
+    written = 0
+    stalled = False
+    start = time.monotonic()
+    # Time that isn't part of the recording, such as a stall
+    skew = 0.0
+
+    for line, at in zip(lines, times):
+        copies = args.repeat if '"type":"download"' in line or '"type":"upload"' in line else 1
+        for _ in range(max(1, copies)):
+            if not args.firehose:
+                due = written / args.rate if args.rate > 0 else at / speed
+                delay = due - (time.monotonic() - start - skew)
+                if delay > 0:
+                    time.sleep(delay)
+
+            out.write(line + "\n")
+            written += 1
+            if args.malformed_every and written % args.malformed_every == 0:
+                out.write(MALFORMED_LINE + "\n")
+            if not args.firehose:
+                out.flush()
+
+            if args.stall_after and written == args.stall_after and not stalled:
+                stalled = True
+                out.flush()
+                stalled_at = time.monotonic()
+                stall(args.stall)
+                skew += time.monotonic() - stalled_at
+    out.flush()
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.cli_help:
+        sys.stdout.write(HELP)
+        return 0
+    if args.version:
+        print(VERSION)
+        return 0
+
+    lines = read_session(session_path(args.session))
+    if args.servers:
+        list_servers(lines)
+        return 0
+
+    if args.ignore_term:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    try:
+        replay(lines, args)
+    except BrokenPipeError:
+        # The reader went away, as it does when a test is cancelled. Point
+        # stdout at /dev/null so the flush at exit doesn't fail again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+
+    if args.exit_code is not None:
+        return args.exit_code
+    return 0 if has_result(lines) else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))